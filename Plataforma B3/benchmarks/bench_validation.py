@@ -0,0 +1,131 @@
+"""Micro-benchmark da reconstrução de fluxos a partir dos documentos do MongoDB.
+
+Compara, para fluxos de tamanhos diferentes, três formas de montar o Flow lido do banco:
+- per_step: a construção anterior, que cria cada FlowStep em Python antes do Flow;
+- document: flow_from_document, que valida o documento inteiro em uma chamada ao
+  núcleo compilado do Pydantic v2;
+- construct: model_construct, sem validação (no Pydantic v2 roda em Python e não
+  compensa; fica como referência).
+Também mede model_dump, usado na serialização dos fluxos pela API. Não acessa o
+MongoDB nem o modelo.
+
+Uso:
+    python bench_validation.py
+    python bench_validation.py --steps 1 10 50 --number 2000
+"""
+import argparse
+import os
+import sys
+import timeit
+from typing import Any, Dict, List
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+# Configurações mínimas para importar os módulos da aplicação sem um .env
+def configure_environment():
+    for name, value in {
+        "UFPB_OPENAI_API_KEY": "benchmark",
+        "UFPB_OPENAI_API_BASE": "http://127.0.0.1/",
+        "UFPB_LLM_DEPLOYMENT_NAME_4O": "benchmark",
+        "UFPB_OPENAI_API_VERSION": "2024-02-01"
+    }.items():
+        os.environ.setdefault(name, value)
+    sys.path.insert(0, os.path.abspath(SRC_DIR))
+
+# Documento de um fluxo com steps passos, no formato gravado por flow_to_document
+def flow_document(steps: int) -> Dict[str, Any]:
+    from flow_manager import Flow, FlowStep, flow_to_document
+
+    flow = Flow(
+        name="Fluxo de benchmark",
+        description="Fluxo usado no micro-benchmark de validação",
+        steps=[
+            FlowStep(
+                step_name=f"passo_{order}",
+                system_prompt="Analise o texto e responda de forma objetiva. " * 20,
+                step_order=order,
+                temperature=0,
+                depends_on=["user_message"] if order == 1 else [f"passo_{order - 1}"]
+            )
+            for order in range(1, steps + 1)
+        ]
+    )
+    document = flow_to_document(flow)
+    document.update({"_id": "fluxo_benchmark", "created_at": document["updated_at"], "version": 1})
+    return document
+
+# Tempo médio (µs) de uma chamada, no melhor de repeat rodadas
+def measure(function, number: int, repeat: int) -> float:
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number * 1_000_000
+
+# Construção anterior a flow_from_document: um FlowStep por passo, validado em Python
+def per_step_flow(document: Dict[str, Any]):
+    from flow_manager import Flow, FlowStep
+
+    return Flow(
+        name=document["name"],
+        description=document["description"],
+        steps=[FlowStep(**step) for step in document["steps"]],
+        is_active=document["is_active"],
+        flow_id=document["_id"],
+        version=document["version"]
+    )
+
+# Construção sem validação, com model_construct em cada passo
+def constructed_flow(document: Dict[str, Any]):
+    from flow_manager import Flow, FlowStep
+
+    return Flow.model_construct(
+        name=document["name"],
+        description=document["description"],
+        steps=[FlowStep.model_construct(**step) for step in document["steps"]],
+        is_active=document["is_active"],
+        flow_id=document["_id"],
+        version=document["version"]
+    )
+
+def run(steps_options: List[int], number: int, repeat: int) -> List[Dict[str, Any]]:
+    from flow_manager import flow_from_document
+
+    results = []
+    for steps in steps_options:
+        document = flow_document(steps)
+        flow = flow_from_document(document)
+        # As três formas devem produzir o mesmo fluxo
+        assert per_step_flow(document).model_dump() == flow.model_dump()
+        assert constructed_flow(document).model_dump() == flow.model_dump()
+
+        per_step = measure(lambda: per_step_flow(document), number, repeat)
+        validated = measure(lambda: flow_from_document(document), number, repeat)
+        constructed = measure(lambda: constructed_flow(document), number, repeat)
+        dump = measure(flow.model_dump, number, repeat)
+        results.append({
+            "steps": steps,
+            "per_step_us": round(per_step, 2),
+            "document_us": round(validated, 2),
+            "construct_us": round(constructed, 2),
+            "speedup": round(per_step / validated, 2),
+            "model_dump_us": round(dump, 2)
+        })
+    return results
+
+def print_report(results: List[Dict[str, Any]]):
+    columns = ("per_step_us", "document_us", "construct_us", "speedup", "model_dump_us")
+    header = f"{'passos':<8}" + "".join(f"{column:>15}" for column in columns)
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        print(f"{result['steps']:<8}" + "".join(f"{result[column]:>15}" for column in columns))
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark da validação de fluxos")
+    parser.add_argument("--steps", type=int, nargs="+", default=[1, 5, 20, 50], help="Número de passos dos fluxos medidos")
+    parser.add_argument("--number", type=int, default=1000, help="Chamadas por rodada")
+    parser.add_argument("--repeat", type=int, default=5, help="Rodadas; vale a mais rápida")
+    args = parser.parse_args()
+
+    configure_environment()
+    print_report(run(args.steps, args.number, args.repeat))
+
+if __name__ == "__main__":
+    main()
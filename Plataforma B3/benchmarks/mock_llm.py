@@ -0,0 +1,154 @@
+"""Servidor local que imita o endpoint de chat completions do Azure OpenAI.
+
+Usado pelos benchmarks para medir a aplicação sem rede nem custo de tokens.
+Latência, taxa de geração de tokens, taxa de erros 5xx e respostas 429 são configuráveis.
+
+Uso isolado (ex.: para uma API iniciada separadamente):
+    python mock_llm.py --port 8765 --latency 0.2 --token-rate 50 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import json
+import random
+from typing import Any, Dict, Optional
+
+from aiohttp import web
+
+# Caminho do endpoint no formato usado por config.Settings.MODEL_URL
+COMPLETIONS_PATH = "/openai/deployments/{deployment}/chat/completions"
+
+class MockLLMServer:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        latency: float = 0.05,
+        token_rate: float = 0.0,
+        completion_tokens: int = 20,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: float = 0.1,
+        seed: Optional[int] = None
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency  # Espera (s) antes do primeiro token
+        self.token_rate = token_rate  # Tokens gerados por segundo (0 responde de uma vez)
+        self.completion_tokens = completion_tokens  # Tokens por resposta (limitados por max_tokens)
+        self.error_rate = error_rate  # Fração das requisições respondidas com 500
+        self.rate_limit_rate = rate_limit_rate  # Fração das requisições respondidas com 429
+        self.retry_after = retry_after  # Valor (s) do cabeçalho retry-after das respostas 429
+        self._random = random.Random(seed)
+        self._runner: Optional[web.AppRunner] = None
+
+        # Contadores para conferir o que a aplicação enviou
+        self.stats: Dict[str, int] = {"requests": 0, "errors": 0, "rate_limited": 0, "in_flight": 0, "max_in_flight": 0}
+
+    @property
+    def base_url(self) -> str:
+        # Formato de UFPB_OPENAI_API_BASE (com barra no final)
+        return f"http://{self.host}:{self.port}/"
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post(COMPLETIONS_PATH, self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _usage(self, body: Dict[str, Any], completion_tokens: int) -> Dict[str, int]:
+        prompt_chars = sum(len(message.get("content") or "") for message in body.get("messages", []))
+        prompt_tokens = max(1, prompt_chars // 4)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        self.stats["requests"] += 1
+        self.stats["in_flight"] += 1
+        self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+        try:
+            body = await request.json()
+
+            draw = self._random.random()
+            if draw < self.rate_limit_rate:
+                self.stats["rate_limited"] += 1
+                return web.json_response(
+                    {"error": {"code": "429", "message": "Rate limit exceeded"}},
+                    status=429,
+                    headers={"retry-after-ms": str(int(self.retry_after * 1000))}
+                )
+            if draw < self.rate_limit_rate + self.error_rate:
+                self.stats["errors"] += 1
+                await asyncio.sleep(self.latency)
+                return web.json_response({"error": {"message": "Internal server error"}}, status=500)
+
+            await asyncio.sleep(self.latency)
+            completion_tokens = min(self.completion_tokens, int(body.get("max_tokens") or self.completion_tokens))
+            tokens = [f"tok{i} " for i in range(completion_tokens)]
+            token_delay = 1 / self.token_rate if self.token_rate > 0 else 0.0
+
+            if body.get("stream"):
+                response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+                await response.prepare(request)
+                for token in tokens:
+                    if token_delay:
+                        await asyncio.sleep(token_delay)
+                    chunk = {"choices": [{"index": 0, "delta": {"content": token}}]}
+                    await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                await response.write(b"data: [DONE]\n\n")
+                return response
+
+            if token_delay:
+                await asyncio.sleep(token_delay * completion_tokens)
+            return web.json_response({
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+                "usage": self._usage(body, completion_tokens)
+            })
+        finally:
+            self.stats["in_flight"] -= 1
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local de chat completions para benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05, help="Espera (s) antes do primeiro token")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="Tokens por segundo (0 responde de uma vez)")
+    parser.add_argument("--completion-tokens", type=int, default=20, help="Tokens por resposta")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fração de respostas 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fração de respostas 429")
+    parser.add_argument("--retry-after", type=float, default=0.1, help="retry-after (s) das respostas 429")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = MockLLMServer(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        token_rate=args.token_rate,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        seed=args.seed
+    )
+
+    async def serve():
+        await server.start()
+        print(f"Mock do modelo em {server.base_url}")
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,428 @@
+"""Benchmarks da API executados inteiramente offline.
+
+A aplicação FastAPI roda no próprio processo (httpx + ASGI), as chamadas ao modelo
+vão para o servidor simulado de mock_llm.py e o MongoDB é simulado com mongomock
+(ou um mongod local, com --mongo-url). Cada cenário reporta vazão, latências
+p50/p95/p99 e memória; com --baseline, regressões fazem o script terminar com erro.
+
+Uso:
+    python run_benchmarks.py
+    python run_benchmarks.py --scenarios exec_flow stream --requests 500 --concurrency 50
+    python run_benchmarks.py --mongo-url mongodb://localhost:27017
+    python run_benchmarks.py --output atual.json --baseline base.json --tolerance 0.2
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import math
+import os
+import platform
+import resource
+import socket
+import sys
+import time
+import tracemalloc
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from mock_llm import MockLLMServer
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+SCENARIOS = ("crud", "exec_flow", "batch", "stream")
+
+# Resultado das medições de uma operação
+class OperationResult:
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.ttfb: List[float] = []  # Tempo até o primeiro token (streaming)
+        self.errors = 0
+        self.items = 0  # Itens processados (entradas de batch); igual a requisições nos demais cenários
+        self.elapsed = 0.0
+        self.memory: Dict[str, float] = {}
+
+    def summary(self) -> Dict[str, Any]:
+        completed = len(self.latencies)
+        summary = {
+            "requests": completed + self.errors,
+            "errors": self.errors,
+            "elapsed_s": round(self.elapsed, 4),
+            "throughput_rps": round(completed / self.elapsed, 2) if self.elapsed else 0.0,
+            "items_per_s": round(self.items / self.elapsed, 2) if self.elapsed else 0.0,
+            "p50_ms": percentile(self.latencies, 50),
+            "p95_ms": percentile(self.latencies, 95),
+            "p99_ms": percentile(self.latencies, 99),
+            "max_ms": round(max(self.latencies) * 1000, 3) if self.latencies else None
+        }
+        if self.ttfb:
+            summary["ttfb_p50_ms"] = percentile(self.ttfb, 50)
+            summary["ttfb_p95_ms"] = percentile(self.ttfb, 95)
+        summary.update(self.memory)
+        return summary
+
+# Percentil (método nearest-rank) em milissegundos
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return round(ordered[index] * 1000, 3)
+
+# Pico de memória residente do processo, em MB
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss é informado em KB no Linux e em bytes no macOS
+    return round(rss / (1024 * 1024 if platform.system() == "Darwin" else 1024), 2)
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+# Executa count chamadas com no máximo concurrency simultâneas, medindo cada uma
+async def run_concurrently(
+    result: OperationResult,
+    count: int,
+    concurrency: int,
+    call: Callable[[int], Awaitable[bool]],
+    trace_memory: bool = False
+):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(index: int):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                ok = await call(index)
+            except Exception:
+                ok = False
+            if ok:
+                result.latencies.append(time.perf_counter() - start)
+                result.items += 1
+            else:
+                result.errors += 1
+
+    await measure(result, asyncio.gather(*(timed(i) for i in range(count))), trace_memory)
+
+# Mede o tempo total e a memória de uma etapa do benchmark
+async def measure(result: OperationResult, work: Awaitable, trace_memory: bool = False):
+    gc.collect()
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        await work
+    finally:
+        result.elapsed = time.perf_counter() - start
+        if trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            result.memory["traced_peak_mb"] = round(peak / (1024 * 1024), 2)
+        result.memory["rss_peak_mb"] = peak_rss_mb()
+
+def flow_payload(name: str, steps: int, max_tokens: int = 50) -> Dict[str, Any]:
+    return {
+        "name": name,
+        "description": "Fluxo gerado pelo benchmark",
+        "steps": [
+            {
+                "step_name": f"passo_{i}",
+                "system_prompt": f"Você é o passo {i} do benchmark. " * 20,
+                "step_order": i,
+                "temperature": 0.5,
+                "max_tokens": max_tokens
+            }
+            for i in range(1, steps + 1)
+        ]
+    }
+
+# Envia uma requisição diretamente ao app ASGI e registra quando chega o primeiro token.
+# O transporte ASGI do httpx só devolve a resposta completa, o que esconderia esse tempo.
+async def asgi_stream_request(app, path: str, payload: Dict[str, Any]) -> Tuple[int, Optional[float], float]:
+    body = json.dumps(payload).encode("utf-8")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("utf-8"),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"benchmark"), (b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 0),
+        "server": ("benchmark", 80)
+    }
+    request_sent = False
+    response_done = asyncio.Event()
+    status = 0
+    first_token: Optional[float] = None
+    start = time.perf_counter()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await response_done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status, first_token
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            if first_token is None and b"event: token" in message.get("body", b""):
+                first_token = time.perf_counter() - start
+            if not message.get("more_body", False):
+                response_done.set()
+
+    await app(scope, receive, send)
+    response_done.set()
+    return status, first_token, time.perf_counter() - start
+
+class BenchmarkRunner:
+    def __init__(self, args, app, client: httpx.AsyncClient):
+        self.args = args
+        self.app = app
+        self.client = client
+        self.prefix = uuid.uuid4().hex[:8]  # Evita colisões com fluxos de outras execuções
+
+    async def create_flow(self, flow_id: str, steps: int) -> bool:
+        response = await self.client.post("/createFlows/", params={"flow_id": flow_id}, json=flow_payload(f"bench {flow_id}", steps))
+        return response.status_code == 200
+
+    async def crud(self) -> List[OperationResult]:
+        count, concurrency, trace = self.args.requests, self.args.concurrency, self.args.trace_memory
+        ids = [f"{self.prefix}_crud_{i}" for i in range(count)]
+        results = []
+
+        create = OperationResult("crud.create")
+        await run_concurrently(create, count, concurrency, lambda i: self.create_flow(ids[i], self.args.steps), trace)
+        results.append(create)
+
+        async def get(i: int) -> bool:
+            return (await self.client.get(f"/getFlowsById/{ids[i]}")).status_code == 200
+        read = OperationResult("crud.get")
+        await run_concurrently(read, count, concurrency, get, trace)
+        results.append(read)
+
+        async def update(i: int) -> bool:
+            payload = flow_payload(f"bench {ids[i]} v2", self.args.steps)
+            return (await self.client.put(f"/updateFlows/{ids[i]}", json=payload)).status_code == 200
+        updated = OperationResult("crud.update")
+        await run_concurrently(updated, count, concurrency, update, trace)
+        results.append(updated)
+
+        async def list_flows(_: int) -> bool:
+            return (await self.client.get("/getFlows/")).status_code == 200
+        listed = OperationResult("crud.list")
+        await run_concurrently(listed, max(1, count // 10), concurrency, list_flows, trace)
+        results.append(listed)
+
+        async def delete(i: int) -> bool:
+            return (await self.client.delete(f"/deleteFlows/{ids[i]}")).status_code == 200
+        deleted = OperationResult("crud.delete")
+        await run_concurrently(deleted, count, concurrency, delete, trace)
+        results.append(deleted)
+        return results
+
+    async def exec_flow(self) -> List[OperationResult]:
+        flow_id = f"{self.prefix}_exec"
+        if not await self.create_flow(flow_id, self.args.steps):
+            raise RuntimeError("Não foi possível criar o fluxo do benchmark")
+
+        async def execute(i: int) -> bool:
+            response = await self.client.post(f"/flows/{flow_id}/exec_flow", json={"user_message": f"mensagem {i}"})
+            return response.status_code == 200
+
+        result = OperationResult("exec_flow")
+        await run_concurrently(result, self.args.requests, self.args.concurrency, execute, self.args.trace_memory)
+        return [result]
+
+    async def batch(self) -> List[OperationResult]:
+        flow_id = f"{self.prefix}_batch"
+        if not await self.create_flow(flow_id, self.args.steps):
+            raise RuntimeError("Não foi possível criar o fluxo do benchmark")
+
+        result = OperationResult("batch")
+        inputs = [f"entrada {i}" for i in range(self.args.batch_size)]
+        body = "\n".join(json.dumps({"user_message": text}) for text in inputs)
+
+        async def run_batches():
+            for _ in range(self.args.batch_runs):
+                start = time.perf_counter()
+                response = await self.client.post(
+                    f"/flows/{flow_id}/exec_batch",
+                    params={"concurrency": self.args.batch_concurrency},
+                    content=body,
+                    headers={"Content-Type": "application/x-ndjson"}
+                )
+                lines = [json.loads(line) for line in response.text.splitlines() if line.strip()]
+                failed = response.status_code != 200 or any("error" in line for line in lines)
+                if failed:
+                    result.errors += 1
+                else:
+                    result.latencies.append(time.perf_counter() - start)
+                result.items += sum(1 for line in lines if "result" in line)
+
+        await measure(result, run_batches(), self.args.trace_memory)
+        return [result]
+
+    async def stream(self) -> List[OperationResult]:
+        flow_id = f"{self.prefix}_stream"
+        if not await self.create_flow(flow_id, self.args.steps):
+            raise RuntimeError("Não foi possível criar o fluxo do benchmark")
+
+        result = OperationResult("stream")
+
+        async def execute(i: int) -> bool:
+            status, first_token, _ = await asgi_stream_request(
+                self.app, f"/flows/{flow_id}/exec_flow/stream", {"user_message": f"mensagem {i}"}
+            )
+            if first_token is not None:
+                result.ttfb.append(first_token)
+            return status == 200 and first_token is not None
+
+        await run_concurrently(result, self.args.requests, self.args.concurrency, execute, self.args.trace_memory)
+        return [result]
+
+# Define as variáveis de ambiente lidas por config.Settings antes de importar a aplicação
+def configure_environment(args, model_base_url: str):
+    os.environ.update({
+        "UFPB_OPENAI_API_KEY": "benchmark",
+        "UFPB_OPENAI_API_BASE": model_base_url,
+        "UFPB_LLM_DEPLOYMENT_NAME_4O": "benchmark",
+        "UFPB_OPENAI_API_VERSION": "2024-02-01",
+        "MONGODB_URL": args.mongo_url or "mongodb://localhost:27017",
+        "MONGODB_DB": f"benchmark_{uuid.uuid4().hex[:8]}",
+        "FLOW_CACHE_WATCH_CHANGES": "false",
+        "JOB_STORE_BACKEND": "memory" if args.mongo_url is None else "mongo",
+        "JOB_WORKERS": "0",
+        "TRACE_EXPORTER": "none"
+    })
+
+# Substitui os clientes do MongoDB por mongomock quando não há um mongod disponível
+def setup_database(args):
+    sys.path.insert(0, os.path.abspath(SRC_DIR))
+    import database
+
+    if args.mongo_url is None:
+        from mongomock_motor import AsyncMongoMockClient
+
+        client = AsyncMongoMockClient()
+        database.async_client = client
+        database.async_db = client[os.environ["MONGODB_DB"]]
+        database.async_collection = database.async_db[database.settings.MONGODB_COLLECTION]
+    return database
+
+def compare_with_baseline(current: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float) -> List[str]:
+    regressions = []
+    for name, metrics in current.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if metrics.get(key) and previous.get(key) and metrics[key] > previous[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {previous[key]} -> {metrics[key]}")
+        for key in ("throughput_rps", "items_per_s"):
+            if previous.get(key) and metrics.get(key, 0) < previous[key] * (1 - tolerance):
+                regressions.append(f"{name}: {key} {previous[key]} -> {metrics[key]}")
+    return regressions
+
+def print_report(results: Dict[str, Dict[str, Any]]):
+    columns = ("requests", "errors", "throughput_rps", "items_per_s", "p50_ms", "p95_ms", "p99_ms", "ttfb_p50_ms", "rss_peak_mb", "traced_peak_mb")
+    header = f"{'operação':<14}" + "".join(f"{column:>15}" for column in columns)
+    print(header)
+    print("-" * len(header))
+    for name, metrics in results.items():
+        values = "".join(f"{'-' if metrics.get(column) is None else metrics[column]:>15}" for column in columns)
+        print(f"{name:<14}{values}")
+
+async def run(args) -> Dict[str, Any]:
+    mock = MockLLMServer(
+        port=free_port(),
+        latency=args.latency,
+        token_rate=args.token_rate,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed
+    )
+    await mock.start()
+
+    configure_environment(args, mock.base_url)
+    database = setup_database(args)
+    import app as app_module
+
+    app = app_module.app
+    results: Dict[str, Dict[str, Any]] = {}
+    try:
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+                runner = BenchmarkRunner(args, app, client)
+                for scenario in args.scenarios:
+                    for result in await getattr(runner, scenario)():
+                        results[result.name] = result.summary()
+    finally:
+        await mock.stop()
+        if args.mongo_url is not None:
+            await database.async_client.drop_database(os.environ["MONGODB_DB"])
+
+    return {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "model_server": mock.stats,
+        "results": results
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks offline da Plataforma B3")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="Requisições por operação")
+    parser.add_argument("--concurrency", type=int, default=20, help="Requisições simultâneas")
+    parser.add_argument("--steps", type=int, default=3, help="Passos de cada fluxo")
+    parser.add_argument("--batch-size", type=int, default=200, help="Entradas por batch")
+    parser.add_argument("--batch-runs", type=int, default=3, help="Batches executados em sequência")
+    parser.add_argument("--batch-concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="Latência (s) do modelo simulado")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="Tokens por segundo do modelo simulado")
+    parser.add_argument("--completion-tokens", type=int, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fração de respostas 500 do modelo simulado")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fração de respostas 429 do modelo simulado")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mongo-url", default=None, help="Usa um mongod local em vez de mongomock")
+    parser.add_argument("--trace-memory", action="store_true", help="Mede o pico de alocações com tracemalloc (mais lento)")
+    parser.add_argument("--output", help="Grava os resultados em JSON")
+    parser.add_argument("--baseline", help="JSON de uma execução anterior para detectar regressões")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Variação aceita em relação ao baseline")
+    args = parser.parse_args()
+
+    # Os logs de cada operação distorceriam as medições
+    logging.disable(logging.INFO)
+
+    report = asyncio.run(run(args))
+    print_report(report["results"])
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(report, output, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+        regressions = compare_with_baseline(report["results"], baseline, args.tolerance)
+        if regressions:
+            print("\nRegressões em relação ao baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nSem regressões em relação ao baseline")
+
+if __name__ == "__main__":
+    main()
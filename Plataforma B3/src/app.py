@@ -1,98 +1,568 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request, Header, Query
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Dict, Optional
+from contextlib import asynccontextmanager
+from datetime import datetime
 import asyncio
 
 from dotenv import load_dotenv
-from flow_manager import FlowManager, Flow, FlowStep
-from model_integration import ModelIntegration
+from flow_manager import AsyncFlowManager, Flow, FlowAlreadyExistsError, FlowNotFoundError, FlowVersionConflictError
+from model_integration import ModelIntegration, FlowExecutionError, FlowTimeoutError, TokenLimitError
+from prompt_template import MissingVariablesError, check_variables
 from config import settings
-from database import get_db
+from database import get_async_db, async_collection, async_db
+from flow_cache import flow_cache, watch_flow_changes
+from completion_cache import create_completion_cache
+from job_queue import JobQueue, create_job_store, job_to_dict, JOB_FINAL_STATES
+from execution_history import create_execution_recorder, execution_report, get_execution, list_executions
+from metrics import render_metrics
+from indexes import ensure_indexes
+from tracing import TracingMiddleware, tracer
+import json_codec
 
 # Carrega variáveis de ambiente
 load_dotenv()
 
-# Inicializa app FastAPI
-app = FastAPI(title=settings.APP_NAME)
+# Inicializa o histórico de execuções (gravado em lotes, em segundo plano)
+execution_recorder = create_execution_recorder()
 
 # Inicializa cliente de modelo
-model_client = ModelIntegration(api_key=settings.UFPB_OPENAI_API_KEY)
+model_client = ModelIntegration(
+    api_key=settings.UFPB_OPENAI_API_KEY,
+    completion_cache=create_completion_cache(),
+    execution_recorder=execution_recorder
+)
 
-# Schemas
-class FlowStepSchema(BaseModel):
-    step_name: str
-    temperature: float = 0.7
-    system_prompt: str
-    max_tokens: int = 100
-    step_order: int
-
-class FlowSchema(BaseModel):
-    name: str
-    description: str
-    steps: List[FlowStepSchema]
-    is_active: bool = True
+# Inicializa a fila de jobs em segundo plano
+job_queue = JobQueue(
+    store=create_job_store(),
+    model_client=model_client,
+    flow_manager=AsyncFlowManager(async_collection, cache=flow_cache),
+    workers=settings.JOB_WORKERS,
+    poll_interval=settings.JOB_POLL_INTERVAL,
+    lease_seconds=settings.JOB_LEASE_SECONDS
+)
+
+# Limita o número de execuções de fluxo simultâneas neste worker
+flow_semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_FLOWS)
+
+# Abre o pool de conexões com o modelo na inicialização e o fecha no encerramento
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.MONGODB_CREATE_INDEXES:
+        await ensure_indexes(async_db)
+    await model_client.startup()
+    if execution_recorder is not None:
+        await execution_recorder.start()
+    watcher = None
+    if settings.FLOW_CACHE_WATCH_CHANGES:
+        watcher = asyncio.create_task(watch_flow_changes(async_collection, flow_cache))
+    await job_queue.start()
+    try:
+        yield
+    finally:
+        await job_queue.stop()
+        if watcher is not None:
+            watcher.cancel()
+        if execution_recorder is not None:
+            await execution_recorder.stop()
+        await model_client.close()
+        tracer.shutdown()
 
+# Respostas JSON serializadas por json_codec: orjson quando disponível (JSON_FAST_PATH), senão o módulo json
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return json_codec.dumps_bytes(content)
+
+# Inicializa app FastAPI
+app = FastAPI(title=settings.APP_NAME, lifespan=lifespan, default_response_class=FastJSONResponse)
+
+# Abre um span por requisição e devolve o trace id no cabeçalho X-Trace-Id
+app.add_middleware(TracingMiddleware, tracer=tracer)
+
+# Schemas
 class FlowuserMessage(BaseModel):
-    user_message: str = Field(..., example="Qual análise?")
+    user_message: str = Field(..., examples=["Qual análise?"])
+    variables: Optional[Dict[str, str]] = None  # Valores dos campos {{nome}} dos prompts dos passos
+
+class TokenUsageRequest(BaseModel):
+    user_message: Optional[str] = None  # Sem a mensagem, apenas os prompts e as saídas dos passos são contados
+    variables: Optional[Dict[str, str]] = None  # Variáveis dos prompts; as ausentes não são contadas
+
+class FlowBatchRequest(BaseModel):
+    inputs: List[str] = Field(..., examples=[["Qual análise?", "Resuma o documento"]])
+    variables: Optional[Dict[str, str]] = None  # Variáveis dos prompts, comuns a todas as entradas
 
 # Rotas
 @app.post("/createFlows/", response_model=Dict)
-def create_flow(flow_id: str, flow: FlowSchema, db=Depends(get_db)):
-    manager = FlowManager(db)
+async def create_flow(flow_id: str, flow: Flow, db=Depends(get_async_db)):
+    # O corpo já chega validado como Flow, em uma única passagem pelo Pydantic
+    manager = AsyncFlowManager(db, cache=flow_cache)
     try:
-        new_flow = Flow(**flow.dict())
-        manager.create_flow(flow_id, new_flow)
-        return {"message": "Fluxo criado com sucesso", "flow_id": flow_id}
+        created_flow = await manager.create_flow(flow_id, flow)
+        return {"message": "Fluxo criado com sucesso", "flow_id": flow_id, "version": created_flow.version}
+    except FlowAlreadyExistsError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/getFlows/", response_model=List[Dict])
-def list_flows(db=Depends(get_db)):
-    manager = FlowManager(db)
-    return manager.list_flows()
+async def list_flows(
+    limit: Optional[int] = Query(default=None, ge=1),
+    after: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    name_prefix: Optional[str] = None,
+    db=Depends(get_async_db)
+):
+    """Lista os fluxos em ordem de ID, em páginas de até limit fluxos.
+    
+    Para a próxima página, envie after com o ID do último fluxo recebido.
+    A resposta é um array JSON enviado à medida que os fluxos são lidos do banco.
+    """
+    limit = min(limit or settings.FLOW_LIST_PAGE_SIZE, settings.FLOW_LIST_MAX_PAGE_SIZE)
+    manager = AsyncFlowManager(db, cache=flow_cache)
+    flows = manager.iter_flows(limit=limit, after=after, is_active=is_active, name_prefix=name_prefix)
+    
+    # Lê o primeiro fluxo antes de responder, para que falhas na consulta retornem erro HTTP
+    try:
+        first = await flows.__anext__()
+    except StopAsyncIteration:
+        first = None
+    
+    async def json_array():
+        yield "["
+        if first is not None:
+            yield json_codec.dumps(first)
+            async for flow in flows:
+                yield "," + json_codec.dumps(flow)
+        yield "]"
+    
+    return StreamingResponse(json_array(), media_type="application/json")
+
+# Lê os registros de importação; linhas com JSON inválido viram exceções reportadas por registro
+async def iter_import_records(request: Request):
+    if "ndjson" in request.headers.get("content-type", ""):
+        async for line in iter_ndjson_lines(request):
+            try:
+                yield json_codec.loads(line)
+            except json_codec.JSONDecodeError as e:
+                yield ValueError(f"JSON inválido: {str(e)}")
+        return
+    
+    records = json_codec.loads(await request.body())
+    if not isinstance(records, list):
+        raise ValueError("O corpo deve ser um array JSON ou NDJSON")
+    for record in records:
+        yield record
+
+@app.post("/flows/import", response_model=Dict)
+async def import_flows(request: Request, overwrite: bool = False, db=Depends(get_async_db)):
+    """Importa fluxos em lote a partir de um array JSON ou de NDJSON (um fluxo por linha, com flow_id).
+    
+    Cada registro inválido ou rejeitado é listado em errors; os demais são gravados.
+    Com overwrite=true, fluxos existentes são substituídos.
+    """
+    manager = AsyncFlowManager(db, cache=flow_cache)
+    try:
+        return await manager.import_flows(
+            iter_import_records(request),
+            overwrite=overwrite,
+            batch_size=settings.FLOW_IMPORT_BATCH_SIZE
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Corpo inválido: {str(e)}")
+
+@app.get("/flows/export")
+async def export_flows(is_active: Optional[bool] = None, name_prefix: Optional[str] = None, db=Depends(get_async_db)):
+    """Exporta os fluxos em NDJSON, no formato aceito por /flows/import."""
+    manager = AsyncFlowManager(db, cache=flow_cache)
+    flows = manager.export_flows(is_active=is_active, name_prefix=name_prefix, batch_size=settings.FLOW_EXPORT_BATCH_SIZE)
+    
+    async def ndjson():
+        async for flow in flows:
+            yield json_codec.dumps(flow) + "\n"
+    
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+# Carrega um fluxo pelo ID; FlowNotFoundError é respondido como 404 em todas as rotas
+async def load_flow(flow_id: str, db) -> Flow:
+    manager = AsyncFlowManager(db, cache=flow_cache)
+    try:
+        return await manager.get_flow(flow_id)
+    except FlowNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
 @app.get("/getFlowsById/{flow_id}", response_model=Dict)
-def get_flow(flow_id: str, db=Depends(get_db)):
-    manager = FlowManager(db)
-    flow = manager.get_flow(flow_id)
-    if flow is None:
-        raise HTTPException(status_code=404, detail="Fluxo não encontrado")
-    return flow.dict()
+async def get_flow(flow_id: str, db=Depends(get_async_db)):
+    flow = await load_flow(flow_id, db)
+    return flow.model_dump()
 
 @app.put("/updateFlows/{flow_id}", response_model=Dict)
-def update_flow(flow_id: str, flow: FlowSchema, db=Depends(get_db)):
-    manager = FlowManager(db)
+async def update_flow(flow_id: str, flow: Flow, db=Depends(get_async_db)):
+    """Atualiza um fluxo. Se version for informada (a versão lida do fluxo), a atualização
+    falha com 409 caso ele tenha mudado desde a leitura."""
+    manager = AsyncFlowManager(db, cache=flow_cache)
     try:
-        updated_flow = Flow(**flow.dict())
-        manager.update_flow(flow_id, updated_flow)
-        return {"message": "Fluxo atualizado com sucesso"}
+        updated_flow = await manager.update_flow(flow_id, flow, expected_version=flow.version)
+        return {"message": "Fluxo atualizado com sucesso", "version": updated_flow.version}
+    except FlowNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except FlowVersionConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/deleteFlows/{flow_id}", response_model=Dict)
-def delete_flow(flow_id: str, db=Depends(get_db)):
-    manager = FlowManager(db)
+async def delete_flow(flow_id: str, db=Depends(get_async_db)):
+    manager = AsyncFlowManager(db, cache=flow_cache)
     try:
-        manager.delete_flow(flow_id)
+        await manager.delete_flow(flow_id)
         return {"message": "Fluxo deletado com sucesso"}
+    except FlowNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/cache/flows/stats", response_model=Dict)
+async def flow_cache_stats():
+    return flow_cache.stats()
+
+@app.get("/rate_limit/stats", response_model=Dict)
+async def rate_limit_stats():
+    return model_client.router.stats()
+
+# Métricas no formato do Prometheus (latências, tokens, MongoDB, caches e execuções em andamento)
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+# Sinaliza que o cliente encerrou a conexão antes da resposta
+class ClientDisconnected(Exception):
+    pass
+
+# Aguarda a corrotina, cancelando-a se o cliente se desconectar
+async def run_until_disconnected(http_request: Request, coro):
+    task = asyncio.create_task(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=settings.DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            # O cancelamento aborta a requisição aiohttp em andamento e libera a vaga
+            task.cancel()
 
 @app.post("/flows/{flow_id}/exec_flow", response_model=Dict)
-def test_flow(flow_id: str, request: FlowuserMessage, db=Depends(get_db)):
-    manager = FlowManager(db)
-    flow = manager.get_flow(flow_id)
-    if flow is None:
-        raise HTTPException(status_code=404, detail="Fluxo não encontrado")
+async def test_flow(
+    flow_id: str,
+    request: FlowuserMessage,
+    http_request: Request,
+    resume_from: Optional[str] = None,
+    verbose: bool = True,
+    x_request_deadline: Optional[float] = Header(default=None, gt=0),
+    db=Depends(get_async_db)
+):
+    """Executa um fluxo. Em caso de falha, o cabeçalho X-Checkpoint-Id identifica os
+    passos concluídos; reenviar a chamada com resume_from retoma do passo que falhou.
+    
+    O cabeçalho X-Request-Deadline limita o tempo (s) da execução. Se o cliente se
+    desconectar, a execução e as chamadas ao modelo em andamento são canceladas.
+    Com verbose=false, a resposta omite as mensagens enviadas ao modelo em cada passo."""
+    flow = await load_flow(flow_id, db)
+    
+    checkpoint = None
+    if resume_from is not None:
+        saved = await job_queue.store.get(resume_from)
+        if saved is None or saved["flow_id"] != flow_id:
+            raise HTTPException(status_code=404, detail="Checkpoint não encontrado")
+        checkpoint = saved["steps"]
     
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(
-            model_client.process_flow(user_message=request.user_message, flow=flow)
-        )
-        loop.close()
-        return result
+        async with flow_semaphore:
+            result = await run_until_disconnected(
+                http_request,
+                model_client.process_flow(
+                    user_message=request.user_message,
+                    flow=flow,
+                    checkpoint=checkpoint,
+                    deadline=x_request_deadline,
+                    verbose=verbose,
+                    variables=request.variables
+                )
+            )
+        # O resultado já é serializável: a resposta é montada sem a validação de response_model
+        return FastJSONResponse(result)
+    except ClientDisconnected:
+        raise HTTPException(status_code=499, detail="Cliente desconectado")
+    except (TokenLimitError, MissingVariablesError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except FlowExecutionError as e:
+        saved = await job_queue.save_checkpoint(flow_id, request.user_message, e.completed_steps, str(e), variables=request.variables)
+        status_code = 504 if isinstance(e, FlowTimeoutError) else 500
+        raise HTTPException(status_code=status_code, detail=str(e), headers={"X-Checkpoint-Id": saved["_id"]})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/flows/{flow_id}/token_usage", response_model=Dict)
+async def project_token_usage(flow_id: str, request: TokenUsageRequest, db=Depends(get_async_db)):
+    """Projeta os tokens de cada passo do fluxo sem executá-lo, contados localmente.
+    
+    Saídas de passos anteriores entram pelo seu max_tokens, então prompt_tokens_max e max_cost são limites superiores.
+    """
+    flow = await load_flow(flow_id, db)
+    return model_client.project_token_usage(flow, request.user_message, request.variables)
+
+# Formata um evento no padrão Server-Sent Events
+def format_sse(event: Dict) -> str:
+    return f"event: {event['event']}\ndata: {json_codec.dumps(event)}\n\n"
+
+@app.post("/flows/{flow_id}/exec_flow/stream")
+async def stream_flow(
+    flow_id: str,
+    request: FlowuserMessage,
+    x_request_deadline: Optional[float] = Header(default=None, gt=0),
+    db=Depends(get_async_db)
+):
+    flow = await load_flow(flow_id, db)
+    
+    # Erros de entrada respondem com o mesmo status de exec_flow, antes de o stream começar
+    try:
+        model_client.check_flow_request(request.user_message, flow, request.variables)
+    except (TokenLimitError, MissingVariablesError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    async def event_stream():
+        async with flow_semaphore:
+            try:
+                async for event in model_client.process_flow_stream(
+                    user_message=request.user_message,
+                    flow=flow,
+                    deadline=x_request_deadline,
+                    variables=request.variables,
+                    checked=True
+                ):
+                    yield format_sse(event)
+            except Exception as e:
+                yield format_sse({"event": "error", "detail": str(e)})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# Extrai a mensagem de uma linha NDJSON (texto JSON ou objeto com user_message)
+def parse_ndjson_input(line: str) -> str:
+    item = json_codec.loads(line)
+    if isinstance(item, dict):
+        item = item.get("user_message")
+    if not isinstance(item, str):
+        raise ValueError("Cada linha deve ser um texto JSON ou um objeto com 'user_message'")
+    return item
+
+# Lê as linhas não vazias de um corpo NDJSON à medida que o corpo chega
+async def iter_ndjson_lines(request: Request):
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line.decode("utf-8")
+    if buffer.strip():
+        yield buffer.decode("utf-8")
+
+# Lê as entradas de um corpo NDJSON linha a linha
+async def iter_ndjson_inputs(request: Request):
+    async for line in iter_ndjson_lines(request):
+        yield parse_ndjson_input(line)
+
+# Responde 413 se o lote tiver mais entradas que MAX_BATCH_INPUTS
+def check_batch_size(count: int):
+    if count > settings.MAX_BATCH_INPUTS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"O lote deve ter no máximo {settings.MAX_BATCH_INPUTS} entradas"
+        )
+
+@app.post("/flows/{flow_id}/exec_batch")
+async def exec_batch(
+    flow_id: str,
+    request: Request,
+    concurrency: Optional[int] = None,
+    verbose: bool = True,
+    db=Depends(get_async_db)
+):
+    """Executa um fluxo sobre várias entradas e retorna os resultados em NDJSON, na ordem de conclusão.
+    
+    O corpo pode ser um JSON {"inputs": [...], "variables": {...}} ou NDJSON (application/x-ndjson),
+    uma entrada por linha; as variáveis dos prompts, comuns a todas as entradas, vão apenas no JSON.
+    Com verbose=false, os resultados omitem as mensagens enviadas ao modelo em cada passo.
+    """
+    concurrency = concurrency or settings.BATCH_CONCURRENCY
+    if not 1 <= concurrency <= settings.MAX_BATCH_CONCURRENCY:
+        raise HTTPException(
+            status_code=422,
+            detail=f"A concorrência deve estar entre 1 e {settings.MAX_BATCH_CONCURRENCY}"
+        )
+    
+    flow = await load_flow(flow_id, db)
+    
+    # O corpo é lido antes de a resposta começar: durante o streaming o canal
+    # de entrada é usado para detectar a desconexão do cliente. Por isso o número
+    # de entradas é limitado por MAX_BATCH_INPUTS, também no NDJSON.
+    content_type = request.headers.get("content-type", "")
+    try:
+        with tracer.start_span("request.parse", {"content_type": content_type}) as span:
+            variables = None
+            if "ndjson" in content_type:
+                inputs = []
+                async for user_message in iter_ndjson_inputs(request):
+                    inputs.append(user_message)
+                    check_batch_size(len(inputs))
+            else:
+                batch_request = FlowBatchRequest(**await request.json())
+                inputs, variables = batch_request.inputs, batch_request.variables
+                check_batch_size(len(inputs))
+            span.set_attribute("inputs_count", len(inputs))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Corpo inválido: {str(e)}")
+    
+    async def result_stream():
+        try:
+            # Cada execução do lote ocupa uma vaga de MAX_CONCURRENT_FLOWS, como em exec_flow
+            async for item in model_client.process_batch(
+                inputs, flow, concurrency=concurrency, verbose=verbose, variables=variables, flow_limiter=flow_semaphore
+            ):
+                yield json_codec.dumps(item) + "\n"
+        except Exception as e:
+            yield json_codec.dumps({"error": str(e)}) + "\n"
+    
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+
+# Responde 422 antes de enfileirar um job sem as variáveis exigidas pelos prompts do fluxo
+def check_job_variables(flow: Flow, variables: Optional[Dict[str, str]]):
+    try:
+        check_variables(flow.prompt_templates().values(), variables)
+    except MissingVariablesError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+@app.post("/flows/{flow_id}/jobs", response_model=Dict, status_code=202)
+async def submit_job(flow_id: str, request: FlowuserMessage, db=Depends(get_async_db)):
+    flow = await load_flow(flow_id, db)
+    check_job_variables(flow, request.variables)
+    
+    job = await job_queue.submit(flow_id, user_message=request.user_message, variables=request.variables)
+    return {"job_id": job["_id"], "status": job["status"]}
+
+@app.post("/flows/{flow_id}/batch_jobs", response_model=Dict, status_code=202)
+async def submit_batch_job(flow_id: str, request: FlowBatchRequest, db=Depends(get_async_db)):
+    flow = await load_flow(flow_id, db)
+    check_batch_size(len(request.inputs))
+    check_job_variables(flow, request.variables)
+    
+    job = await job_queue.submit(flow_id, inputs=request.inputs, variables=request.variables)
+    return {"job_id": job["_id"], "status": job["status"]}
+
+@app.get("/jobs/{job_id}", response_model=Dict)
+async def get_job(job_id: str, include_result: bool = True):
+    job = await job_queue.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job_to_dict(job, include_result=include_result)
+
+@app.post("/jobs/{job_id}/resume", response_model=Dict, status_code=202)
+async def resume_job(job_id: str):
+    try:
+        job = await job_queue.resume(job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"job_id": job["_id"], "status": job["status"]}
+
+@app.get("/jobs/{job_id}/stream")
+async def stream_job(job_id: str):
+    """Acompanha o progresso de um job via Server-Sent Events até sua conclusão."""
+    job = await job_queue.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    
+    async def event_stream():
+        last_update = None
+        while True:
+            job = await job_queue.store.get(job_id)
+            if job is None:
+                # Job removido durante o acompanhamento (ex.: pela retenção de jobs)
+                yield f"event: error\ndata: {json_codec.dumps({'event': 'error', 'job_id': job_id, 'detail': 'Job não encontrado'})}\n\n"
+                return
+            if job["updated_at"] != last_update:
+                last_update = job["updated_at"]
+                done = job["status"] in JOB_FINAL_STATES
+                event = {"event": "done" if done else "progress", **job_to_dict(job, include_result=done)}
+                yield f"event: {event['event']}\ndata: {json_codec.dumps(event)}\n\n"
+                if done:
+                    return
+            await asyncio.sleep(settings.JOB_POLL_INTERVAL)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Coleção do histórico; as rotas respondem 404 se o histórico estiver desativado
+def get_executions_collection():
+    if execution_recorder is None:
+        raise HTTPException(status_code=404, detail="Histórico de execuções desativado")
+    return async_db[settings.MONGODB_EXECUTIONS_COLLECTION]
+
+@app.get("/executions", response_model=Dict)
+async def get_executions(
+    flow_id: Optional[str] = None,
+    status: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: Optional[int] = Query(default=None, ge=1),
+    cursor: Optional[str] = None,
+    collection=Depends(get_executions_collection)
+):
+    """Lista as execuções das mais recentes para as mais antigas, sem o detalhe dos passos.
+    
+    start e end delimitam started_at. Para a próxima página, envie cursor com o next_cursor recebido.
+    """
+    limit = min(limit or settings.FLOW_LIST_PAGE_SIZE, settings.FLOW_LIST_MAX_PAGE_SIZE)
+    try:
+        return await list_executions(collection, flow_id, status, start, end, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/executions/report", response_model=List[Dict])
+async def get_execution_report(
+    flow_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    collection=Depends(get_executions_collection)
+):
+    """Custo e latência das execuções por fluxo no intervalo informado, ordenados pelo custo."""
+    return await execution_report(collection, flow_id, start, end)
+
+@app.get("/executions/{execution_id}", response_model=Dict)
+async def get_execution_by_id(execution_id: str, collection=Depends(get_executions_collection)):
+    execution = await get_execution(collection, execution_id)
+    if execution is None:
+        raise HTTPException(status_code=404, detail="Execução não encontrada")
+    return execution
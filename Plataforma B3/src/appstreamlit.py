@@ -1,5 +1,7 @@
 import os
+import atexit
 import asyncio
+import threading
 import traceback
 from typing import List, Dict, Any
 
@@ -9,7 +11,7 @@ from pymongo import MongoClient
 from pymongo.collection import Collection
 from sqlalchemy.orm import Session
 
-from flow_manager import Flow, FlowStep, FlowManager
+from flow_manager import Flow, FlowStep, FlowManager, USER_MESSAGE_INPUT
 from model_integration import ModelIntegration
 from config import settings
 from database import get_db
@@ -24,11 +26,44 @@ st.set_page_config(
     layout="wide"
 )
 
-# Inicializa o cliente do modelo
-try:
+# Encerra a sessão HTTP do modelo e para o event loop de fundo
+def _shutdown_model_runtime(model_client: ModelIntegration, loop: asyncio.AbstractEventLoop):
+    try:
+        asyncio.run_coroutine_threadsafe(model_client.close(), loop).result(timeout=5)
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+
+# Cria o cliente do modelo e um event loop dedicado em uma thread de fundo.
+# O recurso é compartilhado entre as reexecuções do script, de modo que a
+# sessão HTTP (e seu pool de conexões) seja reutilizada entre os testes.
+@st.cache_resource
+def get_model_runtime():
     model_client = ModelIntegration(
         api_key=settings.UFPB_OPENAI_API_KEY
     )
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    asyncio.run_coroutine_threadsafe(model_client.startup(), loop).result()
+    atexit.register(_shutdown_model_runtime, model_client, loop)
+    return model_client, loop
+
+# Executa uma corrotina no event loop do cliente do modelo e aguarda o resultado
+def run_async(coro):
+    _, loop = get_model_runtime()
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+# Consome um gerador assíncrono no event loop do cliente do modelo, item a item
+def iterate_async(async_gen):
+    _, loop = get_model_runtime()
+    while True:
+        try:
+            yield asyncio.run_coroutine_threadsafe(async_gen.__anext__(), loop).result()
+        except StopAsyncIteration:
+            return
+
+# Inicializa o cliente do modelo
+try:
+    model_client, _ = get_model_runtime()
 except Exception as e:
     st.error(f"Erro ao inicializar o cliente do modelo: {str(e)}")
     st.stop()
@@ -77,7 +112,15 @@ def create_flow_step(step_number: int, step_data: Dict = None) -> Dict:
         "temperature": temperature,
         "system_prompt": system_prompt,
         "max_tokens": max_tokens,
-        "step_order": step_number
+        "step_order": step_number,
+        "depends_on": step_data.get("depends_on") if step_data else None,
+        "cache_enabled": step_data.get("cache_enabled") if step_data else None,
+        "cache_ttl_seconds": step_data.get("cache_ttl_seconds") if step_data else None,
+        "timeout_seconds": step_data.get("timeout_seconds") if step_data else None,
+        "max_input_tokens": step_data.get("max_input_tokens") if step_data else None,
+        "input_policy": step_data.get("input_policy") if step_data else None,
+        "model": step_data.get("model") if step_data else None,
+        "coalesce_requests": step_data.get("coalesce_requests", False) if step_data else False
     }
 
 # Função para criar novos fluxos
@@ -123,6 +166,13 @@ def criar_fluxos(flow_manager):
         key=f"max_tokens_{step_order}"
     )
     
+    # Sem seleção, o passo recebe a saída do passo anterior
+    depends_on = st.multiselect(
+        "Entradas do passo (vazio = passo anterior)",
+        options=[USER_MESSAGE_INPUT] + [step["step_name"] for step in st.session_state.steps],
+        key=f"depends_on_{step_order}"
+    )
+    
     if st.button("Adicionar Passo"):
         if step_name and system_prompt:
             st.session_state.steps.append({
@@ -130,7 +180,8 @@ def criar_fluxos(flow_manager):
                 "step_order": step_order,
                 "system_prompt": system_prompt,
                 "temperature": temperature,
-                "max_tokens": max_tokens
+                "max_tokens": max_tokens,
+                "depends_on": depends_on or None
             })
             st.success("Passo adicionado com sucesso!")
 
@@ -150,11 +201,19 @@ def criar_fluxos(flow_manager):
         except Exception as e:
             st.error(f"Erro ao criar fluxo: {str(e)}")
 
+# Lista os fluxos com filtro por prefixo do nome, limitado a uma página
+def listar_fluxos(flow_manager, key: str) -> List[Dict[str, Any]]:
+    name_prefix = st.text_input("Filtrar por nome (início do nome)", key=key)
+    flows = flow_manager.list_flows(limit=settings.FLOW_LIST_PAGE_SIZE, name_prefix=name_prefix or None)
+    if len(flows) == settings.FLOW_LIST_PAGE_SIZE:
+        st.caption(f"Exibindo os primeiros {settings.FLOW_LIST_PAGE_SIZE} fluxos. Refine o filtro para encontrar outros.")
+    return flows
+
 # Função para gerenciar fluxos existentes
 def gerenciar_fluxos(flow_manager):
     st.header("Gerenciar Fluxos")
     
-    flows = flow_manager.list_flows()
+    flows = listar_fluxos(flow_manager, key="filtro_gerenciar")
     if not flows:
         st.warning("Nenhum fluxo cadastrado. Crie um fluxo primeiro.")
     else:
@@ -188,9 +247,16 @@ def gerenciar_fluxos(flow_manager):
                             name=flow_name,
                             description=flow_description,
                             steps=[FlowStep(**step) for step in edited_steps],
-                            is_active=True
+                            is_active=True,
+                            cache_enabled=flow.cache_enabled,
+                            cache_ttl_seconds=flow.cache_ttl_seconds,
+                            timeout_seconds=flow.timeout_seconds
+                        )
+                        flow_manager.update_flow(
+                            flow_id,
+                            updated_flow,
+                            expected_version=st.session_state.get("editing_version", flow.version)
                         )
-                        flow_manager.update_flow(flow_id, updated_flow)
                         st.success("Fluxo atualizado com sucesso!")
                         st.session_state.editing_flow = False
                     except Exception as e:
@@ -212,6 +278,8 @@ def gerenciar_fluxos(flow_manager):
                 
                 if st.button("Editar Fluxo"):
                     st.session_state.editing_flow = True
+                    # Versão de referência: a gravação falha se outro usuário alterar o fluxo durante a edição
+                    st.session_state.editing_version = flow.version
                 
                 if st.button("Excluir Fluxo"):
                     try:
@@ -220,11 +288,49 @@ def gerenciar_fluxos(flow_manager):
                     except Exception as e:
                         st.error(f"Erro ao excluir fluxo: {str(e)}")
 
+# Campos para as variáveis usadas nos prompts do fluxo ({{nome}}), na ordem em que aparecem
+def ler_variaveis(flow) -> Dict[str, str]:
+    names = dict.fromkeys(
+        name for template in flow.prompt_templates().values() for name in template.variables
+    )
+    if names:
+        st.markdown("**Variáveis dos prompts**")
+    return {
+        name: st.text_input(f"{{{{{name}}}}}", key=f"variavel_{flow.flow_id}_{name}")
+        for name in names
+    }
+
+# Função para exibir a execução de um fluxo à medida que os passos são gerados
+def exibir_execucao_em_tempo_real(model_client, flow, user_message: str, variables: Dict[str, str]):
+    st.subheader("Respostas")
+    step_placeholders = {}
+    step_texts = {}
+    
+    try:
+        events = model_client.process_flow_stream(user_message=user_message, flow=flow, variables=variables)
+        for event in iterate_async(events):
+            step_name = event.get("step_name")
+            if event["event"] == "step_start":
+                st.markdown(f"**Passo {event['step_order']}: {step_name}**")
+                step_placeholders[step_name] = st.empty()
+                step_texts[step_name] = ""
+            elif event["event"] == "token":
+                step_texts[step_name] += event["content"]
+                step_placeholders[step_name].markdown(step_texts[step_name] + "▌")
+            elif event["event"] == "step_end":
+                step_placeholders[step_name].markdown(event["assistant_message"])
+            elif event["event"] == "flow_end":
+                st.success(f"Resposta final: {event['final_response']}")
+            elif event["event"] == "error":
+                st.error(f"Erro ao testar fluxo: {event['detail']}")
+    except Exception as e:
+        st.error(f"Erro ao testar fluxo: {str(e)}")
+
 # Função para testar fluxos
 def testar_fluxos(model_client, flow_manager):
     st.header("Testar Fluxos")
     
-    flows = flow_manager.list_flows()
+    flows = listar_fluxos(flow_manager, key="filtro_testar")
     if not flows:
         st.warning("Nenhum fluxo cadastrado. Crie um fluxo primeiro.")
     else:
@@ -239,21 +345,26 @@ def testar_fluxos(model_client, flow_manager):
             flow = flow_manager.get_flow(flow_id)
             
             user_message = st.text_area("Digite sua mensagem de teste")
+            variables = ler_variaveis(flow)
+            stream_output = st.checkbox("Exibir respostas em tempo real", value=True)
             if st.button("Executar Teste"):
+                missing = [name for name, value in variables.items() if value.strip() == ""]
                 if user_message.strip() == "":
                     st.error("Por favor, digite uma mensagem de teste.")
+                elif missing:
+                    st.error(f"Preencha as variáveis: {', '.join(missing)}")
+                elif stream_output:
+                    exibir_execucao_em_tempo_real(model_client, flow, user_message, variables)
                 else:
                     with st.spinner("Executando teste..."):
                         try:
-                            loop = asyncio.new_event_loop()
-                            asyncio.set_event_loop(loop)
-                            result = loop.run_until_complete(
+                            result = run_async(
                                 model_client.process_flow(
                                     user_message=user_message,
-                                    flow=flow
+                                    flow=flow,
+                                    variables=variables
                                 )
                             )
-                            loop.close()
 
                             st.subheader("Respostas")
                             for step_name, step_response in result["steps"].items():
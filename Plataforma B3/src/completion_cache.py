@@ -0,0 +1,158 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+import logging
+
+from config import settings
+
+# Configuração básica de logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Campos do payload que determinam a resposta do modelo
+CACHE_KEY_FIELDS = (
+    "messages",
+    "temperature",
+    "max_tokens",
+    "top_p",
+    "frequency_penalty",
+    "presence_penalty",
+)
+
+# Gera a chave do cache a partir do deployment e dos parâmetros da chamada
+def make_cache_key(deployment: str, payload: Dict[str, Any]) -> str:
+    key_data = {field: payload.get(field) for field in CACHE_KEY_FIELDS}
+    key_data["deployment"] = deployment
+    encoded = json.dumps(key_data, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+# Interface comum dos backends de cache de respostas do modelo
+class CompletionCache:
+    # Obtém uma resposta armazenada, ou None se ausente ou expirada
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    # Armazena uma resposta; ttl_seconds None ou 0 mantém a entrada sem expiração
+    async def set(self, key: str, value: Dict[str, Any], ttl_seconds: Optional[float] = None):
+        raise NotImplementedError
+
+    # Libera recursos do backend
+    async def close(self):
+        pass
+
+# Cache em memória com política LRU
+class MemoryCompletionCache(CompletionCache):
+    def __init__(self, max_size: int = 10000):
+        if max_size < 1:
+            raise ValueError("O tamanho máximo do cache deve ser pelo menos 1")
+        self.max_size = max_size
+        self._entries: OrderedDict = OrderedDict()  # chave -> (expira em ou None, resposta)
+        self._lock = threading.Lock()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    async def set(self, key: str, value: Dict[str, Any], ttl_seconds: Optional[float] = None):
+        expires_at = time.monotonic() + ttl_seconds if ttl_seconds else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+# Cache persistente em disco usando SQLite
+class SQLiteCompletionCache(CompletionCache):
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+            self._conn.commit()
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at < time.time():
+                self._conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+        return json.loads(value)
+
+    def _set(self, key: str, value: Dict[str, Any], ttl_seconds: Optional[float]):
+        expires_at = time.time() + ttl_seconds if ttl_seconds else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), expires_at)
+            )
+            self._conn.commit()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: Dict[str, Any], ttl_seconds: Optional[float] = None):
+        await asyncio.to_thread(self._set, key, value, ttl_seconds)
+
+    async def close(self):
+        with self._lock:
+            self._conn.close()
+
+# Cache armazenado em uma coleção do MongoDB (coleção assíncrona do Motor)
+class MongoCompletionCache(CompletionCache):
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = await self.collection.find_one({"_id": key})
+        if entry is None:
+            return None
+        expires_at = entry.get("expires_at")
+        if expires_at is not None and expires_at < datetime.utcnow():
+            return None
+        return entry["value"]
+
+    async def set(self, key: str, value: Dict[str, Any], ttl_seconds: Optional[float] = None):
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl_seconds) if ttl_seconds else None
+        await self.collection.replace_one(
+            {"_id": key},
+            {"_id": key, "value": value, "expires_at": expires_at},
+            upsert=True
+        )
+
+# Cria o backend de cache configurado, ou None se o cache estiver desativado
+def create_completion_cache(backend: Optional[str] = None) -> Optional[CompletionCache]:
+    backend = (backend or settings.COMPLETION_CACHE_BACKEND).lower()
+    if backend in ("", "none"):
+        return None
+    if backend == "memory":
+        return MemoryCompletionCache(max_size=settings.COMPLETION_CACHE_MAX_SIZE)
+    if backend == "sqlite":
+        return SQLiteCompletionCache(settings.COMPLETION_CACHE_SQLITE_PATH)
+    if backend == "mongo":
+        from database import async_db
+        return MongoCompletionCache(async_db[settings.MONGODB_COMPLETION_CACHE_COLLECTION])
+    raise ValueError(f"Backend de cache desconhecido: {backend}")
@@ -1,7 +1,7 @@
 import os
 from typing import Optional
 from pydantic import Field, HttpUrl
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
 from dotenv import load_dotenv
 
 # Carrega as variáveis de ambiente do arquivo .env
@@ -10,10 +10,10 @@ load_dotenv()
 # Classe para gerenciar as configurações da aplicação
 class Settings(BaseSettings):
     # Configurações do Azure OpenAI
-    UFPB_OPENAI_API_KEY: str = Field(..., env="UFPB_OPENAI_API_KEY")  # Chave da API do OpenAI
-    UFPB_OPENAI_API_BASE: str = Field(..., env="UFPB_OPENAI_API_BASE")  # URL base da API do OpenAI
-    UFPB_LLM_DEPLOYMENT_NAME_4O: str = Field(..., env="UFPB_LLM_DEPLOYMENT_NAME_4O")  # Nome do deployment do modelo
-    UFPB_OPENAI_API_VERSION: str = Field(..., env="UFPB_OPENAI_API_VERSION")  # Versão da API do OpenAI
+    UFPB_OPENAI_API_KEY: str = Field(...)  # Chave da API do OpenAI
+    UFPB_OPENAI_API_BASE: str = Field(...)  # URL base da API do OpenAI
+    UFPB_LLM_DEPLOYMENT_NAME_4O: str = Field(...)  # Nome do deployment do modelo
+    UFPB_OPENAI_API_VERSION: str = Field(...)  # Versão da API do OpenAI
     
     # Propriedade para construir a URL completa do endpoint do modelo
     @property
@@ -22,19 +22,100 @@ class Settings(BaseSettings):
         return f"{self.UFPB_OPENAI_API_BASE}openai/deployments/{self.UFPB_LLM_DEPLOYMENT_NAME_4O}/chat/completions?api-version={self.UFPB_OPENAI_API_VERSION}"
     
     # Configurações do MongoDB
-    MONGODB_URL: str = Field(default="mongodb://localhost:27017", env="MONGODB_URL")  # URL do MongoDB
-    MONGODB_DB: str = Field(default="plataforma_b3", env="MONGODB_DB")  # Nome do banco de dados
-    MONGODB_COLLECTION: str = Field(default="flows", env="MONGODB_COLLECTION")  # Nome da coleção no MongoDB
+    MONGODB_URL: str = Field(default="mongodb://localhost:27017")  # URL do MongoDB
+    MONGODB_DB: str = Field(default="plataforma_b3")  # Nome do banco de dados
+    MONGODB_COLLECTION: str = Field(default="flows")  # Nome da coleção no MongoDB
+    MONGODB_CREATE_INDEXES: bool = Field(default=True)  # Cria os índices das coleções na inicialização
+    
+    # Configurações do pool de conexões HTTP com o modelo
+    HTTP_POOL_SIZE: int = Field(default=100)  # Máximo de conexões simultâneas no pool
+    HTTP_POOL_PER_HOST: int = Field(default=50)  # Máximo de conexões por host
+    HTTP_KEEPALIVE_TIMEOUT: float = Field(default=60.0)  # Tempo (s) que uma conexão ociosa é mantida aberta
+    HTTP_DNS_CACHE_TTL: int = Field(default=300)  # Tempo (s) de cache das resoluções DNS
+    
+    # Configurações de execução de fluxos
+    MAX_CONCURRENT_FLOWS: int = Field(default=500)  # Máximo de execuções de fluxo simultâneas por worker
+    DISCONNECT_POLL_INTERVAL: float = Field(default=0.5)  # Intervalo (s) de verificação de desconexão do cliente
+    BATCH_CONCURRENCY: int = Field(default=10)  # Concorrência padrão de uma execução em lote
+    MAX_BATCH_CONCURRENCY: int = Field(default=100)  # Concorrência máxima aceita em uma execução em lote
+    MAX_BATCH_INPUTS: int = Field(default=10000)  # Máximo de entradas de uma execução em lote (o corpo é lido inteiro)
+    
+    # Configurações do cache de fluxos
+    FLOW_CACHE_MAX_SIZE: int = Field(default=1000)  # Máximo de fluxos mantidos em memória
+    FLOW_CACHE_TTL_SECONDS: float = Field(default=300.0)  # Tempo de vida (s) de um fluxo no cache
+    FLOW_CACHE_WATCH_CHANGES: bool = Field(default=True)  # Invalida o cache via change stream do MongoDB
+    
+    # Configurações da listagem de fluxos
+    FLOW_LIST_PAGE_SIZE: int = Field(default=100)  # Fluxos por página quando limit não é informado
+    FLOW_LIST_MAX_PAGE_SIZE: int = Field(default=1000)  # Maior limit aceito por página
+    FLOW_IMPORT_BATCH_SIZE: int = Field(default=1000)  # Fluxos gravados por operação na importação em lote
+    FLOW_EXPORT_BATCH_SIZE: int = Field(default=500)  # Documentos lidos por lote do cursor na exportação
+    
+    # Configurações do cache de respostas do modelo
+    COMPLETION_CACHE_BACKEND: str = Field(default="memory")  # Backend do cache: none, memory, sqlite ou mongo
+    COMPLETION_CACHE_MAX_SIZE: int = Field(default=10000)  # Máximo de respostas no cache em memória
+    COMPLETION_CACHE_SQLITE_PATH: str = Field(default="completion_cache.db")  # Arquivo do cache em SQLite
+    COMPLETION_CACHE_TTL_SECONDS: Optional[float] = Field(default=86400.0)  # TTL padrão (s) das respostas armazenadas
+    MONGODB_COMPLETION_CACHE_COLLECTION: str = Field(default="completion_cache")  # Coleção do cache no MongoDB
+    
+    # Configurações da fila de jobs em segundo plano
+    JOB_STORE_BACKEND: str = Field(default="mongo")  # Armazenamento dos jobs: mongo ou memory
+    JOB_WORKERS: int = Field(default=4)  # Número de workers de jobs por processo (0 apenas enfileira)
+    JOB_POLL_INTERVAL: float = Field(default=1.0)  # Intervalo (s) de consulta por novos jobs
+    JOB_LEASE_SECONDS: float = Field(default=300.0)  # Tempo (s) sem heartbeat para retomar um job
+    MONGODB_JOBS_COLLECTION: str = Field(default="jobs")  # Coleção dos jobs no MongoDB
+    JOB_RETENTION_DAYS: int = Field(default=7)  # Dias até a remoção dos jobs concluídos ou com falha (0 mantém para sempre)
+    
+    # Configurações do limitador de requisições ao modelo (0 desativa o limite)
+    RATE_LIMIT_RPM: int = Field(default=0)  # Requisições por minuto permitidas pelo deployment
+    RATE_LIMIT_TPM: int = Field(default=0)  # Tokens por minuto permitidos pelo deployment
+    RATE_LIMIT_MAX_RETRIES: int = Field(default=5)  # Total de reenvios de uma chamada quando a falha é um 429
+    
+    # Configurações de novas tentativas nas chamadas ao modelo (timeouts, 429 e 5xx)
+    MODEL_MAX_RETRIES: int = Field(default=3)  # Total de novas tentativas de uma chamada (inclui reenvios após 429)
+    MODEL_RETRY_BASE_DELAY: float = Field(default=0.5)  # Espera base (s) do backoff exponencial
+    MODEL_RETRY_MAX_DELAY: float = Field(default=8.0)  # Espera máxima (s) entre tentativas
+    MODEL_CONNECT_TIMEOUT: float = Field(default=10.0)  # Tempo máximo (s) para abrir a conexão com o modelo
+    MODEL_READ_TIMEOUT: float = Field(default=120.0)  # Tempo máximo (s) sem receber dados do modelo
+    
+    # Configurações do roteamento entre deployments do modelo
+    MODEL_ENDPOINTS: str = Field(default="")  # Lista JSON de deployments (vazio usa apenas UFPB_LLM_DEPLOYMENT_NAME_4O)
+    MODEL_DEFAULT: str = Field(default="")  # Modelo dos passos sem o campo model (vazio usa o do primeiro endpoint)
+    MODEL_ROUTING_STRATEGY: str = Field(default="least_outstanding")  # least_outstanding ou headroom
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD: int = Field(default=5)  # Falhas seguidas que abrem o disjuntor de um endpoint
+    CIRCUIT_BREAKER_RESET_SECONDS: float = Field(default=30.0)  # Tempo (s) sem tráfego antes de testar o endpoint novamente
+
+    # Configurações do limite de tokens dos passos
+    MODEL_CONTEXT_TOKENS: int = Field(default=128000)  # Janela de contexto do modelo (prompt + resposta)
+    TOKENIZER_ENCODING: str = Field(default="o200k_base")  # Codificação do tiktoken usada na contagem local
+    TOKEN_LIMIT_POLICY: str = Field(default="reject")  # Política padrão para entradas acima do limite: reject, truncate ou summarize
+
+    # Configurações do histórico de execuções
+    EXECUTION_HISTORY_ENABLED: bool = Field(default=True)  # Registra cada execução de fluxo no MongoDB
+    MONGODB_EXECUTIONS_COLLECTION: str = Field(default="executions")  # Coleção do histórico de execuções
+    EXECUTION_HISTORY_BATCH_SIZE: int = Field(default=100)  # Execuções gravadas por operação
+    EXECUTION_HISTORY_FLUSH_INTERVAL: float = Field(default=1.0)  # Espera máxima (s) antes de gravar um lote incompleto
+    EXECUTION_HISTORY_MAX_QUEUE: int = Field(default=10000)  # Execuções aguardando gravação; acima disso são descartadas
+    EXECUTION_HISTORY_RETENTION_DAYS: int = Field(default=30)  # Dias até a remoção pelo índice TTL (0 mantém para sempre)
+    MODEL_PROMPT_PRICE_PER_1K: float = Field(default=0.0025)  # Custo (USD) de mil tokens de entrada, usado no relatório
+    MODEL_COMPLETION_PRICE_PER_1K: float = Field(default=0.01)  # Custo (USD) de mil tokens gerados, usado no relatório
+
+    # Configurações de tracing das execuções
+    TRACE_EXPORTER: str = Field(default="none")  # Destino dos spans: none, console ou file
+    TRACE_FILE_PATH: str = Field(default="traces.jsonl")  # Arquivo dos spans quando TRACE_EXPORTER=file
     
     # Configurações da aplicação
-    APP_NAME: str = Field(default="Plataforma B3 - IA", env="APP_NAME")  # Nome da aplicação
-    DEBUG: bool = Field(default=False, env="DEBUG")  # Modo de depuração
+    APP_NAME: str = Field(default="Plataforma B3 - IA")  # Nome da aplicação
+    DEBUG: bool = Field(default=False)  # Modo de depuração
+    JSON_FAST_PATH: bool = Field(default=True)  # Usa orjson (se instalado) nas respostas da API e nas chamadas ao modelo
     
     # Configurações adicionais para o carregamento de variáveis de ambiente
-    class Config:
-        env_file = ".env"  # Nome do arquivo de variáveis de ambiente
-        case_sensitive = True  # Sensibilidade a maiúsculas/minúsculas
-        env_file_encoding = 'utf-8'  # Codificação do arquivo de variáveis de ambiente
+    # (cada configuração é lida da variável de mesmo nome)
+    model_config = SettingsConfigDict(
+        env_file=".env",  # Nome do arquivo de variáveis de ambiente
+        case_sensitive=True,  # Sensibilidade a maiúsculas/minúsculas
+        env_file_encoding='utf-8'  # Codificação do arquivo de variáveis de ambiente
+    )
 
 # Instancia as configurações para uso na aplicação
 settings = Settings() 
\ No newline at end of file
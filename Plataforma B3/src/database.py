@@ -2,14 +2,18 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo import MongoClient
 from typing import AsyncGenerator, Generator
 from config import settings
+from metrics import MongoCommandMetrics
+
+# Registra a latência de cada comando enviado ao MongoDB (métricas do Prometheus)
+mongo_listeners = [MongoCommandMetrics()]
 
 # Cliente síncrono para operações que não precisam ser assíncronas
-client = MongoClient(settings.MONGODB_URL)
+client = MongoClient(settings.MONGODB_URL, event_listeners=mongo_listeners)
 db = client[settings.MONGODB_DB]
 collection = db[settings.MONGODB_COLLECTION]
 
 # Cliente assíncrono para operações assíncronas
-async_client = AsyncIOMotorClient(settings.MONGODB_URL)
+async_client = AsyncIOMotorClient(settings.MONGODB_URL, event_listeners=mongo_listeners)
 async_db = async_client[settings.MONGODB_DB]
 async_collection = async_db[settings.MONGODB_COLLECTION]
 
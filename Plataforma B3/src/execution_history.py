@@ -0,0 +1,304 @@
+import asyncio
+import hashlib
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+import logging
+
+from pymongo import DESCENDING
+from pymongo.errors import BulkWriteError
+
+from config import settings
+from metrics import EXECUTION_HISTORY_RECORDS
+
+# Configuração básica de logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Campos omitidos na listagem de execuções; o detalhe por passo fica em get_execution
+EXECUTION_LIST_PROJECTION = {"steps": 0}
+
+# Hash dos prompts e entradas: o histórico guarda a identidade do texto, não cópias dele
+def hash_text(text: Optional[str]) -> Optional[str]:
+    if text is None:
+        return None
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+# Converte datas com fuso para UTC sem fuso, o formato gravado no MongoDB
+def to_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+# Registro compacto de um passo executado
+def build_step_record(
+    step_name: str,
+    messages: List[Dict[str, str]],
+    status: str,
+    duration: float,
+    usage: Optional[Dict[str, Any]] = None,
+    cached: bool = False,
+    resumed: bool = False,
+    error: Optional[str] = None
+) -> Dict[str, Any]:
+    usage = usage or {}
+    return {
+        "step_name": step_name,
+        "status": status,
+        "duration_ms": round(duration * 1000, 3),
+        "prompt_hash": hash_text(messages[0]["content"]),
+        "input_hash": hash_text(messages[1]["content"]),
+        "prompt_tokens": usage.get("prompt_tokens"),
+        "completion_tokens": usage.get("completion_tokens"),
+        "cached": cached,
+        "resumed": resumed,
+        "error": error
+    }
+
+# Registro de uma execução de fluxo, com os totais de tokens dos passos
+def build_execution_record(
+    execution_id: str,
+    flow_id: Optional[str],
+    flow_name: str,
+    flow_version: Optional[int],
+    user_message: str,
+    steps: List[Dict[str, Any]],
+    status: str,
+    started_at: datetime,
+    duration: float,
+    error: Optional[str] = None
+) -> Dict[str, Any]:
+    prompt_tokens = sum(step["prompt_tokens"] or 0 for step in steps)
+    completion_tokens = sum(step["completion_tokens"] or 0 for step in steps)
+    record = {
+        "_id": execution_id,
+        "flow_id": flow_id,
+        "flow_name": flow_name,
+        "flow_version": flow_version,
+        "status": status,
+        "error": error,
+        "started_at": started_at,
+        "finished_at": started_at + timedelta(seconds=duration),
+        "duration_ms": round(duration * 1000, 3),
+        "user_message_hash": hash_text(user_message),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "steps": steps
+    }
+    # Removidas pelo índice TTL de expires_at; sem o campo, a execução é mantida
+    if settings.EXECUTION_HISTORY_RETENTION_DAYS > 0:
+        record["expires_at"] = started_at + timedelta(days=settings.EXECUTION_HISTORY_RETENTION_DAYS)
+    return record
+
+def new_execution_id() -> str:
+    return uuid.uuid4().hex
+
+# Grava as execuções em lotes, em segundo plano, para que a requisição nunca espere pelo banco.
+# Se a fila encher (banco lento ou indisponível), novos registros são descartados.
+class ExecutionRecorder:
+    def __init__(self, collection, batch_size: int = 100, flush_interval: float = 1.0, max_queue: int = 10000):
+        if batch_size < 1:
+            raise ValueError("O tamanho do lote deve ser pelo menos 1")
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+
+    # Enfileira uma execução sem bloquear; retorna False se ela foi descartada
+    def record(self, execution: Dict[str, Any]) -> bool:
+        try:
+            self._queue.put_nowait(execution)
+            return True
+        except asyncio.QueueFull:
+            EXECUTION_HISTORY_RECORDS.labels(result="dropped").inc()
+            logger.warning(f"Fila do histórico cheia; execução {execution['_id']} descartada")
+            return False
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+        logger.info("Gravação do histórico de execuções iniciada")
+
+    # Interrompe a gravação em segundo plano e grava o que ainda estiver na fila
+    async def stop(self):
+        if self._task is not None:
+            # A sentinela encerra o laço depois de gravar o lote em andamento; o laço não é
+            # cancelado porque wait_for pode descartar o cancelamento e deixá-lo preso em get()
+            await self._queue.put(None)
+            await self._task
+            self._task = None
+        remaining = []
+        while not self._queue.empty():
+            execution = self._queue.get_nowait()
+            if execution is not None:
+                remaining.append(execution)
+        for start in range(0, len(remaining), self.batch_size):
+            await self._write(remaining[start:start + self.batch_size])
+        logger.info("Gravação do histórico de execuções encerrada")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            execution = await self._queue.get()
+            if execution is None:
+                return
+            batch = [execution]
+            # Completa o lote até batch_size ou até flush_interval após o primeiro registro
+            flush_at = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = flush_at - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    execution = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+                if execution is None:
+                    stopping = True
+                    break
+                batch.append(execution)
+            await self._write(batch)
+
+    async def _write(self, batch: List[Dict[str, Any]]):
+        try:
+            await self.collection.insert_many(batch, ordered=False)
+            EXECUTION_HISTORY_RECORDS.labels(result="written").inc(len(batch))
+        except BulkWriteError as e:
+            failed = len(e.details.get("writeErrors", []))
+            EXECUTION_HISTORY_RECORDS.labels(result="written").inc(len(batch) - failed)
+            EXECUTION_HISTORY_RECORDS.labels(result="failed").inc(failed)
+            logger.error(f"Erro ao gravar {failed} execuções no histórico: {str(e)}")
+        except Exception as e:
+            # O histórico não deve interromper a gravação dos próximos lotes
+            EXECUTION_HISTORY_RECORDS.labels(result="failed").inc(len(batch))
+            logger.error(f"Erro ao gravar o histórico de execuções: {str(e)}")
+
+# Cria o gravador do histórico, ou None se o histórico estiver desativado
+def create_execution_recorder() -> Optional[ExecutionRecorder]:
+    if not settings.EXECUTION_HISTORY_ENABLED:
+        return None
+    from database import async_db
+    return ExecutionRecorder(
+        async_db[settings.MONGODB_EXECUTIONS_COLLECTION],
+        batch_size=settings.EXECUTION_HISTORY_BATCH_SIZE,
+        flush_interval=settings.EXECUTION_HISTORY_FLUSH_INTERVAL,
+        max_queue=settings.EXECUTION_HISTORY_MAX_QUEUE
+    )
+
+# Filtro por fluxo, status e intervalo de started_at
+def execution_filter(
+    flow_id: Optional[str] = None,
+    status: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> Dict[str, Any]:
+    query: Dict[str, Any] = {}
+    if flow_id is not None:
+        query["flow_id"] = flow_id
+    if status is not None:
+        query["status"] = status
+    started_at: Dict[str, Any] = {}
+    if start is not None:
+        started_at["$gte"] = to_utc(start)
+    if end is not None:
+        started_at["$lt"] = to_utc(end)
+    if started_at:
+        query["started_at"] = started_at
+    return query
+
+# Cursor de paginação: started_at e _id da última execução da página
+def encode_cursor(execution: Dict[str, Any]) -> str:
+    return f"{execution['started_at'].isoformat()}|{execution['_id']}"
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        started_at, execution_id = cursor.split("|", 1)
+        started_at = datetime.fromisoformat(started_at)
+    except ValueError:
+        raise ValueError(f"Cursor inválido: {cursor}")
+    # Execuções anteriores à última retornada, desempatando pelo _id
+    return {"$or": [
+        {"started_at": {"$lt": started_at}},
+        {"started_at": started_at, "_id": {"$lt": execution_id}}
+    ]}
+
+# Lista as execuções das mais recentes para as mais antigas, paginando por cursor
+async def list_executions(
+    collection,
+    flow_id: Optional[str] = None,
+    status: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None
+) -> Dict[str, Any]:
+    query = execution_filter(flow_id, status, start, end)
+    if cursor:
+        query = {"$and": [query, decode_cursor(cursor)]}
+
+    executions = await collection.find(query, EXECUTION_LIST_PROJECTION) \
+        .sort([("started_at", DESCENDING), ("_id", DESCENDING)]) \
+        .limit(limit) \
+        .to_list(length=limit)
+
+    next_cursor = encode_cursor(executions[-1]) if len(executions) == limit else None
+    for execution in executions:
+        execution["execution_id"] = execution.pop("_id")
+    return {"executions": executions, "next_cursor": next_cursor}
+
+# Obtém uma execução com o detalhe de cada passo
+async def get_execution(collection, execution_id: str) -> Optional[Dict[str, Any]]:
+    execution = await collection.find_one({"_id": execution_id})
+    if execution is not None:
+        execution["execution_id"] = execution.pop("_id")
+    return execution
+
+# Pipeline do relatório de custo e latência por fluxo
+def execution_report_pipeline(
+    flow_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> List[Dict[str, Any]]:
+    prompt_price = settings.MODEL_PROMPT_PRICE_PER_1K / 1000
+    completion_price = settings.MODEL_COMPLETION_PRICE_PER_1K / 1000
+    return [
+        {"$match": execution_filter(flow_id=flow_id, start=start, end=end)},
+        {"$group": {
+            "_id": "$flow_id",
+            "flow_name": {"$last": "$flow_name"},
+            "executions": {"$sum": 1},
+            "errors": {"$sum": {"$cond": [{"$eq": ["$status", "success"]}, 0, 1]}},
+            "avg_duration_ms": {"$avg": "$duration_ms"},
+            "max_duration_ms": {"$max": "$duration_ms"},
+            "prompt_tokens": {"$sum": "$prompt_tokens"},
+            "completion_tokens": {"$sum": "$completion_tokens"}
+        }},
+        {"$project": {
+            "_id": 0,
+            "flow_id": "$_id",
+            "flow_name": 1,
+            "executions": 1,
+            "errors": 1,
+            "avg_duration_ms": 1,
+            "max_duration_ms": 1,
+            "prompt_tokens": 1,
+            "completion_tokens": 1,
+            "cost": {"$add": [
+                {"$multiply": ["$prompt_tokens", prompt_price]},
+                {"$multiply": ["$completion_tokens", completion_price]}
+            ]}
+        }},
+        {"$sort": {"cost": DESCENDING}}
+    ]
+
+# Agrega custo e latência das execuções por fluxo no próprio MongoDB
+async def execution_report(
+    collection,
+    flow_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> List[Dict[str, Any]]:
+    pipeline = execution_report_pipeline(flow_id, start, end)
+    return await collection.aggregate(pipeline).to_list(length=None)
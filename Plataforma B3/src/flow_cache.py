@@ -0,0 +1,155 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, Optional
+import logging
+
+from pymongo.errors import OperationFailure
+
+from config import settings
+from metrics import record_cache_lookup
+
+if TYPE_CHECKING:
+    from flow_manager import Flow
+
+# Configuração básica de logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Cache em memória (LRU com TTL) de fluxos já validados, indexado pelo ID do fluxo
+class FlowCache:
+    def __init__(self, max_size: int = 1000, ttl_seconds: float = 300.0):
+        if max_size < 1:
+            raise ValueError("O tamanho máximo do cache deve ser pelo menos 1")
+
+        self.max_size = max_size  # Número máximo de fluxos mantidos no cache
+        self.ttl_seconds = ttl_seconds  # Tempo de vida de cada entrada (0 desativa a expiração)
+        self._entries: OrderedDict = OrderedDict()  # flow_id -> (expira em, fluxo)
+        self._lock = threading.Lock()  # O cache é usado tanto pela API quanto pelo Streamlit
+
+        # Gerações das invalidações: um preenchimento iniciado antes da invalidação do mesmo
+        # fluxo (ou de um clear) leu uma versão que pode estar desatualizada e é descartado
+        self._generation = 0
+        self._invalidated: OrderedDict = OrderedDict()  # flow_id -> geração da última invalidação
+        self._stale_before = 0  # Preenchimentos de gerações anteriores são descartados
+
+        # Contadores para acompanhar a eficácia do cache
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_fills = 0
+
+    # Obtém um fluxo do cache, ou None se ausente ou expirado
+    def get(self, flow_id: str) -> Optional["Flow"]:
+        with self._lock:
+            entry = self._entries.get(flow_id)
+            if entry is None:
+                self.misses += 1
+                record_cache_lookup("flow", hit=False)
+                return None
+
+            expires_at, flow = entry
+            if self.ttl_seconds and expires_at < time.monotonic():
+                del self._entries[flow_id]
+                self.evictions += 1
+                self.misses += 1
+                record_cache_lookup("flow", hit=False)
+                return None
+
+            self._entries.move_to_end(flow_id)
+            self.hits += 1
+            record_cache_lookup("flow", hit=True)
+            return flow
+
+    # Geração atual, obtida antes de ler o fluxo do banco e repassada a set
+    def begin_fill(self) -> int:
+        with self._lock:
+            return self._generation
+
+    # Armazena um fluxo no cache, removendo o menos usado recentemente se necessário.
+    # Com generation, a escrita é descartada se o fluxo foi invalidado depois dessa geração.
+    def set(self, flow_id: str, flow: "Flow", generation: Optional[int] = None):
+        with self._lock:
+            if generation is not None and (
+                generation < self._stale_before or generation < self._invalidated.get(flow_id, 0)
+            ):
+                self.stale_fills += 1
+                return
+            self._entries[flow_id] = (time.monotonic() + self.ttl_seconds, flow)
+            self._entries.move_to_end(flow_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    # Remove um fluxo do cache
+    def invalidate(self, flow_id: str):
+        with self._lock:
+            self._generation += 1
+            self._invalidated[flow_id] = self._generation
+            self._invalidated.move_to_end(flow_id)
+            if len(self._invalidated) > self.max_size:
+                # Registro mais antigo esquecido: preenchimentos até ele passam a ser descartados
+                _, generation = self._invalidated.popitem(last=False)
+                self._stale_before = max(self._stale_before, generation)
+            if self._entries.pop(flow_id, None) is not None:
+                self.invalidations += 1
+
+    # Remove todos os fluxos do cache
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._stale_before = self._generation
+            self._invalidated.clear()
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    # Retorna os contadores do cache
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "stale_fills": self.stale_fills,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+# Observa o change stream da coleção de fluxos e invalida o cache local
+# quando outra réplica da API altera ou remove um fluxo
+async def watch_flow_changes(collection, cache: FlowCache, retry_delay: float = 5.0):
+    while True:
+        try:
+            async with collection.watch() as stream:
+                logger.info("Observando alterações na coleção de fluxos")
+                async for change in stream:
+                    operation = change.get("operationType")
+                    if operation in ("drop", "dropDatabase", "rename", "invalidate"):
+                        cache.clear()
+                    else:
+                        flow_id = change.get("documentKey", {}).get("_id")
+                        if flow_id is not None:
+                            cache.invalidate(flow_id)
+        except asyncio.CancelledError:
+            raise
+        except (OperationFailure, NotImplementedError) as e:
+            # Change streams exigem replica set; sem ele, o cache depende apenas do TTL
+            logger.warning(f"Change stream indisponível, o cache de fluxos usará apenas o TTL: {str(e)}")
+            return
+        except Exception as e:
+            logger.error(f"Erro no change stream de fluxos: {str(e)}")
+
+        # Entradas podem ter sido alteradas enquanto o stream estava fora do ar
+        cache.clear()
+        await asyncio.sleep(retry_delay)
+
+# Instância compartilhada do cache de fluxos
+flow_cache = FlowCache(
+    max_size=settings.FLOW_CACHE_MAX_SIZE,
+    ttl_seconds=settings.FLOW_CACHE_TTL_SECONDS
+)
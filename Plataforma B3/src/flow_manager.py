@@ -1,7 +1,12 @@
-from typing import List, Dict, Any, Optional
-from pydantic import BaseModel, Field, validator
+from typing import AsyncIterable, AsyncIterator, Callable, List, Dict, Any, Optional, Tuple
+from pydantic import BaseModel, Field, PrivateAttr, ValidationInfo, field_validator
+from pymongo import ReturnDocument, UpdateOne
 from pymongo.collection import Collection
-from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from motor.motor_asyncio import AsyncIOMotorCollection
+from flow_cache import FlowCache
+from prompt_template import PromptTemplate, compile_prompts
+from tracing import tracer
 import re
 from datetime import datetime
 import logging
@@ -10,6 +15,15 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Políticas para entradas de passo acima do limite de tokens:
+# reject falha antes de chamar o modelo, truncate corta o fim da entrada
+# e summarize pede ao modelo um resumo que caiba no limite
+INPUT_POLICIES = ("reject", "truncate", "summarize")
+
+# Expressões dos nomes de fluxos e passos e dos IDs, compiladas uma única vez
+NAME_PATTERN = re.compile(r'^[a-zA-Z0-9_\s\-]+$')
+FLOW_ID_PATTERN = re.compile(r'^[a-zA-Z0-9_]+$')
+
 # Classe que representa um passo de um fluxo
 class FlowStep(BaseModel):
     system_prompt: str = Field(..., min_length=1)  # Prompt do sistema para o passo
@@ -17,125 +31,584 @@ class FlowStep(BaseModel):
     step_order: int = Field(..., ge=1)  # Ordem do passo no fluxo
     max_tokens: Optional[int] = Field(default=100, ge=1)  # Máximo de tokens permitidos
     temperature: Optional[float] = Field(default=0.7, ge=0.0, le=1.0)  # Temperatura do modelo
+    cache_enabled: Optional[bool] = None  # Usa o cache de respostas (None herda a configuração do fluxo)
+    cache_ttl_seconds: Optional[float] = Field(default=None, ge=0)  # TTL das respostas deste passo no cache
+    depends_on: Optional[List[str]] = None  # Entradas do passo: "user_message" e/ou nomes de passos anteriores (None usa o passo anterior)
+    timeout_seconds: Optional[float] = Field(default=None, gt=0)  # Tempo máximo (s) do passo, incluindo novas tentativas
+    max_input_tokens: Optional[int] = Field(default=None, ge=1)  # Limite de tokens do prompt (None usa o contexto do modelo menos max_tokens)
+    input_policy: Optional[str] = None  # Política para entradas acima do limite (None usa TOKEN_LIMIT_POLICY)
+    model: Optional[str] = None  # Modelo dos deployments que atendem o passo (None usa MODEL_DEFAULT)
+    coalesce_requests: bool = False  # Compartilha chamadas idênticas em andamento (apenas passos com temperatura 0)
 
     # Validador para o nome do passo
-    @validator('step_name')
+    @field_validator('step_name')
+    @classmethod
     def validate_step_name(cls, v):
-        if not re.match(r'^[a-zA-Z0-9_\s\-]+$', v):
+        if not NAME_PATTERN.match(v):
             raise ValueError('O nome do passo deve conter apenas letras, números, espaços, underscores e hífens')
         return v
 
+    # Validador para a política de limite de tokens
+    @field_validator('input_policy')
+    @classmethod
+    def validate_input_policy(cls, v):
+        if v is not None and v not in INPUT_POLICIES:
+            raise ValueError(f"A política de entrada deve ser uma de: {', '.join(INPUT_POLICIES)}")
+        return v
+
+    # Validador da coalescência: respostas compartilhadas só são equivalentes em passos determinísticos
+    @field_validator('coalesce_requests')
+    @classmethod
+    def validate_coalesce_requests(cls, v, info: ValidationInfo):
+        if v and info.data.get('temperature') != 0:
+            raise ValueError('A coalescência de chamadas exige temperatura 0')
+        return v
+
 # Classe que representa um fluxo
 class Flow(BaseModel):
     name: str = Field(..., min_length=1)  # Nome do fluxo
     description: Optional[str] = None  # Descrição do fluxo
-    steps: List[FlowStep] = Field(..., min_items=1)  # Lista de passos do fluxo
+    steps: List[FlowStep] = Field(..., min_length=1)  # Lista de passos do fluxo
     is_active: bool = True  # Indica se o fluxo está ativo
+    cache_enabled: bool = False  # Usa o cache de respostas nos passos determinísticos (temperatura 0)
+    cache_ttl_seconds: Optional[float] = Field(default=None, ge=0)  # TTL padrão das respostas do fluxo no cache
+    timeout_seconds: Optional[float] = Field(default=None, gt=0)  # Tempo máximo (s) de uma execução do fluxo
+    flow_id: Optional[str] = None  # ID do documento no MongoDB (preenchido ao carregar; não é armazenado)
+    version: Optional[int] = None  # Versão do documento, incrementada a cada atualização (controle de concorrência otimista)
+    _prompt_templates: Optional[Dict[str, PromptTemplate]] = PrivateAttr(default=None)  # Prompts compilados, por nome do passo
+    _token_plan: Optional[Tuple[Any, Any]] = PrivateAttr(default=None)  # (chave, contagens fixas de tokens dos passos)
 
     # Validador para o nome do fluxo
-    @validator('name')
+    @field_validator('name')
+    @classmethod
     def validate_name(cls, v):
-        if not re.match(r'^[a-zA-Z0-9_\s\-]+$', v):
+        if not NAME_PATTERN.match(v):
             raise ValueError('O nome do fluxo deve conter apenas letras, números, espaços, underscores e hífens')
         return v
 
+    # Prompts dos passos compilados na primeira execução. A instância do fluxo fica no
+    # FlowCache até a próxima versão, então cada versão é compilada uma única vez
+    def prompt_templates(self) -> Dict[str, PromptTemplate]:
+        if self._prompt_templates is None:
+            self._prompt_templates = compile_prompts(self.steps)
+        return self._prompt_templates
+
+    # Contagens de tokens que não mudam entre execuções (prompts sem os campos, cabeçalhos
+    # e limites dos passos), montadas por build na primeira projeção e mantidas com o fluxo
+    # como os prompts compilados. A chave identifica o contador usado; outra chave remonta.
+    def token_plan(self, key: Any, build: Callable[["Flow"], Any]) -> Any:
+        if self._token_plan is None or self._token_plan[0] is not key:
+            self._token_plan = (key, build(self))
+        return self._token_plan[1]
+
+# Funções auxiliares compartilhadas pelos gerenciadores síncrono e assíncrono
+
+# Valida o formato do ID do fluxo
+def validate_flow_id(flow_id: str):
+    if not FLOW_ID_PATTERN.match(flow_id):
+        raise ValueError('O ID do fluxo deve conter apenas letras, números e underscores')
+
+# Nome reservado para a mensagem do usuário nas dependências dos passos
+USER_MESSAGE_INPUT = "user_message"
+
+# Resolve as entradas de cada passo. Passos sem depends_on recebem a saída
+# do passo anterior (ou a mensagem do usuário, no caso do primeiro passo).
+def resolve_step_dependencies(steps: List[FlowStep]) -> Dict[str, List[str]]:
+    dependencies = {}
+    previous = USER_MESSAGE_INPUT
+    for step in sorted(steps, key=lambda x: x.step_order):
+        if step.depends_on is None:
+            dependencies[step.step_name] = [previous]
+        else:
+            dependencies[step.step_name] = list(step.depends_on) or [USER_MESSAGE_INPUT]
+        previous = step.step_name
+    return dependencies
+
+# Passos que cada passo aguarda antes de executar: suas entradas e os passos cujas
+# saídas são usadas no prompt ({{steps.nome}}), que não entram na mensagem do usuário
+def resolve_step_waits(dependencies: Dict[str, List[str]], templates: Dict[str, PromptTemplate]) -> Dict[str, List[str]]:
+    return {
+        step_name: list(dict.fromkeys([*inputs, *templates[step_name].step_references]))
+        for step_name, inputs in dependencies.items()
+    }
+
+# Valida os passos do fluxo: ordens e nomes únicos, dependências existentes (inclusive as
+# dos templates de prompt) e ausência de ciclos
+def validate_step_orders(steps: List[FlowStep]):
+    step_orders = [step.step_order for step in steps]
+    if len(set(step_orders)) != len(step_orders):
+        raise ValueError("Ordens de passos devem ser únicas")
+    
+    step_names = [step.step_name for step in steps]
+    if len(set(step_names)) != len(step_names):
+        raise ValueError("Nomes de passos devem ser únicos")
+    if USER_MESSAGE_INPUT in step_names:
+        raise ValueError(f"O nome de passo '{USER_MESSAGE_INPUT}' é reservado")
+    
+    dependencies = resolve_step_dependencies(steps)
+    for step_name, inputs in dependencies.items():
+        for dependency in inputs:
+            if dependency != USER_MESSAGE_INPUT and dependency not in dependencies:
+                raise ValueError(f"O passo '{step_name}' depende de um passo inexistente: '{dependency}'")
+    
+    templates = compile_prompts(steps)
+    for step_name, template in templates.items():
+        for reference in template.step_references:
+            if reference not in dependencies:
+                raise ValueError(f"O prompt do passo '{step_name}' usa a saída de um passo inexistente: '{reference}'")
+            if reference == step_name:
+                raise ValueError(f"O prompt do passo '{step_name}' não pode usar a própria saída")
+    dependencies = resolve_step_waits(dependencies, templates)
+    
+    # Busca em profundidade para detectar ciclos entre os passos
+    visiting, visited = set(), set()
+    
+    def visit(step_name: str):
+        if step_name in visited or step_name == USER_MESSAGE_INPUT:
+            return
+        if step_name in visiting:
+            raise ValueError(f"Dependência circular envolvendo o passo '{step_name}'")
+        visiting.add(step_name)
+        for dependency in dependencies[step_name]:
+            visit(dependency)
+        visiting.remove(step_name)
+        visited.add(step_name)
+    
+    for step_name in dependencies:
+        visit(step_name)
+
+# Converte um fluxo no documento armazenado no MongoDB (sem _id e created_at)
+def flow_to_document(flow: Flow) -> Dict[str, Any]:
+    return {
+        "name": flow.name,
+        "description": flow.description,
+        "steps": [step.model_dump() for step in flow.steps],
+        "is_active": flow.is_active,
+        "cache_enabled": flow.cache_enabled,
+        "cache_ttl_seconds": flow.cache_ttl_seconds,
+        "timeout_seconds": flow.timeout_seconds,
+        "updated_at": datetime.utcnow()
+    }
+
+# Reconstrói um fluxo a partir do documento armazenado no MongoDB. O documento inteiro,
+# passos incluídos, é validado em uma única chamada ao núcleo compilado do Pydantic,
+# sem criar cada FlowStep em Python (ver benchmarks/bench_validation.py)
+def flow_from_document(flow_dict: Dict[str, Any]) -> Flow:
+    return Flow.model_validate({
+        "name": flow_dict["name"],
+        "description": flow_dict["description"],
+        "steps": flow_dict["steps"],
+        "is_active": flow_dict["is_active"],
+        "cache_enabled": flow_dict.get("cache_enabled", False),
+        "cache_ttl_seconds": flow_dict.get("cache_ttl_seconds"),
+        "timeout_seconds": flow_dict.get("timeout_seconds"),
+        "flow_id": str(flow_dict["_id"]) if "_id" in flow_dict else None,
+        "version": flow_dict.get("version", 0)
+    })
+
+# Converte um documento no resumo usado na listagem de fluxos
+def flow_summary(flow: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": flow["_id"],
+        "name": flow["name"],
+        "description": flow["description"],
+        "steps_count": flow["steps_count"],
+        "is_active": flow["is_active"]
+    }
+
+# Fluxo inexistente; herda de ValueError, como os demais erros dos gerenciadores
+class FlowNotFoundError(ValueError):
+    def __init__(self, flow_id: str):
+        super().__init__(f"Fluxo com ID {flow_id} não encontrado")
+
+# Criação de um fluxo com ID já usado por outro
+class FlowAlreadyExistsError(ValueError):
+    def __init__(self, flow_id: str):
+        super().__init__(f"Fluxo com ID {flow_id} já existe")
+
+# Atualização rejeitada porque o fluxo foi alterado por outro escritor
+class FlowVersionConflictError(ValueError):
+    def __init__(self, flow_id: str, expected_version: int, current_version: int):
+        super().__init__(
+            f"Fluxo com ID {flow_id} foi alterado por outra requisição "
+            f"(versão esperada {expected_version}, versão atual {current_version})"
+        )
+        self.current_version = current_version
+
+# Filtro de escrita que só corresponde à versão esperada do fluxo.
+# Documentos gravados antes do controle de versão, sem o campo, equivalem à versão 0.
+def flow_version_filter(flow_id: str, expected_version: Optional[int] = None) -> Dict[str, Any]:
+    query: Dict[str, Any] = {"_id": flow_id}
+    if expected_version is not None:
+        query["version"] = {"$in": [0, None]} if expected_version == 0 else expected_version
+    return query
+
+# Erro de uma atualização que não encontrou o fluxo na versão esperada
+def update_failure(flow_id: str, expected_version: Optional[int], current: Optional[Dict[str, Any]]) -> ValueError:
+    if current is None:
+        return FlowNotFoundError(flow_id)
+    return FlowVersionConflictError(flow_id, expected_version, current.get("version", 0))
+
+# Filtro das consultas de listagem e exportação de fluxos
+def flow_list_filter(
+    after: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    name_prefix: Optional[str] = None
+) -> Dict[str, Any]:
+    match: Dict[str, Any] = {}
+    if after is not None:
+        match["_id"] = {"$gt": after}
+    if is_active is not None:
+        match["is_active"] = is_active
+    if name_prefix:
+        # Expressão ancorada no início, que pode usar o índice do campo name
+        match["name"] = {"$regex": f"^{re.escape(name_prefix)}"}
+    return match
+
+# Campos omitidos na exportação: são recriados pela importação
+EXPORT_EXCLUDED_FIELDS = {"created_at": 0, "updated_at": 0, "version": 0}
+
+# Ordem da exportação, pelo índice do _id
+EXPORT_SORT = [("_id", 1)]
+
+# Converte um documento no registro de exportação (o _id vai em flow_id)
+def flow_to_record(flow: Dict[str, Any]) -> Dict[str, Any]:
+    record = {"flow_id": flow["_id"]}
+    record.update((key, value) for key, value in flow.items() if key != "_id")
+    return record
+
+# Valida um registro de importação e monta o documento a ser gravado
+def flow_document_from_record(record: Any) -> Tuple[str, Dict[str, Any]]:
+    if not isinstance(record, dict):
+        raise ValueError("Cada registro deve ser um objeto JSON")
+    
+    data = dict(record)
+    flow_id = data.pop("flow_id", None)
+    if not isinstance(flow_id, str):
+        raise ValueError("O campo flow_id é obrigatório")
+    validate_flow_id(flow_id)
+    data.pop("version", None)
+    
+    flow = Flow(**data)
+    validate_step_orders(flow.steps)
+    
+    flow_dict = flow_to_document(flow)
+    flow_dict["_id"] = flow_id
+    return flow_id, flow_dict
+
+# Monta a agregação da listagem de fluxos: filtros, paginação por cursor (keyset)
+# sobre o _id e projeção que conta os passos no servidor, sem trafegar os prompts
+def flow_list_pipeline(
+    limit: Optional[int] = None,
+    after: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    name_prefix: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    match = flow_list_filter(after=after, is_active=is_active, name_prefix=name_prefix)
+    
+    pipeline: List[Dict[str, Any]] = []
+    if match:
+        pipeline.append({"$match": match})
+    pipeline.append({"$sort": {"_id": 1}})
+    if limit is not None:
+        pipeline.append({"$limit": limit})
+    pipeline.append({"$project": {
+        "name": 1,
+        "description": 1,
+        "is_active": 1,
+        "steps_count": {"$size": {"$ifNull": ["$steps", []]}}
+    }})
+    return pipeline
+
 # Classe para gerenciar fluxos
 class FlowManager:
-    def __init__(self, collection: Collection):
+    def __init__(self, collection: Collection, cache: Optional[FlowCache] = None):
         self.collection = collection  # Coleção do MongoDB onde os fluxos são armazenados
+        self.cache = cache  # Cache opcional de fluxos já validados
 
-    # Valida a ordem dos passos para garantir que são únicas e sequenciais
+    # Valida as ordens e as dependências dos passos (sem ciclos)
     def validate_step_orders(self, steps: List[FlowStep]):
-        step_orders = [step.step_order for step in steps]
-        if len(set(step_orders)) != len(step_orders):
-            raise ValueError("Ordens de passos devem ser únicas")
-        if sorted(step_orders) != list(range(1, len(step_orders) + 1)):
-            raise ValueError("Ordens de passos devem ser sequenciais começando de 1")
+        validate_step_orders(steps)
+
+    # Remove o fluxo do cache local após uma escrita
+    def _invalidate(self, flow_id: str):
+        if self.cache is not None:
+            self.cache.invalidate(flow_id)
 
     # Cria um novo fluxo
     def create_flow(self, flow_id: str, flow: Flow) -> Flow:
         logger.info(f"Tentando criar fluxo com ID: {flow_id}")
         
-        if not re.match(r'^[a-zA-Z0-9_]+$', flow_id):
-            raise ValueError('O ID do fluxo deve conter apenas letras, números e underscores')
-        
-        if self.collection.find_one({"_id": flow_id}):
-            raise ValueError(f"Fluxo com ID {flow_id} já existe")
-        
+        validate_flow_id(flow_id)
         self.validate_step_orders(flow.steps)
         
-        flow_dict = {
-            "_id": flow_id,
-            "name": flow.name,
-            "description": flow.description,
-            "steps": [step.dict() for step in flow.steps],
-            "is_active": flow.is_active,
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
-        }
+        flow_dict = flow_to_document(flow)
+        flow_dict["_id"] = flow_id
+        flow_dict["created_at"] = flow_dict["updated_at"]
+        flow_dict["version"] = 1
         
-        self.collection.insert_one(flow_dict)
+        # A unicidade do _id é garantida pelo próprio MongoDB, em uma única operação
+        try:
+            self.collection.insert_one(flow_dict)
+        except DuplicateKeyError:
+            raise FlowAlreadyExistsError(flow_id)
         logger.info(f"Fluxo criado com sucesso: {flow_id}")
-        return flow
+        return flow.model_copy(update={"flow_id": flow_id, "version": 1})
 
     # Obtém um fluxo pelo ID
     def get_flow(self, flow_id: str) -> Flow:
-        logger.info(f"Obtendo fluxo com ID: {flow_id}")
-        flow_dict = self.collection.find_one({"_id": flow_id})
-        if not flow_dict:
-            raise ValueError(f"Fluxo com ID {flow_id} não encontrado")
-        
-        return Flow(
-            name=flow_dict["name"],
-            description=flow_dict["description"],
-            steps=[FlowStep(**step) for step in flow_dict["steps"]],
-            is_active=flow_dict["is_active"]
-        )
+        with tracer.start_span("flow_manager.get_flow", {"flow_id": flow_id}) as span:
+            generation = None
+            if self.cache is not None:
+                flow = self.cache.get(flow_id)
+                span.set_attribute("cache_hit", flow is not None)
+                if flow is not None:
+                    return flow
+                generation = self.cache.begin_fill()
+            
+            logger.info(f"Obtendo fluxo com ID: {flow_id}")
+            flow_dict = self.collection.find_one({"_id": flow_id})
+            if not flow_dict:
+                raise FlowNotFoundError(flow_id)
+            
+            flow = flow_from_document(flow_dict)
+            if self.cache is not None:
+                self.cache.set(flow_id, flow, generation)
+            return flow
 
-    # Atualiza um fluxo existente
-    def update_flow(self, flow_id: str, flow: Flow) -> Flow:
+    # Atualiza um fluxo existente; com expected_version, só atualiza se o fluxo ainda estiver nessa versão
+    def update_flow(self, flow_id: str, flow: Flow, expected_version: Optional[int] = None) -> Flow:
         logger.info(f"Tentando atualizar fluxo com ID: {flow_id}")
         
-        if not self.collection.find_one({"_id": flow_id}):
-            raise ValueError(f"Fluxo com ID {flow_id} não encontrado")
-        
         self.validate_step_orders(flow.steps)
         
-        flow_dict = {
-            "name": flow.name,
-            "description": flow.description,
-            "steps": [step.dict() for step in flow.steps],
-            "is_active": flow.is_active,
-            "updated_at": datetime.utcnow()
-        }
-        
-        self.collection.update_one(
-            {"_id": flow_id},
-            {"$set": flow_dict}
+        updated = self.collection.find_one_and_update(
+            flow_version_filter(flow_id, expected_version),
+            {"$set": flow_to_document(flow), "$inc": {"version": 1}},
+            projection={"version": 1},
+            return_document=ReturnDocument.AFTER
         )
+        self._invalidate(flow_id)
+        if updated is None:
+            # Consulta extra apenas no caminho de erro, para diferenciar ausência de conflito
+            current = self.collection.find_one({"_id": flow_id}, {"version": 1})
+            raise update_failure(flow_id, expected_version, current)
         
         logger.info(f"Fluxo atualizado com sucesso: {flow_id}")
-        return flow
+        return flow.model_copy(update={"flow_id": flow_id, "version": updated["version"]})
 
     # Remove um fluxo
     def delete_flow(self, flow_id: str):
         logger.info(f"Tentando excluir fluxo com ID: {flow_id}")
         result = self.collection.delete_one({"_id": flow_id})
+        self._invalidate(flow_id)
         if result.deleted_count == 0:
-            raise ValueError(f"Fluxo com ID {flow_id} não encontrado")
+            raise FlowNotFoundError(flow_id)
         logger.info(f"Fluxo excluído com sucesso: {flow_id}")
 
-    # Lista todos os fluxos
-    def list_flows(self) -> List[Dict[str, Any]]:
-        logger.info("Listando todos os fluxos")
-        flows = self.collection.find()
-        return [
-            {
-                "id": flow["_id"],
-                "name": flow["name"],
-                "description": flow["description"],
-                "steps_count": len(flow["steps"]),
-                "is_active": flow["is_active"]
-            }
-            for flow in flows
-        ]
\ No newline at end of file
+    # Lista um resumo dos fluxos; a próxima página começa após o id do último fluxo retornado
+    def list_flows(
+        self,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        is_active: Optional[bool] = None,
+        name_prefix: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        logger.info("Listando fluxos")
+        pipeline = flow_list_pipeline(limit=limit, after=after, is_active=is_active, name_prefix=name_prefix)
+        return [flow_summary(flow) for flow in self.collection.aggregate(pipeline)]
+
+# Classe para gerenciar fluxos de forma assíncrona (coleção do Motor)
+class AsyncFlowManager:
+    def __init__(self, collection: AsyncIOMotorCollection, cache: Optional[FlowCache] = None):
+        self.collection = collection  # Coleção assíncrona do MongoDB onde os fluxos são armazenados
+        self.cache = cache  # Cache opcional de fluxos já validados
+
+    # Valida as ordens e as dependências dos passos (sem ciclos)
+    def validate_step_orders(self, steps: List[FlowStep]):
+        validate_step_orders(steps)
+
+    # Remove o fluxo do cache local após uma escrita
+    def _invalidate(self, flow_id: str):
+        if self.cache is not None:
+            self.cache.invalidate(flow_id)
+
+    # Cria um novo fluxo
+    async def create_flow(self, flow_id: str, flow: Flow) -> Flow:
+        logger.info(f"Tentando criar fluxo com ID: {flow_id}")
+        
+        validate_flow_id(flow_id)
+        self.validate_step_orders(flow.steps)
+        
+        flow_dict = flow_to_document(flow)
+        flow_dict["_id"] = flow_id
+        flow_dict["created_at"] = flow_dict["updated_at"]
+        flow_dict["version"] = 1
+        
+        # A unicidade do _id é garantida pelo próprio MongoDB, em uma única operação
+        try:
+            await self.collection.insert_one(flow_dict)
+        except DuplicateKeyError:
+            raise FlowAlreadyExistsError(flow_id)
+        logger.info(f"Fluxo criado com sucesso: {flow_id}")
+        return flow.model_copy(update={"flow_id": flow_id, "version": 1})
+
+    # Obtém um fluxo pelo ID
+    async def get_flow(self, flow_id: str) -> Flow:
+        with tracer.start_span("flow_manager.get_flow", {"flow_id": flow_id}) as span:
+            generation = None
+            if self.cache is not None:
+                flow = self.cache.get(flow_id)
+                span.set_attribute("cache_hit", flow is not None)
+                if flow is not None:
+                    return flow
+                generation = self.cache.begin_fill()
+            
+            logger.info(f"Obtendo fluxo com ID: {flow_id}")
+            flow_dict = await self.collection.find_one({"_id": flow_id})
+            if not flow_dict:
+                raise FlowNotFoundError(flow_id)
+            
+            flow = flow_from_document(flow_dict)
+            if self.cache is not None:
+                self.cache.set(flow_id, flow, generation)
+            return flow
+
+    # Atualiza um fluxo existente; com expected_version, só atualiza se o fluxo ainda estiver nessa versão
+    async def update_flow(self, flow_id: str, flow: Flow, expected_version: Optional[int] = None) -> Flow:
+        logger.info(f"Tentando atualizar fluxo com ID: {flow_id}")
+        
+        self.validate_step_orders(flow.steps)
+        
+        updated = await self.collection.find_one_and_update(
+            flow_version_filter(flow_id, expected_version),
+            {"$set": flow_to_document(flow), "$inc": {"version": 1}},
+            projection={"version": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        self._invalidate(flow_id)
+        if updated is None:
+            # Consulta extra apenas no caminho de erro, para diferenciar ausência de conflito
+            current = await self.collection.find_one({"_id": flow_id}, {"version": 1})
+            raise update_failure(flow_id, expected_version, current)
+        
+        logger.info(f"Fluxo atualizado com sucesso: {flow_id}")
+        return flow.model_copy(update={"flow_id": flow_id, "version": updated["version"]})
+
+    # Remove um fluxo
+    async def delete_flow(self, flow_id: str):
+        logger.info(f"Tentando excluir fluxo com ID: {flow_id}")
+        result = await self.collection.delete_one({"_id": flow_id})
+        self._invalidate(flow_id)
+        if result.deleted_count == 0:
+            raise FlowNotFoundError(flow_id)
+        logger.info(f"Fluxo excluído com sucesso: {flow_id}")
+
+    # Lista um resumo dos fluxos; a próxima página começa após o id do último fluxo retornado
+    async def list_flows(
+        self,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        is_active: Optional[bool] = None,
+        name_prefix: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        return [flow async for flow in self.iter_flows(limit=limit, after=after, is_active=is_active, name_prefix=name_prefix)]
+
+    # Produz os resumos dos fluxos à medida que chegam do cursor, sem montar a lista inteira
+    async def iter_flows(
+        self,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        is_active: Optional[bool] = None,
+        name_prefix: Optional[str] = None,
+        batch_size: int = 100
+    ) -> AsyncIterator[Dict[str, Any]]:
+        logger.info("Listando fluxos")
+        pipeline = flow_list_pipeline(limit=limit, after=after, is_active=is_active, name_prefix=name_prefix)
+        async for flow in self.collection.aggregate(pipeline, batchSize=batch_size):
+            yield flow_summary(flow)
+
+    # Produz os fluxos completos em ordem de ID, lidos do cursor em lotes de batch_size
+    async def export_flows(
+        self,
+        is_active: Optional[bool] = None,
+        name_prefix: Optional[str] = None,
+        batch_size: int = 500
+    ) -> AsyncIterator[Dict[str, Any]]:
+        logger.info("Exportando fluxos")
+        query = flow_list_filter(is_active=is_active, name_prefix=name_prefix)
+        cursor = self.collection.find(query, EXPORT_EXCLUDED_FIELDS, batch_size=batch_size).sort(EXPORT_SORT)
+        async for flow in cursor:
+            yield flow_to_record(flow)
+
+    # Importa fluxos em lote. Os registros são validados à medida que chegam e gravados
+    # em lotes não ordenados; registros recebidos como exceção (ex.: JSON inválido) e
+    # gravações rejeitadas aparecem em errors, com o índice do registro na entrada.
+    # Com overwrite, fluxos existentes são substituídos em vez de reportados como erro.
+    async def import_flows(
+        self,
+        records: AsyncIterable[Any],
+        overwrite: bool = False,
+        batch_size: int = 1000
+    ) -> Dict[str, Any]:
+        logger.info("Importando fluxos em lote")
+        report: Dict[str, Any] = {"received": 0, "written": 0, "failed": 0, "errors": []}
+        batch: List[Tuple[int, str, Dict[str, Any]]] = []
+        seen_ids = set()
+        
+        index = 0
+        async for record in records:
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                flow_id, flow_dict = flow_document_from_record(record)
+                if flow_id in seen_ids:
+                    raise ValueError(f"Fluxo com ID {flow_id} repetido na importação")
+            except ValueError as e:
+                flow_id = record.get("flow_id") if isinstance(record, dict) else None
+                report["errors"].append({"index": index, "flow_id": flow_id, "error": str(e)})
+            else:
+                seen_ids.add(flow_id)
+                batch.append((index, flow_id, flow_dict))
+                if len(batch) >= batch_size:
+                    await self._write_import_batch(batch, overwrite, report)
+                    batch = []
+            index += 1
+        
+        if batch:
+            await self._write_import_batch(batch, overwrite, report)
+        
+        report["received"] = index
+        report["failed"] = len(report["errors"])
+        report["errors"].sort(key=lambda error: error["index"])
+        logger.info(f"Importação concluída: {report['written']} gravados, {report['failed']} com erro")
+        return report
+
+    async def _write_import_batch(self, batch: List[Tuple[int, str, Dict[str, Any]]], overwrite: bool, report: Dict[str, Any]):
+        try:
+            if overwrite:
+                operations = []
+                for _, flow_id, flow_dict in batch:
+                    fields = {key: value for key, value in flow_dict.items() if key != "_id"}
+                    operations.append(UpdateOne(
+                        {"_id": flow_id},
+                        {"$set": fields, "$inc": {"version": 1}, "$setOnInsert": {"created_at": fields["updated_at"]}},
+                        upsert=True
+                    ))
+                await self.collection.bulk_write(operations, ordered=False)
+            else:
+                for _, _, flow_dict in batch:
+                    flow_dict["created_at"] = flow_dict["updated_at"]
+                    flow_dict["version"] = 1
+                await self.collection.insert_many([flow_dict for _, _, flow_dict in batch], ordered=False)
+            report["written"] += len(batch)
+        except BulkWriteError as e:
+            write_errors = e.details.get("writeErrors", [])
+            for error in write_errors:
+                index, flow_id, _ = batch[error["index"]]
+                message = str(FlowAlreadyExistsError(flow_id)) if error.get("code") == 11000 else error.get("errmsg", "Erro de gravação")
+                report["errors"].append({"index": index, "flow_id": flow_id, "error": message})
+            report["written"] += len(batch) - len(write_errors)
+        finally:
+            for _, flow_id, _ in batch:
+                self._invalidate(flow_id)
@@ -0,0 +1,122 @@
+import sys
+from typing import Any, Dict, List, Tuple
+import logging
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from config import settings
+from flow_manager import EXPORT_SORT, flow_list_filter, flow_list_pipeline
+
+# Configuração básica de logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Índices de cada coleção, por nome da coleção. create_indexes é idempotente:
+# índices já existentes com a mesma definição não são recriados.
+def collection_indexes() -> Dict[str, List[IndexModel]]:
+    indexes = {
+        settings.MONGODB_COLLECTION: [
+            # Listagem filtrada por is_active, paginada pelo _id
+            IndexModel([("is_active", ASCENDING), ("_id", ASCENDING)], name="is_active_id"),
+            # Filtro por prefixo do nome
+            IndexModel([("name", ASCENDING)], name="name")
+        ]
+    }
+    if settings.JOB_STORE_BACKEND.lower() == "mongo":
+        indexes[settings.MONGODB_JOBS_COLLECTION] = [
+            # Reserva do próximo job pendente, em ordem de criação
+            IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="status_created_at"),
+            # Retomada de jobs com lease expirado
+            IndexModel([("status", ASCENDING), ("heartbeat_at", ASCENDING)], name="status_heartbeat_at"),
+            # Retenção: o MongoDB remove os jobs finalizados após expires_at; jobs pendentes têm expires_at nulo e são mantidos
+            IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0)
+        ]
+    if settings.COMPLETION_CACHE_BACKEND.lower() == "mongo":
+        indexes[settings.MONGODB_COMPLETION_CACHE_COLLECTION] = [
+            # O MongoDB remove as respostas expiradas; entradas sem expires_at são mantidas
+            IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0)
+        ]
+    if settings.EXECUTION_HISTORY_ENABLED:
+        indexes[settings.MONGODB_EXECUTIONS_COLLECTION] = [
+            # Listagem por fluxo e pelo intervalo de started_at, paginada por (started_at, _id)
+            IndexModel([("flow_id", ASCENDING), ("started_at", DESCENDING), ("_id", DESCENDING)], name="flow_id_started_at"),
+            IndexModel([("started_at", DESCENDING), ("_id", DESCENDING)], name="started_at"),
+            # Retenção: o MongoDB remove as execuções após expires_at
+            IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0)
+        ]
+    return indexes
+
+# Cria os índices no banco assíncrono (Motor); chamado na inicialização da API e dos workers
+async def ensure_indexes(db):
+    for collection_name, models in collection_indexes().items():
+        try:
+            await db[collection_name].create_indexes(models)
+        except Exception as e:
+            # Sem os índices a aplicação funciona, apenas com consultas mais lentas
+            logger.error(f"Erro ao criar índices da coleção {collection_name}: {str(e)}")
+    logger.info("Índices do MongoDB verificados")
+
+# Consultas emitidas pelo FlowManager, para verificação dos planos de execução.
+# As consultas find são descritas por {"filter": ..., "sort": ...}.
+def flow_queries() -> List[Tuple[str, str, Any]]:
+    return [
+        ("get_flow", "find", {"filter": {"_id": "flow_id"}}),
+        ("list_flows", "aggregate", flow_list_pipeline(limit=settings.FLOW_LIST_PAGE_SIZE)),
+        ("list_flows (after)", "aggregate", flow_list_pipeline(limit=settings.FLOW_LIST_PAGE_SIZE, after="flow_id")),
+        ("list_flows (is_active)", "aggregate", flow_list_pipeline(limit=settings.FLOW_LIST_PAGE_SIZE, is_active=True)),
+        ("list_flows (is_active, after)", "aggregate", flow_list_pipeline(limit=settings.FLOW_LIST_PAGE_SIZE, after="flow_id", is_active=True)),
+        ("list_flows (name_prefix)", "aggregate", flow_list_pipeline(limit=settings.FLOW_LIST_PAGE_SIZE, name_prefix="Fluxo")),
+        ("export_flows", "find", {"filter": flow_list_filter(), "sort": EXPORT_SORT}),
+        ("export_flows (is_active)", "find", {"filter": flow_list_filter(is_active=True), "sort": EXPORT_SORT}),
+        ("export_flows (name_prefix)", "find", {"filter": flow_list_filter(name_prefix="Fluxo"), "sort": EXPORT_SORT}),
+    ]
+
+# Procura estágios COLLSCAN em qualquer nível de um plano retornado por explain()
+def find_collscans(plan: Any) -> List[Dict[str, Any]]:
+    found = []
+    if isinstance(plan, dict):
+        if plan.get("stage") == "COLLSCAN":
+            found.append(plan)
+        for value in plan.values():
+            found.extend(find_collscans(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            found.extend(find_collscans(item))
+    return found
+
+# Executa explain() nas consultas do FlowManager e retorna as que fazem varredura completa
+def check_flow_queries(db) -> List[str]:
+    collection = db[settings.MONGODB_COLLECTION]
+    failures = []
+    for description, kind, query in flow_queries():
+        if kind == "find":
+            cursor = collection.find(query["filter"])
+            if query.get("sort"):
+                cursor = cursor.sort(query["sort"])
+            plan = cursor.explain()
+        else:
+            plan = db.command("aggregate", collection.name, pipeline=query, explain=True)
+
+        if find_collscans(plan):
+            failures.append(description)
+            logger.error(f"COLLSCAN na consulta {description}")
+        else:
+            logger.info(f"Consulta {description}: usa índice")
+    return failures
+
+# Diagnóstico: cria os índices e falha se alguma consulta do FlowManager fizer COLLSCAN
+def main() -> int:
+    from database import db
+
+    for collection_name, models in collection_indexes().items():
+        db[collection_name].create_indexes(models)
+
+    failures = check_flow_queries(db)
+    if failures:
+        logger.error(f"Consultas sem índice: {', '.join(failures)}")
+        return 1
+    logger.info("Todas as consultas do FlowManager usam índices")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,381 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+import logging
+
+from pymongo import ReturnDocument
+
+from config import settings
+from tracing import tracer
+
+# Configuração básica de logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Estados possíveis de um job
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_FINAL_STATES = (JOB_COMPLETED, JOB_FAILED)
+
+# Monta o documento de um novo job de execução de fluxo
+def new_job(
+    flow_id: str,
+    user_message: Optional[str] = None,
+    inputs: Optional[List[str]] = None,
+    variables: Optional[Dict[str, str]] = None
+) -> Dict[str, Any]:
+    if (user_message is None) == (inputs is None):
+        raise ValueError("Informe user_message ou inputs")
+
+    now = datetime.utcnow()
+    return {
+        "_id": uuid.uuid4().hex,
+        "flow_id": flow_id,
+        "kind": "batch" if inputs is not None else "flow",
+        "user_message": user_message,
+        "inputs": inputs,
+        "variables": variables,  # Variáveis dos prompts, usadas também na retomada
+        "status": JOB_QUEUED,
+        "progress": {"completed": 0, "total": len(inputs) if inputs is not None else None},
+        "steps": {},
+        "result": None,
+        "error": None,
+        "attempts": 0,
+        "created_at": now,
+        "updated_at": now,
+        "started_at": None,
+        "finished_at": None,
+        "heartbeat_at": None,
+        "expires_at": None
+    }
+
+# Campos de um job que terminou; jobs finalizados são removidos após JOB_RETENTION_DAYS
+def finished_fields(finished_at: datetime) -> Dict[str, Any]:
+    expires_at = None
+    if settings.JOB_RETENTION_DAYS > 0:
+        expires_at = finished_at + timedelta(days=settings.JOB_RETENTION_DAYS)
+    return {"finished_at": finished_at, "expires_at": expires_at}
+
+# Converte o documento do job na representação retornada pela API
+def job_to_dict(job: Dict[str, Any], include_result: bool = True) -> Dict[str, Any]:
+    job_dict = {
+        "job_id": job["_id"],
+        "flow_id": job["flow_id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "steps": job["steps"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"]
+    }
+    if include_result:
+        job_dict["result"] = job["result"]
+    return job_dict
+
+# Interface comum dos armazenamentos de jobs
+class JobStore:
+    # Persiste um novo job
+    async def create(self, job: Dict[str, Any]):
+        raise NotImplementedError
+
+    # Obtém um job pelo ID, ou None se não existir
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    # Atualiza campos de um job
+    async def update(self, job_id: str, fields: Dict[str, Any]):
+        raise NotImplementedError
+
+    # Reserva o próximo job pendente (ou com lease expirado) e o marca como em execução
+    async def claim_next(self, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+# Armazenamento de jobs em memória (testes e desenvolvimento local)
+class MemoryJobStore(JobStore):
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = asyncio.Lock()
+
+    async def create(self, job: Dict[str, Any]):
+        async with self._lock:
+            self._prune(datetime.utcnow())
+            self._jobs[job["_id"]] = dict(job)
+
+    # Remove os jobs finalizados cujo prazo de retenção já passou, como o índice TTL do MongoDB
+    def _prune(self, now: datetime):
+        expired = [job_id for job_id, job in self._jobs.items() if job.get("expires_at") is not None and job["expires_at"] < now]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    async def update(self, job_id: str, fields: Dict[str, Any]):
+        async with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            for key, value in fields.items():
+                # Suporta chaves aninhadas no formato do MongoDB ("steps.nome")
+                target = job
+                *path, last = key.split(".")
+                for part in path:
+                    target = target.setdefault(part, {})
+                target[last] = value
+
+    async def claim_next(self, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        now = datetime.utcnow()
+        expired = now - timedelta(seconds=lease_seconds)
+        async with self._lock:
+            for job in self._jobs.values():
+                stale = job["status"] == JOB_RUNNING and job["heartbeat_at"] is not None and job["heartbeat_at"] < expired
+                if job["status"] == JOB_QUEUED or stale:
+                    job.update({
+                        "status": JOB_RUNNING,
+                        "started_at": job["started_at"] or now,
+                        "heartbeat_at": now,
+                        "updated_at": now,
+                        "attempts": job["attempts"] + 1
+                    })
+                    return dict(job)
+        return None
+
+# Armazenamento de jobs em uma coleção do MongoDB (coleção assíncrona do Motor)
+class MongoJobStore(JobStore):
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def create(self, job: Dict[str, Any]):
+        await self.collection.insert_one(job)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"_id": job_id})
+
+    async def update(self, job_id: str, fields: Dict[str, Any]):
+        await self.collection.update_one({"_id": job_id}, {"$set": fields})
+
+    async def claim_next(self, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        # find_one_and_update garante que apenas um worker (de qualquer réplica) reserve o job
+        now = datetime.utcnow()
+        expired = now - timedelta(seconds=lease_seconds)
+        job = await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": JOB_QUEUED},
+                {"status": JOB_RUNNING, "heartbeat_at": {"$lt": expired}}
+            ]},
+            {"$set": {"status": JOB_RUNNING, "heartbeat_at": now, "updated_at": now},
+             "$inc": {"attempts": 1}},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if job is not None and job.get("started_at") is None:
+            await self.collection.update_one({"_id": job["_id"]}, {"$set": {"started_at": now}})
+            job["started_at"] = now
+        return job
+
+# Fila de jobs: workers assíncronos que executam os fluxos em segundo plano
+class JobQueue:
+    def __init__(
+        self,
+        store: JobStore,
+        model_client,
+        flow_manager,
+        workers: int = 4,
+        poll_interval: float = 1.0,
+        lease_seconds: float = 300.0
+    ):
+        if workers < 0:
+            raise ValueError("O número de workers não pode ser negativo")
+
+        self.store = store
+        self.model_client = model_client  # ModelIntegration usado para executar os fluxos
+        self.flow_manager = flow_manager  # AsyncFlowManager usado para carregar os fluxos
+        self.workers = workers
+        self.poll_interval = poll_interval  # Intervalo (s) de consulta por jobs de outras réplicas
+        self.lease_seconds = lease_seconds  # Tempo (s) sem heartbeat após o qual um job é retomado
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    # Inicia os workers (com zero workers a instância apenas enfileira jobs)
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Fila de jobs iniciada com {self.workers} workers")
+
+    # Encerra os workers; jobs interrompidos são retomados após o lease expirar
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Fila de jobs encerrada")
+
+    # Enfileira a execução de um fluxo e retorna o job criado
+    async def submit(
+        self,
+        flow_id: str,
+        user_message: Optional[str] = None,
+        inputs: Optional[List[str]] = None,
+        variables: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        job = new_job(flow_id, user_message=user_message, inputs=inputs, variables=variables)
+        await self.store.create(job)
+        self._wakeup.set()
+        logger.info(f"Job {job['_id']} enfileirado para o fluxo {flow_id}")
+        return job
+
+    # Registra uma execução que falhou como job, guardando os passos concluídos para retomada
+    async def save_checkpoint(
+        self,
+        flow_id: str,
+        user_message: str,
+        completed_steps: Dict[str, str],
+        error: str,
+        variables: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        job = new_job(flow_id, user_message=user_message, variables=variables)
+        now = datetime.utcnow()
+        job.update({
+            "status": JOB_FAILED,
+            "steps": dict(completed_steps),
+            "error": error,
+            "started_at": now,
+            **finished_fields(now)
+        })
+        await self.store.create(job)
+        logger.info(f"Checkpoint {job['_id']} salvo para o fluxo {flow_id}")
+        return job
+
+    # Recoloca na fila um job que falhou; os passos já concluídos não são reexecutados
+    async def resume(self, job_id: str) -> Dict[str, Any]:
+        job = await self.store.get(job_id)
+        if job is None:
+            raise ValueError(f"Job {job_id} não encontrado")
+        if job["status"] != JOB_FAILED:
+            raise ValueError(f"Apenas jobs com falha podem ser retomados (status atual: {job['status']})")
+        
+        await self.store.update(job_id, {
+            "status": JOB_QUEUED,
+            "error": None,
+            "finished_at": None,
+            "expires_at": None,
+            "heartbeat_at": None,
+            "updated_at": datetime.utcnow()
+        })
+        self._wakeup.set()
+        logger.info(f"Job {job_id} recolocado na fila")
+        return await self.store.get(job_id)
+
+    async def _worker(self, worker_id: int):
+        while True:
+            try:
+                job = await self.store.claim_next(self.lease_seconds)
+            except Exception as e:
+                logger.error(f"Worker {worker_id}: erro ao buscar jobs: {str(e)}")
+                job = None
+
+            if job is None:
+                # Aguarda um novo job local ou o próximo ciclo de consulta
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Cada job é a raiz de um trace próprio
+            with tracer.start_span("job.run", {"job_id": job["_id"], "flow_id": job["flow_id"], "kind": job["kind"]}):
+                await self._run_job(job)
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            await self.store.update(job_id, {"heartbeat_at": datetime.utcnow()})
+
+    async def _run_job(self, job: Dict[str, Any]):
+        job_id = job["_id"]
+        logger.info(f"Executando job {job_id}")
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+
+        try:
+            flow = await self.flow_manager.get_flow(job["flow_id"])
+            if job["kind"] == "flow":
+                await self.store.update(job_id, {"progress": {"completed": 0, "total": len(flow.steps)}})
+
+            if job["kind"] == "batch":
+                result = await self._run_batch(job, flow)
+            else:
+                completed = 0
+
+                # Registra o progresso de cada passo concluído
+                async def on_event(event: Dict[str, Any]):
+                    nonlocal completed
+                    if event["event"] == "step_end":
+                        completed += 1
+                        await self.store.update(job_id, {
+                            f"steps.{event['step_name']}": event["assistant_message"],
+                            "progress": {"completed": completed, "total": len(flow.steps)},
+                            "heartbeat_at": datetime.utcnow(),
+                            "updated_at": datetime.utcnow()
+                        })
+
+                # Passos salvos em uma tentativa anterior não são reexecutados
+                result = await self.model_client.process_flow(
+                    user_message=job["user_message"],
+                    flow=flow,
+                    on_event=on_event,
+                    checkpoint=job.get("steps") or None,
+                    variables=job.get("variables")
+                )
+
+            await self.store.update(job_id, {
+                "status": JOB_COMPLETED,
+                "result": result,
+                **finished_fields(datetime.utcnow()),
+                "updated_at": datetime.utcnow()
+            })
+            logger.info(f"Job {job_id} concluído")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Job {job_id} falhou: {str(e)}")
+            await self.store.update(job_id, {
+                "status": JOB_FAILED,
+                "error": str(e),
+                **finished_fields(datetime.utcnow()),
+                "updated_at": datetime.utcnow()
+            })
+        finally:
+            heartbeat.cancel()
+
+    async def _run_batch(self, job: Dict[str, Any], flow) -> List[Dict[str, Any]]:
+        inputs = job["inputs"]
+        results: List[Optional[Dict[str, Any]]] = [None] * len(inputs)
+        completed = 0
+
+        async for item in self.model_client.process_batch(
+            inputs, flow, concurrency=settings.BATCH_CONCURRENCY, variables=job.get("variables")
+        ):
+            results[item["index"]] = item
+            completed += 1
+            await self.store.update(job["_id"], {
+                "progress": {"completed": completed, "total": len(inputs)},
+                "heartbeat_at": datetime.utcnow(),
+                "updated_at": datetime.utcnow()
+            })
+        return results
+
+# Cria o armazenamento de jobs configurado
+def create_job_store(backend: Optional[str] = None) -> JobStore:
+    backend = (backend or settings.JOB_STORE_BACKEND).lower()
+    if backend == "memory":
+        return MemoryJobStore()
+    if backend == "mongo":
+        from database import async_db
+        return MongoJobStore(async_db[settings.MONGODB_JOBS_COLLECTION])
+    raise ValueError(f"Backend de jobs desconhecido: {backend}")
@@ -0,0 +1,63 @@
+import asyncio
+import signal
+import logging
+
+from flow_manager import AsyncFlowManager
+from model_integration import ModelIntegration
+from completion_cache import create_completion_cache
+from flow_cache import flow_cache, watch_flow_changes
+from job_queue import JobQueue, create_job_store
+from execution_history import create_execution_recorder
+from config import settings
+from database import async_collection, async_db
+from indexes import ensure_indexes
+
+# Configuração básica de logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Processo dedicado à execução de jobs, separado da API.
+# Execute várias instâncias para escalar o throughput: os jobs são reservados
+# atomicamente no MongoDB, então cada job é executado por um único worker.
+async def main():
+    execution_recorder = create_execution_recorder()
+    model_client = ModelIntegration(
+        api_key=settings.UFPB_OPENAI_API_KEY,
+        completion_cache=create_completion_cache(),
+        execution_recorder=execution_recorder
+    )
+    job_queue = JobQueue(
+        store=create_job_store(),
+        model_client=model_client,
+        flow_manager=AsyncFlowManager(async_collection, cache=flow_cache),
+        workers=max(settings.JOB_WORKERS, 1),
+        poll_interval=settings.JOB_POLL_INTERVAL,
+        lease_seconds=settings.JOB_LEASE_SECONDS
+    )
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    
+    if settings.MONGODB_CREATE_INDEXES:
+        await ensure_indexes(async_db)
+    await model_client.startup()
+    if execution_recorder is not None:
+        await execution_recorder.start()
+    watcher = None
+    if settings.FLOW_CACHE_WATCH_CHANGES:
+        watcher = asyncio.create_task(watch_flow_changes(async_collection, flow_cache))
+    await job_queue.start()
+    try:
+        await stop.wait()
+    finally:
+        await job_queue.stop()
+        if watcher is not None:
+            watcher.cancel()
+        if execution_recorder is not None:
+            await execution_recorder.stop()
+        await model_client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
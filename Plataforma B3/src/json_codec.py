@@ -0,0 +1,46 @@
+import json
+from typing import Any, Union
+import logging
+
+from config import settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Configuração básica de logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Codificação e decodificação de JSON nos caminhos críticos (respostas da API e chamadas ao modelo).
+# Usa orjson quando instalado e habilitado em JSON_FAST_PATH; caso contrário, o módulo json.
+FAST_JSON = orjson is not None and settings.JSON_FAST_PATH
+
+if orjson is None and settings.JSON_FAST_PATH:
+    logger.info("orjson não instalado; a serialização JSON usará o módulo json")
+
+# Datas são repassadas a default=str, para que a saída seja a mesma do módulo json
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+# Erro de decodificação dos dois caminhos (orjson.JSONDecodeError herda de json.JSONDecodeError)
+JSONDecodeError = json.JSONDecodeError
+
+# Decodifica um documento JSON, em texto ou bytes
+def loads(data: Union[str, bytes, bytearray]) -> Any:
+    if FAST_JSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# Codifica um valor como JSON em UTF-8; valores não serializáveis são convertidos com str
+def dumps_bytes(value: Any) -> bytes:
+    if FAST_JSON:
+        return orjson.dumps(value, default=str, option=ORJSON_OPTIONS)
+    return json.dumps(value, ensure_ascii=False, default=str, separators=(",", ":")).encode("utf-8")
+
+# Codifica um valor como texto JSON
+def dumps(value: Any) -> str:
+    if FAST_JSON:
+        return dumps_bytes(value).decode("utf-8")
+    return json.dumps(value, ensure_ascii=False, default=str)
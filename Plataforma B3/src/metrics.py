@@ -0,0 +1,131 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from pymongo import monitoring
+
+# Faixas dos histogramas de latência (s): chamadas ao modelo vão de milissegundos a minutos
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+FLOW_DURATION = Histogram(
+    "flow_execution_duration_seconds",
+    "Duração das execuções de fluxo",
+    ["flow_id", "status"],
+    buckets=LATENCY_BUCKETS
+)
+STEP_DURATION = Histogram(
+    "flow_step_duration_seconds",
+    "Duração dos passos de fluxo",
+    ["flow_id", "step_name", "status"],
+    buckets=LATENCY_BUCKETS
+)
+MODEL_REQUEST_DURATION = Histogram(
+    "model_request_duration_seconds",
+    "Duração das chamadas HTTP ao modelo",
+    ["flow_id", "step_name", "endpoint", "status"],
+    buckets=LATENCY_BUCKETS
+)
+MODEL_TOKENS = Counter(
+    "model_tokens_total",
+    "Tokens consumidos nas chamadas ao modelo (campo usage da resposta)",
+    ["flow_id", "step_name", "type"]
+)
+MONGO_OPERATION_DURATION = Histogram(
+    "mongo_operation_duration_seconds",
+    "Duração dos comandos enviados ao MongoDB",
+    ["command", "status"],
+    buckets=MONGO_BUCKETS
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Consultas aos caches, por resultado (hit ou miss)",
+    ["cache", "result"]
+)
+EXECUTION_HISTORY_RECORDS = Counter(
+    "execution_history_records_total",
+    "Registros do histórico de execuções, por resultado (written, dropped ou failed)",
+    ["result"]
+)
+MODEL_ENDPOINT_OUTSTANDING = Gauge(
+    "model_endpoint_outstanding_requests",
+    "Requisições em andamento por endpoint do modelo",
+    ["endpoint"]
+)
+MODEL_ENDPOINT_STATE = Gauge(
+    "model_endpoint_circuit_open",
+    "Disjuntor do endpoint do modelo aberto (1) ou fechado (0)",
+    ["endpoint"]
+)
+MODEL_REQUESTS_COALESCED = Counter(
+    "model_requests_coalesced_total",
+    "Chamadas ao modelo de passos com coalescência, por resultado (upstream ou shared)",
+    ["flow_id", "step_name", "result"]
+)
+FLOWS_IN_PROGRESS = Gauge(
+    "flow_executions_in_progress",
+    "Execuções de fluxo em andamento"
+)
+
+# Fluxo e passo em execução na tarefa atual, usados como rótulos das chamadas ao modelo
+_step_labels: ContextVar[Tuple[str, str]] = ContextVar("step_labels", default=("", ""))
+
+# Define os rótulos de fluxo e passo para as métricas registradas nesta tarefa
+def set_step_labels(flow_id: Optional[str], step_name: str):
+    _step_labels.set((flow_id or "", step_name))
+
+# Retorna os rótulos de fluxo e passo da tarefa atual
+def current_step_labels() -> Tuple[str, str]:
+    return _step_labels.get()
+
+# Mede a duração de um bloco; o rótulo status fica "error" se o bloco lançar exceção
+@contextmanager
+def observe_duration(histogram: Histogram, **labels):
+    start = time.perf_counter()
+    status = "success"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        histogram.labels(status=status, **labels).observe(time.perf_counter() - start)
+
+# Registra o uso de tokens informado pelo campo usage da resposta do modelo
+def record_token_usage(usage: Optional[dict]):
+    if not usage:
+        return
+    flow_id, step_name = current_step_labels()
+    for token_type in ("prompt_tokens", "completion_tokens"):
+        if usage.get(token_type):
+            MODEL_TOKENS.labels(flow_id=flow_id, step_name=step_name, type=token_type.split("_")[0]).inc(usage[token_type])
+
+# Registra uma consulta a um cache
+def record_cache_lookup(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+# Registra uma chamada com coalescência: shared indica que ela reutilizou uma chamada em andamento
+def record_coalesced_request(shared: bool):
+    flow_id, step_name = current_step_labels()
+    MODEL_REQUESTS_COALESCED.labels(flow_id=flow_id, step_name=step_name, result="shared" if shared else "upstream").inc()
+
+# Listener do driver do MongoDB que mede a latência de cada comando (pymongo e Motor)
+class MongoCommandMetrics(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_OPERATION_DURATION.labels(command=event.command_name, status="success").observe(
+            event.duration_micros / 1_000_000
+        )
+
+    def failed(self, event):
+        MONGO_OPERATION_DURATION.labels(command=event.command_name, status="error").observe(
+            event.duration_micros / 1_000_000
+        )
+
+# Gera o conteúdo do endpoint /metrics no formato de exposição do Prometheus
+def render_metrics() -> Tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
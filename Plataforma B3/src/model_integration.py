@@ -1,64 +1,198 @@
-import json
+import random
+import time
+import asyncio
 import aiohttp
-from typing import List, Dict, Any, Optional
-from urllib.parse import urlparse
+from contextlib import asynccontextmanager, nullcontext
+from datetime import datetime
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, List, Dict, Any, Optional, Set, Tuple, Union
 import logging
 
-from flow_manager import Flow, FlowStep
+from flow_manager import Flow, FlowStep, USER_MESSAGE_INPUT, resolve_step_dependencies, resolve_step_waits
+from completion_cache import CompletionCache, make_cache_key
+from rate_limiter import RateLimiter, estimate_request_tokens
+from model_router import ModelEndpoint, ModelRouter, create_model_router
+from request_coalescer import RequestCoalescer
+from prompt_template import PromptTemplate, check_variables
+from token_counter import TokenCounter, TOKENS_PER_MESSAGE, TOKENS_PER_REPLY
+from execution_history import ExecutionRecorder, build_execution_record, build_step_record, new_execution_id
+from metrics import (
+    FLOW_DURATION, FLOWS_IN_PROGRESS, MODEL_REQUEST_DURATION, STEP_DURATION,
+    current_step_labels, observe_duration, record_cache_lookup, record_coalesced_request, record_token_usage, set_step_labels
+)
+from tracing import current_span, tracer
 from config import settings
+import json_codec
 
 # Configuração básica de logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Erro transitório do endpoint do modelo (429 ou 5xx), elegível para nova tentativa
+class TransientModelError(ValueError):
+    pass
+
+# Resposta 429: o endpoint está saudável, apenas sem orçamento no momento
+class RateLimitedError(TransientModelError):
+    pass
+
+# Erro na execução de um fluxo; guarda as saídas dos passos concluídos para retomada
+class FlowExecutionError(ValueError):
+    def __init__(self, message: str, failed_step: Optional[str] = None, completed_steps: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.failed_step = failed_step  # Nome do passo que falhou
+        self.completed_steps = completed_steps or {}  # Saídas dos passos concluídos, por nome
+
+# Execução de fluxo interrompida pelo tempo limite
+class FlowTimeoutError(FlowExecutionError):
+    pass
+
+# Passo interrompido pelo seu timeout_seconds; tratado como o tempo limite do fluxo
+class StepTimeoutError(FlowTimeoutError):
+    pass
+
+# Prompt de um passo acima do limite de tokens, com a política reject
+class TokenLimitError(ValueError):
+    pass
+
+# Contagens de tokens de um passo que não dependem da execução, calculadas uma vez por
+# versão do fluxo. Com campos no prompt, o texto fixo e os valores são contados separadamente,
+# o que pode diferir do prompt renderizado em alguns tokens por campo.
+class StepTokenPlan:
+    def __init__(
+        self,
+        step_name: str,
+        template: PromptTemplate,
+        fixed_tokens: int,
+        upstream_tokens: int,
+        uses_user_message: bool,
+        max_completion_tokens: int,
+        input_limit: int,
+        input_policy: str
+    ):
+        self.step_name = step_name
+        self.template = template  # Prompt compilado; seus campos são contados a cada projeção
+        self.fixed_tokens = fixed_tokens  # Formato de chat, texto fixo do prompt e cabeçalhos das entradas
+        self.upstream_tokens = upstream_tokens  # Máximo gerado pelos passos anteriores usados como entrada
+        self.uses_user_message = uses_user_message  # Se a mensagem do usuário é uma das entradas
+        self.max_completion_tokens = max_completion_tokens
+        self.input_limit = input_limit
+        self.input_policy = input_policy
+
+# Prompt usado pela política summarize para reduzir entradas acima do limite
+SUMMARY_PROMPT = (
+    "Resuma o texto a seguir preservando os fatos, números e conclusões necessários "
+    "para as próximas etapas. Responda apenas com o resumo."
+)
+
+# Erros que justificam uma nova tentativa da chamada ao modelo
+RETRYABLE_ERRORS = (TransientModelError, aiohttp.ClientError, asyncio.TimeoutError)
+
+# Orçamento de reenvios de uma chamada ao modelo, compartilhado pelos reenvios após
+# respostas 429 e pelas novas tentativas após as demais falhas transitórias
+class RetryBudget:
+    def __init__(self):
+        self.used = 0  # Reenvios já feitos nesta chamada, de qualquer tipo
+
+    # Consome um reenvio se o limite do tipo de falha ainda não foi atingido
+    def spend(self, rate_limited: bool = False) -> bool:
+        limit = settings.RATE_LIMIT_MAX_RETRIES if rate_limited else settings.MODEL_MAX_RETRIES
+        if self.used >= limit:
+            return False
+        self.used += 1
+        return True
+
 class ModelIntegration:
-    def __init__(self, api_key: str):
+    def __init__(
+        self,
+        api_key: str,
+        completion_cache: Optional[CompletionCache] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        execution_recorder: Optional[ExecutionRecorder] = None,
+        token_counter: Optional[TokenCounter] = None,
+        router: Optional[ModelRouter] = None
+    ):
         if not api_key:
             raise ValueError("API_KEY não pode ser vazia")
         
         self.api_key = api_key
-        self.model_url = settings.MODEL_URL
+        self.completion_cache = completion_cache  # Cache opcional de respostas do modelo
+        self.execution_recorder = execution_recorder  # Histórico opcional das execuções de fluxo
+        self.token_counter = token_counter or TokenCounter()  # Contagem local de tokens dos prompts
+        
+        # Deployments do modelo, cada um com seu limitador de requisições/tokens por minuto
+        # (que também respeita os cabeçalhos retry-after) e seu disjuntor.
+        # rate_limiter substitui o limitador do deployment único configurado em UFPB_*
+        try:
+            self.router = router or create_model_router(api_key, rate_limiter)
+        except Exception as e:
+            raise ValueError(f"Erro ao configurar os endpoints do modelo: {str(e)}")
         
-        # Valida a URL do modelo
-        self._validate_model_url(self.model_url)
+        # Chamadas idênticas em andamento dos passos com coalesce_requests, compartilhadas por chave
+        self.coalescer = RequestCoalescer()
         
-        self.headers = {
-            "Content-Type": "application/json",
-            "api-key": api_key
-        }
+        self.headers = {"Content-Type": "application/json"}
         
-        # Valida a conexão com o modelo
-        self._validate_connection()
+        # Sessão HTTP compartilhada (criada sob demanda ou em startup)
+        self._session: Optional[aiohttp.ClientSession] = None
 
-    def _validate_model_url(self, url: str):
-        """Valida a URL do modelo."""
-        parsed_url = urlparse(url)
-        if not parsed_url.scheme or not parsed_url.netloc:
-            raise ValueError("URL do modelo inválida")
+    def _create_session(self) -> aiohttp.ClientSession:
+        """Cria a sessão HTTP com um pool de conexões persistentes."""
+        connector = aiohttp.TCPConnector(
+            limit=settings.HTTP_POOL_SIZE,
+            limit_per_host=settings.HTTP_POOL_PER_HOST,
+            keepalive_timeout=settings.HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=settings.HTTP_DNS_CACHE_TTL,
+        )
+        # Sem limite total, para não interromper respostas em streaming longas;
+        # os prazos de passo e de fluxo são aplicados por process_flow
+        timeout = aiohttp.ClientTimeout(
+            total=None,
+            sock_connect=settings.MODEL_CONNECT_TIMEOUT,
+            sock_read=settings.MODEL_READ_TIMEOUT
+        )
+        # Os payloads são serializados pelo mesmo codificador das respostas (orjson, se disponível)
+        return aiohttp.ClientSession(
+            connector=connector,
+            headers=self.headers,
+            timeout=timeout,
+            json_serialize=json_codec.dumps
+        )
 
-    def _validate_connection(self):
-        """Valida a conexão com o modelo."""
-        try:
-            self._validate_model_url(self.model_url)
-        except Exception as e:
-            raise ValueError(f"Erro ao validar URL do modelo: {str(e)}")
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Retorna a sessão compartilhada, recriando-a se tiver sido fechada."""
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+        return self._session
 
-    async def chat_completion(
+    async def startup(self):
+        """Abre a sessão HTTP compartilhada. Deve ser chamado na inicialização da aplicação."""
+        await self._get_session()
+        logger.info("Sessão HTTP do modelo iniciada")
+
+    async def close(self):
+        """Fecha a sessão HTTP compartilhada e libera as conexões do pool."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("Sessão HTTP do modelo encerrada")
+        self._session = None
+        if self.completion_cache is not None:
+            await self.completion_cache.close()
+
+    def _build_payload(
         self,
         messages: List[Dict[str, str]],
-        temperature: float = 0.7,
-        max_tokens: int = 100,
+        temperature: float,
+        max_tokens: int,
         **kwargs
     ) -> Dict[str, Any]:
-        """Realiza uma chamada de conclusão de chat ao modelo."""
-        # Validação dos parâmetros
+        """Valida os parâmetros e monta o payload da chamada ao modelo."""
         if not messages:
             raise ValueError("A lista de mensagens não pode estar vazia")
         
         if not isinstance(temperature, (int, float)) or not 0 <= temperature <= 1:
             raise ValueError("Temperatura deve ser um número entre 0 e 1")
         
-        payload = {
+        return {
             "messages": messages,
             "temperature": temperature,
             "max_tokens": max_tokens,
@@ -66,41 +200,439 @@ class ModelIntegration:
             "frequency_penalty": kwargs.get("frequency_penalty", 1.0),
             "presence_penalty": kwargs.get("presence_penalty", 0.5),
         }
+
+    async def chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 100,
+        use_cache: bool = False,
+        cache_ttl: Optional[float] = None,
+        model: Optional[str] = None,
+        coalesce: bool = False,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """Realiza uma chamada de conclusão de chat ao modelo.
         
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    self.model_url,
-                    headers=self.headers,
-                    json=payload
-                ) as response:
-                    if response.status == 401:
-                        raise ValueError("Erro de autenticação: Chave de API inválida ou endpoint incorreto")
-                    elif response.status == 404:
-                        raise ValueError("Endpoint não encontrado. Verifique a URL do modelo")
-                    elif response.status != 200:
-                        error_text = await response.text()
-                        raise ValueError(f"Erro na chamada ao modelo: {error_text}")
-                    
-                    response_data = await response.json()
-                    return response_data
-                    
-        except aiohttp.ClientError as e:
-            logger.error(f"Erro de conexão: {str(e)}")
-            raise ValueError(f"Erro de conexão: {str(e)}")
-        except json.JSONDecodeError as e:
-            logger.error(f"Erro ao processar resposta do modelo: {str(e)}")
-            raise ValueError(f"Erro ao processar resposta do modelo: {str(e)}")
-        except Exception as e:
-            logger.error(f"Erro inesperado: {str(e)}")
-            raise ValueError(f"Erro inesperado: {str(e)}")
+        Com use_cache=True, respostas idênticas são servidas pelo cache de respostas.
+        Com coalesce=True, chamadas idênticas concorrentes compartilham uma única requisição
+        ao modelo; as respostas compartilhadas são marcadas com "coalesced". Use apenas em
+        chamadas determinísticas (temperatura 0).
+        model escolhe os deployments que atendem a chamada (None usa o modelo padrão).
+        """
+        payload = self._build_payload(messages, temperature, max_tokens, **kwargs)
+        
+        request_key = None
+        if (use_cache and self.completion_cache is not None) or coalesce:
+            request_key = make_cache_key(model or self.router.default_model, payload)
+        
+        cache_key = None
+        if use_cache and self.completion_cache is not None:
+            cache_key = request_key
+            try:
+                cached_response = await self.completion_cache.get(cache_key)
+            except Exception as e:
+                # Falhas no cache não devem impedir a chamada ao modelo
+                logger.warning(f"Erro ao consultar o cache de respostas: {str(e)}")
+                cached_response = None
+            record_cache_lookup("completion", hit=cached_response is not None)
+            span = current_span()
+            if span is not None:
+                span.set_attribute("cache_hit", cached_response is not None)
+            if cached_response is not None:
+                return {**cached_response, "cached": True}
+        
+        async def fetch() -> Dict[str, Any]:
+            response_data = await self._post_completion(payload, model)
+            if cache_key is not None:
+                ttl = cache_ttl if cache_ttl is not None else settings.COMPLETION_CACHE_TTL_SECONDS
+                try:
+                    await self.completion_cache.set(cache_key, response_data, ttl)
+                except Exception as e:
+                    logger.warning(f"Erro ao gravar no cache de respostas: {str(e)}")
+            return response_data
+        
+        if not coalesce:
+            return await fetch()
+        
+        response_data, shared = await self.coalescer.run(request_key, fetch)
+        record_coalesced_request(shared)
+        span = current_span()
+        if span is not None:
+            span.set_attribute("coalesced", shared)
+        if shared:
+            return {**response_data, "coalesced": True}
+        return response_data
 
-    async def process_flow(
+    async def _check_response_status(self, response: aiohttp.ClientResponse):
+        """Converte respostas de erro do endpoint do modelo em ValueError."""
+        if response.status == 401:
+            raise ValueError("Erro de autenticação: Chave de API inválida ou endpoint incorreto")
+        elif response.status == 404:
+            raise ValueError("Endpoint não encontrado. Verifique a URL do modelo")
+        elif response.status == 429:
+            raise RateLimitedError("Limite de requisições do modelo excedido")
+        elif response.status >= 500:
+            error_text = await response.text()
+            raise TransientModelError(f"Erro na chamada ao modelo: {error_text}")
+        elif response.status != 200:
+            error_text = await response.text()
+            raise ValueError(f"Erro na chamada ao modelo: {error_text}")
+
+    def _retry_delay(self, attempt: int) -> float:
+        """Calcula a espera antes da próxima tentativa (backoff exponencial com jitter completo)."""
+        delay = min(settings.MODEL_RETRY_MAX_DELAY, settings.MODEL_RETRY_BASE_DELAY * (2 ** attempt))
+        return random.uniform(0, delay)
+
+    def _model_error(self, error: Exception) -> ValueError:
+        """Converte um erro transitório esgotado em ValueError com a mensagem adequada."""
+        if isinstance(error, asyncio.TimeoutError):
+            message = "Tempo limite excedido na chamada ao modelo"
+        elif isinstance(error, aiohttp.ClientError):
+            message = f"Erro de conexão: {str(error)}"
+        else:
+            message = str(error)
+        logger.error(message)
+        return ValueError(message)
+
+    async def _wait_before_retry(self, attempt: int, error: Exception, model: Optional[str] = None, failed: Optional[Set[str]] = None):
+        """Aguarda o backoff antes de repetir uma chamada que falhou de forma transitória.
+        
+        Se outro endpoint do modelo estiver disponível, a nova tentativa vai para ele sem espera;
+        caso contrário, os endpoints que falharam voltam a ser elegíveis após o backoff.
+        """
+        if failed is not None:
+            if self.router.available(model, exclude=failed):
+                logger.warning(
+                    f"Falha transitória na chamada ao modelo ({str(error) or type(error).__name__}); "
+                    f"tentativa {attempt + 1} em outro endpoint"
+                )
+                return
+            failed.clear()
+        delay = self._retry_delay(attempt)
+        logger.warning(
+            f"Falha transitória na chamada ao modelo ({str(error) or type(error).__name__}); "
+            f"tentativa {attempt + 1} em {delay:.2f}s"
+        )
+        await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def _open_completion(
         self,
-        user_message: str,
-        flow: Flow
+        endpoint: ModelEndpoint,
+        payload: Dict[str, Any],
+        estimated_tokens: int,
+        budget: RetryBudget,
+        model: Optional[str] = None
+    ):
+        """Abre a requisição ao endpoint respeitando o seu limitador.
+        
+        Respostas 429 pausam o limitador e a requisição volta para a fila, a menos
+        que outro endpoint do modelo esteja disponível: nesse caso ela falha com
+        RateLimitedError para ser enviada a ele. Cada reenvio consome o orçamento
+        da chamada, o mesmo usado pelas novas tentativas do chamador.
+        """
+        session = await self._get_session()
+        while True:
+            with tracer.start_span("model.rate_limit_wait", {"estimated_tokens": estimated_tokens}):
+                await endpoint.rate_limiter.acquire(estimated_tokens)
+            
+            # Propaga o contexto do trace para o endpoint do modelo
+            span = current_span()
+            headers = {"api-key": endpoint.api_key}
+            if span is not None:
+                headers["traceparent"] = span.traceparent()
+            async with session.post(
+                endpoint.url,
+                json=payload,
+                headers=headers
+            ) as response:
+                if span is not None:
+                    span.set_attribute("http.status_code", response.status)
+                endpoint.rate_limiter.update_from_headers(response.headers, response.status)
+                if (
+                    response.status == 429
+                    and not self.router.available(model, exclude={endpoint.name})
+                    and budget.spend(rate_limited=True)
+                ):
+                    continue
+                
+                await self._check_response_status(response)
+                yield response
+                return
+
+    def _record_endpoint_error(self, endpoint: ModelEndpoint, error: Exception):
+        """Conta no disjuntor do endpoint as falhas que indicam problema nele (5xx, conexão, tempo limite)."""
+        if not isinstance(error, RateLimitedError):
+            endpoint.record_failure()
+
+    async def _post_completion(self, payload: Dict[str, Any], model: Optional[str] = None) -> Dict[str, Any]:
+        """Envia o payload a um endpoint do modelo e retorna a resposta decodificada.
+        
+        Falhas transitórias são repetidas em outro endpoint do mesmo modelo, se houver.
+        """
+        estimated_tokens = estimate_request_tokens(payload)
+        flow_id, step_name = current_step_labels()
+        budget = RetryBudget()
+        failed: Set[str] = set()  # Endpoints que falharam nesta chamada
+        while True:
+            endpoint = self.router.select(model, exclude=failed)
+            try:
+                with endpoint.track(), \
+                        observe_duration(MODEL_REQUEST_DURATION, flow_id=flow_id, step_name=step_name, endpoint=endpoint.name), \
+                        tracer.start_span("model.request", {"deployment": endpoint.deployment, "endpoint": endpoint.name, "attempt": budget.used}):
+                    async with self._open_completion(endpoint, payload, estimated_tokens, budget, model) as response:
+                        with tracer.start_span("model.decode_json"):
+                            response_data = json_codec.loads(await response.read())
+                    endpoint.record_success()
+                
+                usage = response_data.get("usage") or {}
+                endpoint.rate_limiter.record_usage(estimated_tokens, usage.get("total_tokens"))
+                record_token_usage(usage)
+                return response_data
+                
+            except RETRYABLE_ERRORS as e:
+                self._record_endpoint_error(endpoint, e)
+                if not budget.spend(rate_limited=isinstance(e, RateLimitedError)):
+                    raise self._model_error(e)
+                failed.add(endpoint.name)
+                await self._wait_before_retry(budget.used - 1, e, model, failed)
+            except json_codec.JSONDecodeError as e:
+                logger.error(f"Erro ao processar resposta do modelo: {str(e)}")
+                raise ValueError(f"Erro ao processar resposta do modelo: {str(e)}")
+            except Exception as e:
+                logger.error(f"Erro inesperado: {str(e)}")
+                raise ValueError(f"Erro inesperado: {str(e)}")
+
+    async def chat_completion_stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 100,
+        model: Optional[str] = None,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """Realiza uma chamada de conclusão de chat em modo streaming, produzindo os trechos de texto gerados."""
+        payload = self._build_payload(messages, temperature, max_tokens, **kwargs)
+        payload["stream"] = True
+        estimated_tokens = estimate_request_tokens(payload)
+        flow_id, step_name = current_step_labels()
+        
+        # Só há nova tentativa enquanto nenhum trecho tiver sido entregue ao chamador
+        budget = RetryBudget()
+        streamed = False
+        failed: Set[str] = set()
+        while True:
+            endpoint = self.router.select(model, exclude=failed)
+            try:
+                with endpoint.track(), \
+                        observe_duration(MODEL_REQUEST_DURATION, flow_id=flow_id, step_name=step_name, endpoint=endpoint.name), \
+                        tracer.start_span("model.request", {"deployment": endpoint.deployment, "endpoint": endpoint.name, "attempt": budget.used, "stream": True}):
+                    async with self._open_completion(endpoint, payload, estimated_tokens, budget, model) as response:
+                        # A resposta chega como Server-Sent Events: uma linha "data: {...}" por trecho
+                        async for raw_line in response.content:
+                            line = raw_line.decode("utf-8").strip()
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[len("data:"):].strip()
+                            if data == "[DONE]":
+                                break
+                            
+                            chunk = json_codec.loads(data)
+                            record_token_usage(chunk.get("usage"))
+                            for choice in chunk.get("choices", []):
+                                delta = (choice.get("delta") or {}).get("content")
+                                if delta:
+                                    streamed = True
+                                    yield delta
+                    endpoint.record_success()
+                return
+                
+            except RETRYABLE_ERRORS as e:
+                self._record_endpoint_error(endpoint, e)
+                if streamed or not budget.spend(rate_limited=isinstance(e, RateLimitedError)):
+                    raise self._model_error(e)
+                failed.add(endpoint.name)
+                await self._wait_before_retry(budget.used - 1, e, model, failed)
+            except json_codec.JSONDecodeError as e:
+                logger.error(f"Erro ao processar resposta do modelo: {str(e)}")
+                raise ValueError(f"Erro ao processar resposta do modelo: {str(e)}")
+
+    def _step_cache_settings(self, flow: Flow, step: FlowStep):
+        """Define se o passo usa o cache de respostas e com qual TTL."""
+        if step.cache_enabled is not None:
+            use_cache = step.cache_enabled
+        else:
+            # No nível do fluxo, apenas passos determinísticos usam o cache
+            use_cache = flow.cache_enabled and step.temperature == 0
+        
+        cache_ttl = step.cache_ttl_seconds if step.cache_ttl_seconds is not None else flow.cache_ttl_seconds
+        return use_cache, cache_ttl
+
+    def _step_input_limit(self, step: FlowStep) -> int:
+        """Limite de tokens do prompt de um passo: o menor entre max_input_tokens e o que sobra do contexto."""
+        context_limit = settings.MODEL_CONTEXT_TOKENS - step.max_tokens
+        if step.max_input_tokens is not None:
+            return min(step.max_input_tokens, context_limit)
+        return context_limit
+
+    def _step_input_policy(self, step: FlowStep) -> str:
+        """Política do passo para prompts acima do limite."""
+        return step.input_policy or settings.TOKEN_LIMIT_POLICY
+
+    def project_token_usage(
+        self,
+        flow: Flow,
+        user_message: Optional[str] = None,
+        variables: Optional[Dict[str, str]] = None
     ) -> Dict[str, Any]:
-        """Processa uma mensagem de usuário através de um fluxo."""
+        """Projeta o uso de tokens de cada passo sem chamar o modelo.
+        
+        Entradas vindas de outros passos (inclusive as usadas nos templates de prompt) são
+        contadas pelo máximo que eles podem gerar (max_tokens), então prompt_tokens_max é um
+        limite superior e prompt_tokens_min conta apenas o que já é conhecido (prompt de
+        sistema com as variáveis informadas e mensagem do usuário).
+        """
+        user_tokens = self.token_counter.count(user_message or "")
+        known_outputs = {USER_MESSAGE_INPUT: user_message} if user_message else {}
+        
+        # Só os valores dos campos e a mensagem do usuário são contados a cada projeção
+        steps = {}
+        for plan in flow.token_plan(self.token_counter, self._build_token_plan):
+            known_tokens = plan.fixed_tokens + sum(
+                self.token_counter.count(value) for value in plan.template.known_values(variables, known_outputs)
+            )
+            if plan.uses_user_message:
+                known_tokens += user_tokens
+            steps[plan.step_name] = {
+                "prompt_tokens_min": known_tokens,
+                "prompt_tokens_max": known_tokens + plan.upstream_tokens,
+                "max_completion_tokens": plan.max_completion_tokens,
+                "input_limit": plan.input_limit,
+                "input_policy": plan.input_policy,
+                "exceeds_limit": known_tokens > plan.input_limit,
+                "may_exceed_limit": known_tokens + plan.upstream_tokens > plan.input_limit
+            }
+        
+        prompt_tokens_max = sum(step["prompt_tokens_max"] for step in steps.values())
+        max_completion_tokens = sum(step["max_completion_tokens"] for step in steps.values())
+        return {
+            "flow_name": flow.name,
+            "exact": self.token_counter.exact,
+            "steps": steps,
+            "prompt_tokens_min": sum(step["prompt_tokens_min"] for step in steps.values()),
+            "prompt_tokens_max": prompt_tokens_max,
+            "max_completion_tokens": max_completion_tokens,
+            "max_cost": (
+                prompt_tokens_max * settings.MODEL_PROMPT_PRICE_PER_1K
+                + max_completion_tokens * settings.MODEL_COMPLETION_PRICE_PER_1K
+            ) / 1000
+        }
+
+    def _build_token_plan(self, flow: Flow) -> List["StepTokenPlan"]:
+        """Contagens de tokens fixas de cada passo do fluxo, na ordem de execução."""
+        sorted_steps = sorted(flow.steps, key=lambda x: x.step_order)
+        dependencies = resolve_step_dependencies(sorted_steps)
+        templates = flow.prompt_templates()
+        steps_by_name = {step.step_name: step for step in sorted_steps}
+        
+        plans = []
+        for step in sorted_steps:
+            inputs = dependencies[step.step_name]
+            template = templates[step.step_name]
+            fixed_tokens = TOKENS_PER_REPLY + 2 * TOKENS_PER_MESSAGE + self.token_counter.count(template.literal_text)
+            if len(inputs) > 1:
+                # Cabeçalhos que identificam cada entrada na mensagem combinada
+                fixed_tokens += self.token_counter.count("\n\n".join(f"### {name}\n" for name in inputs))
+            upstream_tokens = sum(steps_by_name[name].max_tokens for name in inputs if name != USER_MESSAGE_INPUT)
+            upstream_tokens += sum(steps_by_name[name].max_tokens for name in template.step_references)
+            plans.append(StepTokenPlan(
+                step_name=step.step_name,
+                template=template,
+                fixed_tokens=fixed_tokens,
+                upstream_tokens=upstream_tokens,
+                uses_user_message=USER_MESSAGE_INPUT in inputs,
+                max_completion_tokens=step.max_tokens,
+                input_limit=self._step_input_limit(step),
+                input_policy=self._step_input_policy(step)
+            ))
+        return plans
+
+    def _preflight_token_limits(
+        self,
+        user_message: str,
+        flow: Flow,
+        checkpoint: Optional[Dict[str, str]] = None,
+        variables: Optional[Dict[str, str]] = None
+    ):
+        """Rejeita a execução antes da primeira chamada se algum passo com a política
+        reject certamente exceder o limite de tokens."""
+        projection = self.project_token_usage(flow, user_message, variables)
+        for step_name, projected in projection["steps"].items():
+            if checkpoint and step_name in checkpoint:
+                continue
+            if projected["input_policy"] == "reject" and projected["exceeds_limit"]:
+                raise TokenLimitError(
+                    f"O prompt do passo '{step_name}' tem pelo menos {projected['prompt_tokens_min']} tokens "
+                    f"e excede o limite de {projected['input_limit']}"
+                )
+
+    async def _summarize_input(self, text: str, max_tokens: int) -> Tuple[str, Dict[str, Any]]:
+        """Resume um texto em até max_tokens tokens; retorna o resumo e o uso de tokens da chamada."""
+        # O texto a resumir também precisa caber no contexto do modelo
+        summary_limit = (
+            settings.MODEL_CONTEXT_TOKENS - max_tokens - TOKENS_PER_REPLY - 2 * TOKENS_PER_MESSAGE
+            - self.token_counter.count_prompt(SUMMARY_PROMPT)
+        )
+        response = await self.chat_completion(
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": self.token_counter.truncate(text, summary_limit)}
+            ],
+            temperature=0.0,
+            max_tokens=max_tokens
+        )
+        return response["choices"][0]["message"]["content"], response.get("usage") or {}
+
+    async def _fit_step_input(self, step: FlowStep, messages: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], Dict[str, Any], Dict[str, Any]]:
+        """Aplica a política do passo se o prompt exceder o limite de tokens.
+        
+        Retorna as mensagens a enviar, a contagem de tokens e o uso de tokens do resumo (se houver).
+        """
+        limit = self._step_input_limit(step)
+        prompt_tokens = self.token_counter.count_messages(messages)
+        token_count: Dict[str, Any] = {"prompt_tokens": prompt_tokens, "input_limit": limit}
+        if prompt_tokens <= limit:
+            return messages, token_count, {}
+        
+        policy = self._step_input_policy(step)
+        available = limit - self.token_counter.count_messages(messages[:1]) - TOKENS_PER_MESSAGE
+        if policy == "reject" or available <= 0:
+            raise TokenLimitError(f"O prompt tem {prompt_tokens} tokens e excede o limite de {limit}")
+        
+        summary_usage: Dict[str, Any] = {}
+        content = messages[1]["content"]
+        if policy == "summarize":
+            content, summary_usage = await self._summarize_input(content, available)
+        # O resumo é truncado também, caso a contagem do modelo difira da local
+        content = self.token_counter.truncate(content, available)
+        
+        fitted = [messages[0], {"role": "user", "content": content}]
+        token_count.update({
+            "prompt_tokens": self.token_counter.count_messages(fitted),
+            "original_prompt_tokens": prompt_tokens,
+            "input_action": "summarized" if policy == "summarize" else "truncated"
+        })
+        logger.info(f"Entrada do passo '{step.step_name}' {token_count['input_action']}: {prompt_tokens} -> {token_count['prompt_tokens']} tokens")
+        return fitted, token_count, summary_usage
+
+    def _effective_timeout(self, flow: Flow, deadline: Optional[float]) -> Optional[float]:
+        """Retorna o menor prazo entre o timeout do fluxo e o prazo da requisição."""
+        limits = [limit for limit in (flow.timeout_seconds, deadline) if limit is not None]
+        return min(limits) if limits else None
+
+    def _validate_flow_input(self, user_message: str, flow: Flow, variables: Optional[Dict[str, str]] = None):
+        """Valida a mensagem do usuário, o fluxo e as variáveis dos prompts antes da execução."""
         if not user_message:
             raise ValueError("A mensagem do usuário não pode estar vazia")
         
@@ -110,48 +642,450 @@ class ModelIntegration:
         if not flow.is_active:
             raise ValueError("O fluxo não está ativo")
         
-        # Ordena os passos
-        sorted_steps = sorted(flow.steps, key=lambda x: x.step_order)
+        unknown_models = {step.model for step in flow.steps if step.model} - set(self.router.models)
+        if unknown_models:
+            raise ValueError(f"Nenhum endpoint configurado para os modelos: {', '.join(sorted(unknown_models))}")
+        
+        check_variables(flow.prompt_templates().values(), variables)
+
+    def _build_step_input(self, step_inputs: Dict[str, str]) -> str:
+        """Combina as entradas de um passo em uma única mensagem de usuário."""
+        if len(step_inputs) == 1:
+            return next(iter(step_inputs.values()))
+        return "\n\n".join(f"### {name}\n{content}" for name, content in step_inputs.items())
+
+    async def _execute_step(
+        self,
+        flow: Flow,
+        step: FlowStep,
+        messages: List[Dict[str, str]],
+        on_token: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Executa um passo e retorna a resposta do assistente e os detalhes da execução:
+        mensagens enviadas, contagem local de tokens e uso informado pelo modelo.
         
-        # Inicializa a lista de mensagens
-        messages = []
-        last_response = user_message
-        step_responses = {}
+        Antes da chamada, o prompt é ajustado ao limite de tokens conforme a política do passo.
+        Com on_token, os trechos gerados são emitidos como eventos "token" à medida que chegam.
+        Respostas em streaming não trazem o uso de tokens.
+        """
+        use_cache, cache_ttl = self._step_cache_settings(flow, step)
+        # Passos com cache ou coalescência recebem a resposta completa, emitida como um único trecho
+        streaming = on_token is not None and not (use_cache and self.completion_cache is not None) and not step.coalesce_requests
+        span_attributes = {"flow_id": flow.flow_id, "step_name": step.step_name, "step_order": step.step_order, "streaming": streaming}
         
-        # Processa cada passo
-        for step in sorted_steps:
-            # Cria a mensagem para o passo atual
-            messages = [
-                {"role": "system", "content": step.system_prompt},
-                {"role": "user", "content": last_response}
-            ]
+        with tracer.start_span("flow.step", span_attributes) as span:
+            messages, token_count, summary_usage = await self._fit_step_input(step, messages)
+            span.set_attribute("prompt_tokens", token_count["prompt_tokens"])
+            details = {"messages": messages, "token_count": token_count, "usage": summary_usage, "cached": False}
             
-            try:
-                # Chama o modelo
+            if not streaming:
+                # Chamada completa, que pode ser servida pelo cache de respostas
                 response = await self.chat_completion(
                     messages=messages,
                     temperature=step.temperature,
-                    max_tokens=step.max_tokens
+                    max_tokens=step.max_tokens,
+                    use_cache=use_cache,
+                    cache_ttl=cache_ttl,
+                    model=step.model,
+                    coalesce=step.coalesce_requests
                 )
-                
-                # Extrai a resposta do assistente
                 assistant_message = response["choices"][0]["message"]["content"]
-                
-                # Armazena a resposta
-                step_responses[step.step_name] = {
-                    "assistant_message": assistant_message,
-                    "messages": messages
+                if on_token is not None:
+                    await on_token({"event": "token", "step_name": step.step_name, "content": assistant_message})
+                details["usage"] = self._add_usage(summary_usage, response.get("usage") or {})
+                details["cached"] = response.get("cached", False)
+                return assistant_message, details
+            
+            parts = []
+            async for delta in self.chat_completion_stream(
+                messages=messages,
+                temperature=step.temperature,
+                max_tokens=step.max_tokens,
+                model=step.model
+            ):
+                parts.append(delta)
+                await on_token({"event": "token", "step_name": step.step_name, "content": delta})
+            return "".join(parts), details
+
+    def _add_usage(self, *usages: Dict[str, Any]) -> Dict[str, Any]:
+        """Soma o uso de tokens de várias chamadas ao modelo."""
+        total: Dict[str, Any] = {}
+        for usage in usages:
+            for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+                if usage.get(key) is not None:
+                    total[key] = total.get(key, 0) + usage[key]
+        return total
+
+    async def _run_flow(
+        self,
+        user_message: str,
+        flow: Flow,
+        on_event: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+        stream_tokens: bool = False,
+        checkpoint: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+        verbose: bool = True,
+        variables: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        """Executa os passos do fluxo respeitando suas dependências.
+        
+        Cada passo começa assim que suas entradas ficam prontas, de modo que
+        passos independentes são executados em paralelo. on_event recebe os
+        eventos step_start e step_end (e token, se stream_tokens for True).
+        Passos presentes em checkpoint reutilizam a saída salva sem chamar o modelo.
+        Ao fim do timeout (s), os passos em andamento são cancelados.
+        Com verbose=False, o resultado de cada passo não traz as mensagens enviadas ao modelo.
+        Os prompts de sistema são renderizados com variables e com as saídas dos passos anteriores.
+        """
+        checkpoint = checkpoint or {}
+        sorted_steps = sorted(flow.steps, key=lambda x: x.step_order)
+        dependencies = resolve_step_dependencies(sorted_steps)
+        templates = flow.prompt_templates()
+        waits = resolve_step_waits(dependencies, templates)
+        steps_by_name = {step.step_name: step for step in sorted_steps}
+        
+        outputs: Dict[str, str] = {USER_MESSAGE_INPUT: user_message}
+        step_responses: Dict[str, Dict[str, Any]] = {}
+        tasks: Dict[str, asyncio.Task] = {}
+        failed_steps: List[str] = []
+        step_records: Dict[str, Dict[str, Any]] = {}  # Registros dos passos para o histórico
+        
+        async def run_step(step: FlowStep) -> str:
+            # Aguarda os passos dos quais este depende, como entrada ou no prompt
+            inputs = dependencies[step.step_name]
+            await asyncio.gather(*(tasks[name] for name in waits[step.step_name] if name in tasks))
+            
+            # Cria a mensagem para o passo atual
+            messages = [
+                {"role": "system", "content": templates[step.step_name].render(variables, outputs)},
+                {"role": "user", "content": self._build_step_input({name: outputs[name] for name in inputs})}
+            ]
+            
+            if on_event is not None:
+                await on_event({"event": "step_start", "step_name": step.step_name, "step_order": step.step_order})
+            
+            resumed = step.step_name in checkpoint
+            step_started_at = time.perf_counter()
+            if resumed:
+                assistant_message = checkpoint[step.step_name]
+                step_records[step.step_name] = build_step_record(step.step_name, messages, "success", 0.0, resumed=True)
+            else:
+                # Rótulos das métricas das chamadas ao modelo feitas por este passo
+                set_step_labels(flow.flow_id, step.step_name)
+                try:
+                    with observe_duration(STEP_DURATION, flow_id=flow.flow_id or "", step_name=step.step_name):
+                        assistant_message, details = await asyncio.wait_for(
+                            self._execute_step(flow, step, messages, on_event if stream_tokens else None),
+                            timeout=step.timeout_seconds
+                        )
+                except asyncio.TimeoutError:
+                    failed_steps.append(step.step_name)
+                    message = f"Tempo limite do passo excedido ({step.timeout_seconds}s)"
+                    step_records[step.step_name] = build_step_record(
+                        step.step_name, messages, "timeout", time.perf_counter() - step_started_at, error=message
+                    )
+                    logger.error(f"Erro ao processar passo '{step.step_name}': {message}")
+                    raise StepTimeoutError(f"Erro ao processar passo '{step.step_name}': {message}", failed_step=step.step_name)
+                except Exception as e:
+                    failed_steps.append(step.step_name)
+                    step_records[step.step_name] = build_step_record(
+                        step.step_name, messages, "error", time.perf_counter() - step_started_at, error=str(e)
+                    )
+                    logger.error(f"Erro ao processar passo '{step.step_name}': {str(e)}")
+                    raise ValueError(f"Erro ao processar passo '{step.step_name}': {str(e)}")
+                messages = details["messages"]
+                step_records[step.step_name] = build_step_record(
+                    step.step_name,
+                    messages,
+                    "success",
+                    time.perf_counter() - step_started_at,
+                    usage=details["usage"],
+                    cached=details["cached"]
+                )
+            
+            # Armazena a resposta
+            outputs[step.step_name] = assistant_message
+            step_responses[step.step_name] = {"assistant_message": assistant_message}
+            if verbose:
+                step_responses[step.step_name]["messages"] = messages
+            if resumed:
+                step_responses[step.step_name]["resumed"] = True
+            else:
+                step_responses[step.step_name]["token_count"] = {
+                    **details["token_count"],
+                    "completion_tokens": details["usage"].get("completion_tokens")
                 }
-                
-                # Atualiza a última resposta para o próximo passo
-                last_response = assistant_message
-                
+            
+            if on_event is not None:
+                await on_event({
+                    "event": "step_end",
+                    "step_name": step.step_name,
+                    "assistant_message": assistant_message,
+                    "resumed": resumed
+                })
+            return assistant_message
+        
+        span_attributes = {"flow_id": flow.flow_id, "flow_name": flow.name, "steps_count": len(sorted_steps)}
+        with tracer.start_span("flow.execute", span_attributes):
+            # Cria as tarefas em ordem topológica para que as dependências já existam
+            for step_name in self._topological_order(waits):
+                tasks[step_name] = asyncio.create_task(run_step(steps_by_name[step_name]))
+            
+            FLOWS_IN_PROGRESS.inc()
+            execution_id = new_execution_id() if self.execution_recorder is not None else None
+            started_at_utc = datetime.utcnow()
+            started_at = time.perf_counter()
+            status = "error"
+            error = None
+            try:
+                await asyncio.wait_for(asyncio.gather(*tasks.values()), timeout=timeout)
+                status = "success"
+            except asyncio.TimeoutError as e:
+                status = "timeout"
+                error = f"Tempo limite do fluxo excedido ({timeout}s)"
+                logger.error(f"Tempo limite do fluxo '{flow.name}' excedido ({timeout}s)")
+                raise FlowTimeoutError(
+                    f"Tempo limite do fluxo excedido ({timeout}s)",
+                    completed_steps={name: response["assistant_message"] for name, response in step_responses.items()}
+                ) from e
+            except StepTimeoutError as e:
+                status = "timeout"
+                error = str(e)
+                raise StepTimeoutError(
+                    str(e),
+                    failed_step=e.failed_step,
+                    completed_steps={name: response["assistant_message"] for name, response in step_responses.items()}
+                ) from e
             except Exception as e:
-                logger.error(f"Erro ao processar passo '{step.step_name}': {str(e)}")
-                raise ValueError(f"Erro ao processar passo '{step.step_name}': {str(e)}")
+                error = str(e)
+                # Preserva as saídas concluídas para que a execução possa ser retomada
+                raise FlowExecutionError(
+                    str(e),
+                    failed_step=failed_steps[0] if failed_steps else None,
+                    completed_steps={name: response["assistant_message"] for name, response in step_responses.items()}
+                ) from e
+            finally:
+                for task in tasks.values():
+                    if not task.done():
+                        task.cancel()
+                FLOWS_IN_PROGRESS.dec()
+                duration = time.perf_counter() - started_at
+                FLOW_DURATION.labels(flow_id=flow.flow_id or "", status=status).observe(duration)
+                if execution_id is not None:
+                    self.execution_recorder.record(build_execution_record(
+                        execution_id,
+                        flow.flow_id,
+                        flow.name,
+                        flow.version,
+                        user_message,
+                        [step_records[step.step_name] for step in sorted_steps if step.step_name in step_records],
+                        status,
+                        started_at_utc,
+                        duration,
+                        error=error
+                    ))
         
-        return {
+        # Mantém a ordem dos passos no resultado e usa o último passo como resposta final
+        result = {
             "flow_name": flow.name,
-            "steps": step_responses,
-            "final_response": last_response
-        }
\ No newline at end of file
+            "steps": {step.step_name: step_responses[step.step_name] for step in sorted_steps},
+            "final_response": outputs[sorted_steps[-1].step_name]
+        }
+        counted = [response["token_count"] for response in step_responses.values() if "token_count" in response]
+        result["token_count"] = {
+            "prompt_tokens": sum(count["prompt_tokens"] for count in counted),
+            "completion_tokens": sum(count["completion_tokens"] or 0 for count in counted)
+        }
+        if execution_id is not None:
+            result["execution_id"] = execution_id
+        return result
+
+    def _topological_order(self, dependencies: Dict[str, List[str]]) -> List[str]:
+        """Ordena os passos de forma que cada um venha depois de suas dependências."""
+        ordered, visited = [], set()
+        
+        def visit(step_name: str):
+            if step_name in visited or step_name == USER_MESSAGE_INPUT:
+                return
+            visited.add(step_name)
+            for dependency in dependencies[step_name]:
+                visit(dependency)
+            ordered.append(step_name)
+        
+        for step_name in dependencies:
+            visit(step_name)
+        return ordered
+
+    async def process_flow(
+        self,
+        user_message: str,
+        flow: Flow,
+        on_event: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+        checkpoint: Optional[Dict[str, str]] = None,
+        deadline: Optional[float] = None,
+        verbose: bool = True,
+        variables: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        """Processa uma mensagem de usuário através de um fluxo.
+        
+        on_event, se informado, é chamado no início e no fim de cada passo.
+        checkpoint mapeia nomes de passos já concluídos às suas saídas; esses
+        passos não são executados novamente. Em caso de falha, FlowExecutionError
+        traz as saídas concluídas para uma nova retomada.
+        deadline (s) limita a execução junto com o timeout_seconds do fluxo.
+        Passos cujo prompt certamente excede o limite de tokens, com a política
+        reject, fazem a execução falhar com TokenLimitError antes de qualquer chamada.
+        Com verbose=False, as mensagens enviadas em cada passo são omitidas do resultado.
+        variables preenche os campos {{nome}} dos prompts; sem alguma delas, a execução
+        falha com MissingVariablesError antes de qualquer chamada.
+        """
+        self.check_flow_request(user_message, flow, variables, checkpoint)
+        return await self._run_flow(
+            user_message,
+            flow,
+            on_event=on_event,
+            checkpoint=checkpoint,
+            timeout=self._effective_timeout(flow, deadline),
+            verbose=verbose,
+            variables=variables
+        )
+
+    def check_flow_request(
+        self,
+        user_message: str,
+        flow: Flow,
+        variables: Optional[Dict[str, str]] = None,
+        checkpoint: Optional[Dict[str, str]] = None
+    ):
+        """Verificações feitas antes de qualquer chamada ao modelo: entrada e fluxo válidos
+        (ValueError), variáveis dos prompts (MissingVariablesError) e limites de tokens
+        dos passos com a política reject (TokenLimitError)."""
+        self._validate_flow_input(user_message, flow, variables)
+        self._preflight_token_limits(user_message, flow, checkpoint, variables)
+
+    async def process_flow_stream(
+        self,
+        user_message: str,
+        flow: Flow,
+        deadline: Optional[float] = None,
+        variables: Optional[Dict[str, str]] = None,
+        checked: bool = False
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Processa uma mensagem através de um fluxo, produzindo eventos à medida que os passos avançam.
+        
+        Eventos: step_start, token (trecho gerado), step_end, flow_end e error.
+        Se o consumidor deixar de iterar (ex.: cliente desconectado), a execução é cancelada.
+        Com checked=True, check_flow_request já foi chamado antes (ex.: para responder
+        com o status HTTP adequado antes de iniciar o stream) e não é repetido.
+        """
+        if not checked:
+            self.check_flow_request(user_message, flow, variables)
+        
+        queue: asyncio.Queue = asyncio.Queue()
+        execution = asyncio.create_task(
+            self._run_flow(
+                user_message,
+                flow,
+                on_event=queue.put,
+                stream_tokens=True,
+                timeout=self._effective_timeout(flow, deadline),
+                variables=variables
+            )
+        )
+        execution.add_done_callback(lambda _: queue.put_nowait(None))
+        
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                yield event
+            
+            try:
+                result = execution.result()
+            except Exception as e:
+                yield {"event": "error", "detail": str(e)}
+                return
+            
+            yield {"event": "flow_end", "flow_name": flow.name, "final_response": result["final_response"]}
+        finally:
+            if not execution.done():
+                execution.cancel()
+
+    async def process_batch(
+        self,
+        user_messages: Union[Iterable[str], AsyncIterable[str]],
+        flow: Flow,
+        concurrency: int = 10,
+        verbose: bool = True,
+        variables: Optional[Dict[str, str]] = None,
+        flow_limiter: Optional[asyncio.Semaphore] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Processa várias mensagens através do mesmo fluxo com concorrência limitada.
+        
+        Produz um item por mensagem, na ordem de conclusão, identificado pelo índice da entrada.
+        Com verbose=False, os resultados não trazem as mensagens enviadas em cada passo.
+        variables preenche os prompts de todas as execuções do lote.
+        flow_limiter, se informado, é adquirido em cada execução, para que o lote respeite
+        o limite de execuções simultâneas compartilhado com as demais rotas.
+        """
+        if concurrency < 1:
+            raise ValueError("A concorrência deve ser pelo menos 1")
+        if not flow or not flow.steps:
+            raise ValueError("O fluxo deve ter pelo menos um passo")
+        
+        # Filas limitadas para que entradas grandes não sejam carregadas inteiras na memória
+        pending: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+        results: asyncio.Queue = asyncio.Queue()
+        
+        input_errors: List[Exception] = []
+        
+        async def produce():
+            index = 0
+            try:
+                if isinstance(user_messages, AsyncIterable):
+                    async for user_message in user_messages:
+                        await pending.put((index, user_message))
+                        index += 1
+                else:
+                    for user_message in user_messages:
+                        await pending.put((index, user_message))
+                        index += 1
+            except Exception as e:
+                input_errors.append(e)
+            # Sinaliza o fim das entradas para os workers
+            for _ in range(concurrency):
+                await pending.put(None)
+        
+        async def work():
+            while True:
+                item = await pending.get()
+                if item is None:
+                    break
+                index, user_message = item
+                try:
+                    async with flow_limiter or nullcontext():
+                        result = await self.process_flow(user_message=user_message, flow=flow, verbose=verbose, variables=variables)
+                    await results.put({"index": index, "result": result})
+                except Exception as e:
+                    await results.put({"index": index, "error": str(e)})
+            await results.put(None)
+        
+        producer = asyncio.create_task(produce())
+        workers = [asyncio.create_task(work()) for _ in range(concurrency)]
+        
+        try:
+            finished_workers = 0
+            while finished_workers < concurrency:
+                item = await results.get()
+                if item is None:
+                    finished_workers += 1
+                    continue
+                yield item
+            # Propaga erros ocorridos ao ler as entradas
+            if input_errors:
+                raise input_errors[0]
+        finally:
+            for task in [producer, *workers]:
+                if not task.done():
+                    task.cancel()
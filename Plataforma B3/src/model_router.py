@@ -0,0 +1,272 @@
+import json
+import random
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Set
+from urllib.parse import urlparse
+import logging
+
+from config import settings
+from metrics import MODEL_ENDPOINT_OUTSTANDING, MODEL_ENDPOINT_STATE
+from rate_limiter import RateLimiter
+
+# Configuração básica de logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Estratégias de escolha do endpoint
+ROUTING_STRATEGIES = ("least_outstanding", "headroom")
+
+# Disjuntor de um endpoint: após failure_threshold falhas seguidas, o endpoint deixa de
+# receber tráfego por reset_seconds; depois disso, uma requisição de teste decide se ele volta
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        if failure_threshold < 1:
+            raise ValueError("O limite de falhas do disjuntor deve ser pelo menos 1")
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    # closed (normal), open (sem tráfego) ou half_open (aguardando a requisição de teste)
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    # Indica se o endpoint pode receber uma nova requisição
+    def allows_request(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        # Meio aberto: apenas uma requisição de teste por vez
+        return state == "half_open" and not self._probing
+
+    # Marca o início de uma requisição (a de teste, se o disjuntor estiver meio aberto)
+    def on_request(self):
+        if self.state == "half_open":
+            self._probing = True
+
+    def record_success(self):
+        self.failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+        self._probing = False
+
+    # Encerra uma requisição de teste sem resultado (ex.: cancelada ou limitada por 429)
+    def release_probe(self):
+        self._probing = False
+
+# Um deployment do modelo, com limitador e disjuntor próprios
+class ModelEndpoint:
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        api_key: str,
+        deployment: str,
+        model: Optional[str] = None,
+        weight: float = 1.0,
+        rate_limiter: Optional[RateLimiter] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None
+    ):
+        parsed_url = urlparse(url)
+        if not parsed_url.scheme or not parsed_url.netloc:
+            raise ValueError(f"URL do endpoint {name} inválida")
+        if not api_key:
+            raise ValueError(f"API_KEY do endpoint {name} não pode ser vazia")
+        if weight <= 0:
+            raise ValueError(f"O peso do endpoint {name} deve ser positivo")
+
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+        self.deployment = deployment
+        self.model = model or deployment  # Nome lógico usado por FlowStep.model
+        self.weight = weight
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.outstanding = 0  # Requisições em andamento
+        self.requests = 0
+        self.failures = 0
+
+    # Fração do orçamento de requisições/tokens ainda disponível (1.0 sem limites configurados)
+    def headroom(self) -> float:
+        if self.rate_limiter.paused():
+            return 0.0
+        fractions = [1.0]
+        for bucket in (self.rate_limiter.requests, self.rate_limiter.tokens):
+            if bucket is not None:
+                fractions.append(bucket.fraction_available())
+        return min(fractions)
+
+    # Conta a requisição como em andamento enquanto o bloco executa
+    @contextmanager
+    def track(self) -> Iterator["ModelEndpoint"]:
+        self.outstanding += 1
+        self.requests += 1
+        self.circuit_breaker.on_request()
+        MODEL_ENDPOINT_OUTSTANDING.labels(endpoint=self.name).set(self.outstanding)
+        try:
+            yield self
+        finally:
+            self.outstanding -= 1
+            # Uma requisição de teste sem sucesso nem falha registrados libera o próximo teste
+            self.circuit_breaker.release_probe()
+            MODEL_ENDPOINT_OUTSTANDING.labels(endpoint=self.name).set(self.outstanding)
+
+    def record_success(self):
+        self.circuit_breaker.record_success()
+        MODEL_ENDPOINT_STATE.labels(endpoint=self.name).set(0)
+
+    # Falha que indica problema no endpoint (5xx, conexão ou tempo limite)
+    def record_failure(self):
+        self.failures += 1
+        self.circuit_breaker.record_failure()
+        if self.circuit_breaker.state != "closed":
+            MODEL_ENDPOINT_STATE.labels(endpoint=self.name).set(1)
+            logger.warning(f"Disjuntor do endpoint {self.name} aberto após {self.circuit_breaker.failures} falhas")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "deployment": self.deployment,
+            "model": self.model,
+            "weight": self.weight,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "circuit_state": self.circuit_breaker.state,
+            "headroom": round(self.headroom(), 3),
+            "rate_limit": self.rate_limiter.stats()
+        }
+
+# Distribui as chamadas entre os deployments que servem o mesmo modelo
+class ModelRouter:
+    def __init__(self, endpoints: List[ModelEndpoint], strategy: str = "least_outstanding", default_model: Optional[str] = None):
+        if not endpoints:
+            raise ValueError("O roteador precisa de pelo menos um endpoint")
+        if strategy not in ROUTING_STRATEGIES:
+            raise ValueError(f"Estratégia de roteamento desconhecida: {strategy}")
+        names = [endpoint.name for endpoint in endpoints]
+        if len(set(names)) != len(names):
+            raise ValueError("Os nomes dos endpoints devem ser únicos")
+
+        self.endpoints = endpoints
+        self.strategy = strategy
+        self.default_model = default_model or endpoints[0].model
+        self._random = random.Random()
+
+    @property
+    def models(self) -> List[str]:
+        return sorted({endpoint.model for endpoint in self.endpoints})
+
+    # Endpoints que servem o modelo (None usa o modelo padrão)
+    def _candidates(self, model: Optional[str]) -> List[ModelEndpoint]:
+        model = model or self.default_model
+        candidates = [endpoint for endpoint in self.endpoints if endpoint.model == model]
+        if not candidates:
+            raise ValueError(f"Nenhum endpoint configurado para o modelo {model}")
+        return candidates
+
+    # Endpoints elegíveis: disjuntor fechado (ou em teste) e fora da lista de falhas desta chamada
+    def available(self, model: Optional[str] = None, exclude: Optional[Set[str]] = None) -> List[ModelEndpoint]:
+        exclude = exclude or set()
+        return [
+            endpoint for endpoint in self._candidates(model)
+            if endpoint.name not in exclude and endpoint.circuit_breaker.allows_request()
+        ]
+
+    # Escolhe o endpoint da próxima requisição. Se todos estiverem com o disjuntor aberto,
+    # usa os demais candidatos assim mesmo: sem alternativa, a requisição não é recusada
+    def select(self, model: Optional[str] = None, exclude: Optional[Set[str]] = None) -> ModelEndpoint:
+        candidates = self.available(model, exclude)
+        if not candidates:
+            candidates = [endpoint for endpoint in self._candidates(model) if endpoint.name not in (exclude or set())]
+        if not candidates:
+            candidates = self._candidates(model)
+        if len(candidates) == 1:
+            return candidates[0]
+
+        if self.strategy == "headroom":
+            scores = [endpoint.headroom() * endpoint.weight for endpoint in candidates]
+            best = max(scores)
+        else:
+            # Menos requisições em andamento em proporção ao peso
+            scores = [-(endpoint.outstanding + 1) / endpoint.weight for endpoint in candidates]
+            best = max(scores)
+        best_candidates = [endpoint for endpoint, score in zip(candidates, scores) if score == best]
+        # Empates são desfeitos por sorteio ponderado pelo peso
+        return self._random.choices(best_candidates, weights=[endpoint.weight for endpoint in best_candidates])[0]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "strategy": self.strategy,
+            "default_model": self.default_model,
+            "endpoints": [endpoint.stats() for endpoint in self.endpoints]
+        }
+
+# Monta a URL de chat completions de um deployment no formato do Azure OpenAI
+def deployment_url(base_url: str, deployment: str, api_version: str) -> str:
+    return f"{base_url.rstrip('/')}/openai/deployments/{deployment}/chat/completions?api-version={api_version}"
+
+# Cria o roteador a partir de MODEL_ENDPOINTS; sem a configuração, usa o deployment único de UFPB_*
+def create_model_router(api_key: str, rate_limiter: Optional[RateLimiter] = None) -> ModelRouter:
+    if not settings.MODEL_ENDPOINTS:
+        endpoint = ModelEndpoint(
+            name="default",
+            url=settings.MODEL_URL,
+            api_key=api_key,
+            deployment=settings.UFPB_LLM_DEPLOYMENT_NAME_4O,
+            rate_limiter=rate_limiter or RateLimiter(
+                requests_per_minute=settings.RATE_LIMIT_RPM,
+                tokens_per_minute=settings.RATE_LIMIT_TPM
+            ),
+            circuit_breaker=create_circuit_breaker()
+        )
+        return ModelRouter([endpoint], strategy=settings.MODEL_ROUTING_STRATEGY)
+
+    try:
+        specs = json.loads(settings.MODEL_ENDPOINTS)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"MODEL_ENDPOINTS deve ser uma lista JSON: {str(e)}")
+    if not isinstance(specs, list) or not specs:
+        raise ValueError("MODEL_ENDPOINTS deve ser uma lista JSON não vazia")
+
+    endpoints = []
+    for index, spec in enumerate(specs):
+        if not isinstance(spec, dict) or not spec.get("deployment"):
+            raise ValueError(f"Endpoint {index} de MODEL_ENDPOINTS deve ter o campo deployment")
+        endpoints.append(ModelEndpoint(
+            name=spec.get("name") or f"{spec['deployment']}_{index}",
+            url=deployment_url(
+                spec.get("base_url") or settings.UFPB_OPENAI_API_BASE,
+                spec["deployment"],
+                spec.get("api_version") or settings.UFPB_OPENAI_API_VERSION
+            ),
+            api_key=spec.get("api_key") or api_key,
+            deployment=spec["deployment"],
+            model=spec.get("model"),
+            weight=float(spec.get("weight", 1.0)),
+            rate_limiter=RateLimiter(
+                requests_per_minute=int(spec.get("rpm", settings.RATE_LIMIT_RPM)),
+                tokens_per_minute=int(spec.get("tpm", settings.RATE_LIMIT_TPM))
+            ),
+            circuit_breaker=create_circuit_breaker()
+        ))
+    return ModelRouter(endpoints, strategy=settings.MODEL_ROUTING_STRATEGY, default_model=settings.MODEL_DEFAULT or None)
+
+def create_circuit_breaker() -> CircuitBreaker:
+    return CircuitBreaker(
+        failure_threshold=settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+        reset_seconds=settings.CIRCUIT_BREAKER_RESET_SECONDS
+    )
@@ -0,0 +1,104 @@
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Campos dos templates de prompt:
+#   {{nome}}              variável informada na execução do fluxo
+#   {{steps.nome_passo}}  saída de um passo do fluxo
+#   {{user_message}}      mensagem do usuário
+# Para escrever chaves duplas literais antes de um nome, use {{{{: "{{{{nome}}" produz "{{nome}}".
+# Textos entre chaves duplas que não seguem esse formato são mantidos como estão.
+TEMPLATE_FIELD_PATTERN = re.compile(
+    r"(?P<escape>\{\{\{\{)|\{\{\s*(?:steps\.(?P<step>[a-zA-Z0-9_\-](?:[a-zA-Z0-9_\s\-]*[a-zA-Z0-9_\-])?)|(?P<variable>[A-Za-z_][A-Za-z0-9_]*))\s*\}\}"
+)
+
+# Nome reservado para a mensagem do usuário, igual a USER_MESSAGE_INPUT do flow_manager
+USER_MESSAGE_FIELD = "user_message"
+
+# Variáveis exigidas pelos prompts do fluxo que não foram informadas na execução
+class MissingVariablesError(ValueError):
+    def __init__(self, missing: Iterable[str]):
+        self.missing = sorted(missing)
+        super().__init__(f"Variáveis do prompt não informadas: {', '.join(self.missing)}")
+
+# Prompt compilado: o texto é analisado uma única vez, e a renderização apenas preenche
+# as posições dos campos em uma cópia da lista de trechos antes de juntá-los
+class PromptTemplate:
+    def __init__(self, text: str):
+        self.text = text
+        self._chunks: List[str] = []  # Trechos literais, com posições vazias para os campos
+        self._slots: List[Tuple[int, bool, str]] = []  # (posição, é saída de passo, nome)
+
+        position = 0
+        literal = ""  # Texto fixo acumulado desde o último campo, já sem os escapes
+        for match in TEMPLATE_FIELD_PATTERN.finditer(text):
+            literal += text[position:match.start()]
+            position = match.end()
+            if match.group("escape"):
+                literal += "{{"
+                continue
+            if literal:
+                self._chunks.append(literal)
+                literal = ""
+            step_name = match.group("step")
+            variable = match.group("variable")
+            if variable == USER_MESSAGE_FIELD:
+                step_name, variable = USER_MESSAGE_FIELD, None
+            self._slots.append((len(self._chunks), step_name is not None, step_name if step_name is not None else variable))
+            self._chunks.append("")
+        literal += text[position:]
+        if literal:
+            self._chunks.append(literal)
+        self._literal_text = "".join(self._chunks)
+
+        # Variáveis da execução e saídas de passos usadas, sem repetição e na ordem em que aparecem
+        self.variables: Tuple[str, ...] = tuple(dict.fromkeys(name for _, is_step, name in self._slots if not is_step))
+        self.step_references: Tuple[str, ...] = tuple(dict.fromkeys(
+            name for _, is_step, name in self._slots if is_step and name != USER_MESSAGE_FIELD
+        ))
+
+    # Indica se o prompt não tem campos a preencher
+    @property
+    def is_static(self) -> bool:
+        return not self._slots
+
+    # Preenche os campos com as variáveis da execução e as saídas dos passos
+    def render(self, variables: Optional[Dict[str, str]], outputs: Dict[str, str]) -> str:
+        if not self._slots:
+            return self._literal_text
+        variables = variables or {}
+        chunks = self._chunks.copy()
+        for index, is_step, name in self._slots:
+            source = outputs if is_step else variables
+            if name not in source:
+                if is_step:
+                    raise ValueError(f"Saída do passo '{name}' ainda não disponível para o prompt")
+                raise MissingVariablesError([name])
+            chunks[index] = source[name]
+        return "".join(chunks)
+
+    # Texto fixo do prompt, sem os campos; sua contagem de tokens não muda entre execuções
+    @property
+    def literal_text(self) -> str:
+        return self._literal_text
+
+    # Valores já conhecidos dos campos, na ordem em que aparecem, para projeções de tokens
+    def known_values(self, variables: Optional[Dict[str, str]] = None, outputs: Optional[Dict[str, str]] = None) -> List[str]:
+        variables = variables or {}
+        outputs = outputs or {}
+        values = []
+        for _, is_step, name in self._slots:
+            value = (outputs if is_step else variables).get(name)
+            if value:
+                values.append(value)
+        return values
+
+# Compila os prompts de uma lista de passos, por nome do passo
+def compile_prompts(steps) -> Dict[str, PromptTemplate]:
+    return {step.step_name: PromptTemplate(step.system_prompt) for step in steps}
+
+# Verifica se todas as variáveis usadas nos templates foram informadas
+def check_variables(templates: Iterable[PromptTemplate], variables: Optional[Dict[str, str]]):
+    variables = variables or {}
+    missing = {name for template in templates for name in template.variables if name not in variables}
+    if missing:
+        raise MissingVariablesError(missing)
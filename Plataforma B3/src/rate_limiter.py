@@ -0,0 +1,146 @@
+import asyncio
+import time
+from typing import Dict, Mapping, Optional
+import logging
+
+# Configuração básica de logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Balde de tokens com reposição contínua
+class TokenBucket:
+    def __init__(self, capacity: float, refill_per_second: float):
+        if capacity <= 0 or refill_per_second <= 0:
+            raise ValueError("Capacidade e taxa de reposição devem ser positivas")
+
+        self.capacity = capacity  # Quantidade máxima acumulada
+        self.refill_per_second = refill_per_second  # Quantidade reposta por segundo
+        self.available = capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self._updated_at) * self.refill_per_second)
+        self._updated_at = now
+
+    # Tempo (s) até que a quantidade pedida esteja disponível
+    def time_until(self, amount: float) -> float:
+        self._refill()
+        # Pedidos maiores que a capacidade aguardam apenas o balde encher
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.refill_per_second
+
+    # Consome uma quantidade (negativa para devolver); o saldo pode ficar negativo
+    def consume(self, amount: float):
+        self._refill()
+        self.available = min(self.capacity, self.available - amount)
+
+    # Fração da capacidade disponível agora (0 se o saldo estiver negativo)
+    def fraction_available(self) -> float:
+        self._refill()
+        return max(self.available, 0.0) / self.capacity
+
+    # Limita o saldo ao valor informado pelo servidor
+    def limit_available(self, amount: float):
+        self._refill()
+        self.available = min(self.available, amount)
+
+# Limitador de requisições e tokens por minuto para o endpoint do modelo.
+# Chamadas sem orçamento aguardam em fila (FIFO) em vez de serem rejeitadas.
+class RateLimiter:
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        # Limites iguais a zero desativam o respectivo balde
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60) if tokens_per_minute > 0 else None
+        self._lock = asyncio.Lock()
+        self._paused_until = 0.0
+
+        # Contadores para acompanhar o efeito do limitador
+        self.throttled = 0
+        self.wait_seconds = 0.0
+        self.rate_limited_responses = 0
+
+    # Aguarda até haver orçamento para uma requisição com a estimativa de tokens informada
+    async def acquire(self, estimated_tokens: int = 0):
+        async with self._lock:
+            waited = False
+            while True:
+                wait = self._paused_until - time.monotonic()
+                if self.requests is not None:
+                    wait = max(wait, self.requests.time_until(1))
+                if self.tokens is not None:
+                    wait = max(wait, self.tokens.time_until(estimated_tokens))
+                if wait <= 0:
+                    break
+                if not waited:
+                    self.throttled += 1
+                    waited = True
+                self.wait_seconds += wait
+                await asyncio.sleep(wait)
+
+            if self.requests is not None:
+                self.requests.consume(1)
+            if self.tokens is not None:
+                self.tokens.consume(estimated_tokens)
+
+    # Ajusta o saldo de tokens com o uso real informado pela resposta
+    def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        if self.tokens is not None and actual_tokens is not None:
+            self.tokens.consume(actual_tokens - estimated_tokens)
+
+    # Adapta o limitador aos cabeçalhos de rate limit retornados pelo servidor
+    def update_from_headers(self, headers: Mapping[str, str], status: int = 200):
+        remaining_requests = _parse_float(headers.get("x-ratelimit-remaining-requests"))
+        if remaining_requests is not None and self.requests is not None:
+            self.requests.limit_available(remaining_requests)
+
+        remaining_tokens = _parse_float(headers.get("x-ratelimit-remaining-tokens"))
+        if remaining_tokens is not None and self.tokens is not None:
+            self.tokens.limit_available(remaining_tokens)
+
+        retry_after = _parse_float(headers.get("retry-after-ms"))
+        if retry_after is not None:
+            retry_after /= 1000
+        else:
+            retry_after = _parse_float(headers.get("retry-after"))
+
+        if status == 429:
+            self.rate_limited_responses += 1
+            if retry_after is None:
+                retry_after = 1.0
+        if retry_after is not None:
+            self.pause(retry_after)
+
+    # Indica se as requisições estão suspensas por um retry-after
+    def paused(self) -> bool:
+        return self._paused_until > time.monotonic()
+
+    # Suspende novas requisições pelo tempo informado
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        logger.warning(f"Limite de requisições do modelo atingido; aguardando {seconds:.1f}s")
+
+    # Retorna os contadores do limitador
+    def stats(self) -> Dict[str, float]:
+        return {
+            "throttled": self.throttled,
+            "wait_seconds": self.wait_seconds,
+            "rate_limited_responses": self.rate_limited_responses,
+            "available_requests": self.requests.available if self.requests is not None else None,
+            "available_tokens": self.tokens.available if self.tokens is not None else None
+        }
+
+def _parse_float(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+# Estima os tokens de uma requisição (prompt + resposta máxima) sem tokenizador
+def estimate_request_tokens(payload: Dict) -> int:
+    prompt_chars = sum(len(message.get("content") or "") for message in payload.get("messages", []))
+    return prompt_chars // 4 + int(payload.get("max_tokens") or 0)
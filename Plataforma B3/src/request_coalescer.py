@@ -0,0 +1,48 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Tuple
+import logging
+
+# Configuração básica de logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Chamada em andamento compartilhada pelos chamadores com a mesma chave
+class _InflightCall:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0  # Chamadores aguardando o resultado
+
+# Single-flight: chamadas concorrentes com a mesma chave compartilham uma única execução.
+# A execução roda em uma tarefa própria; o cancelamento de um chamador não a interrompe
+# enquanto houver outros aguardando, e ela só é cancelada quando o último desiste.
+class RequestCoalescer:
+    def __init__(self):
+        self._calls: Dict[str, _InflightCall] = {}
+
+    # Número de chamadas distintas em andamento
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    # Executa factory() ou aguarda a execução em andamento com a mesma chave.
+    # Retorna o resultado e se ele foi compartilhado com uma chamada anterior.
+    async def run(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        call = self._calls.get(key)
+        shared = call is not None
+        if call is None:
+            call = _InflightCall(asyncio.ensure_future(factory()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task), shared
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Sem chamadores restantes: novas chamadas não devem receber a tarefa cancelada
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _forget(self, key: str, call: _InflightCall):
+        if self._calls.get(key) is call:
+            del self._calls[key]
@@ -0,0 +1,72 @@
+from functools import lru_cache
+from typing import Dict, List, Optional
+import logging
+
+from config import settings
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Configuração básica de logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Tokens adicionados pelo formato de chat: por mensagem e para iniciar a resposta do assistente
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+# Conta tokens localmente, sem chamar o modelo. Usa o tokenizador do tiktoken quando
+# instalado; sem ele, estima 4 caracteres por token, como estimate_request_tokens.
+class TokenCounter:
+    def __init__(self, encoding_name: Optional[str] = None, prompt_cache_size: int = 1024):
+        self.encoding_name = encoding_name or settings.TOKENIZER_ENCODING
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.get_encoding(self.encoding_name)
+            except Exception as e:
+                # Codificação desconhecida nesta versão do tiktoken, ou arquivo do vocabulário
+                # indisponível (o download exige acesso à rede)
+                logger.warning(
+                    f"Codificação {self.encoding_name} do tiktoken indisponível; a contagem de tokens "
+                    f"será estimada pelo número de caracteres: {str(e)}"
+                )
+        else:
+            logger.warning("tiktoken não instalado; a contagem de tokens será estimada pelo número de caracteres")
+
+        # Os prompts de sistema se repetem a cada execução do fluxo: sua contagem fica em cache
+        self.count_prompt = lru_cache(maxsize=prompt_cache_size)(self.count)
+
+    @property
+    def exact(self) -> bool:
+        return self._encoding is not None
+
+    # Número de tokens de um texto
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return len(text) // 4
+
+    # Tokens de uma lista de mensagens de chat; a primeira mensagem (system) usa o cache de prompts
+    def count_messages(self, messages: List[Dict[str, str]]) -> int:
+        total = TOKENS_PER_REPLY
+        for index, message in enumerate(messages):
+            content = message.get("content") or ""
+            is_prompt = index == 0 and message.get("role") == "system"
+            total += TOKENS_PER_MESSAGE + (self.count_prompt(content) if is_prompt else self.count(content))
+        return total
+
+    # Mantém o início do texto com no máximo max_tokens tokens
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if max_tokens <= 0:
+            return ""
+        if self._encoding is not None:
+            tokens = self._encoding.encode(text, disallowed_special=())
+            if len(tokens) <= max_tokens:
+                return text
+            return self._encoding.decode(tokens[:max_tokens])
+        return text[:max_tokens * 4]
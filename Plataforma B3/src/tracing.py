@@ -0,0 +1,212 @@
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import logging
+
+from config import settings
+
+# Configuração básica de logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Cabeçalho W3C Trace Context: versão-trace_id-span_id-flags
+TRACEPARENT_PATTERN = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+TRACE_ID_HEADER = "X-Trace-Id"
+
+# Trecho (span) de uma execução, no mesmo modelo de dados do OpenTelemetry
+class Span:
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status = "ok"
+        self.error: Optional[str] = None
+        self.start_time = time.time()
+        self.duration: Optional[float] = None
+        self._started_at = time.perf_counter()
+
+    # Adiciona ou substitui um atributo do span
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    # Marca o span como falho
+    def record_error(self, error: BaseException):
+        self.status = "error"
+        self.error = str(error) or type(error).__name__
+
+    def end(self):
+        self.duration = time.perf_counter() - self._started_at
+
+    # Valor do cabeçalho traceparent para propagar o contexto a outros serviços
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes
+        }
+
+# Interface dos exportadores de spans
+class SpanExporter:
+    # Recebe cada span finalizado
+    def export(self, span: Span):
+        raise NotImplementedError
+
+    # Libera recursos do exportador
+    def shutdown(self):
+        pass
+
+# Escreve os spans no log da aplicação
+class ConsoleSpanExporter(SpanExporter):
+    def export(self, span: Span):
+        logger.info(f"span {json.dumps(span.to_dict(), ensure_ascii=False, default=str)}")
+
+# Acrescenta os spans a um arquivo, um JSON por linha
+class FileSpanExporter(SpanExporter):
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def shutdown(self):
+        with self._lock:
+            self._file.close()
+
+# Mantém os spans em memória (testes e diagnóstico local)
+class MemorySpanExporter(SpanExporter):
+    def __init__(self):
+        self.spans: List[Span] = []
+
+    def export(self, span: Span):
+        self.spans.append(span)
+
+# Span ativo na tarefa atual; os spans criados dentro dele tornam-se seus filhos
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+class Tracer:
+    def __init__(self, exporter: Optional[SpanExporter] = None):
+        self.exporter = exporter  # Sem exportador, os spans só propagam o trace id
+
+    # Abre um span filho do span ativo (ou a raiz de um novo trace)
+    @contextmanager
+    def start_span(
+        self,
+        name: str,
+        attributes: Optional[Dict[str, Any]] = None,
+        traceparent: Optional[str] = None
+    ) -> Iterator[Span]:
+        parent = _current_span.get()
+        if parent is not None:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        else:
+            trace_id, parent_id = parse_traceparent(traceparent) or (secrets.token_hex(16), None)
+
+        span = Span(name, trace_id, parent_id, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # Span encerrado em outro contexto (ex.: gerador assíncrono fechado por outra tarefa)
+                pass
+            span.end()
+            self._export(span)
+
+    def _export(self, span: Span):
+        if self.exporter is None:
+            return
+        try:
+            self.exporter.export(span)
+        except Exception as e:
+            # Falhas na exportação não devem afetar a requisição
+            logger.warning(f"Erro ao exportar span: {str(e)}")
+
+    def shutdown(self):
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+# Retorna o span ativo, ou None fora de um trace
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+# Extrai (trace_id, span_id) de um cabeçalho traceparent válido
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str]]:
+    if not value:
+        return None
+    match = TRACEPARENT_PATTERN.match(value.strip().lower())
+    if match is None:
+        return None
+    return match.group(1), match.group(2)
+
+# Cria o exportador configurado, ou None se o tracing estiver desativado
+def create_span_exporter(exporter: Optional[str] = None) -> Optional[SpanExporter]:
+    exporter = (exporter or settings.TRACE_EXPORTER).lower()
+    if exporter in ("", "none"):
+        return None
+    if exporter == "console":
+        return ConsoleSpanExporter()
+    if exporter == "file":
+        return FileSpanExporter(os.path.expanduser(settings.TRACE_FILE_PATH))
+    if exporter == "memory":
+        return MemorySpanExporter()
+    raise ValueError(f"Exportador de traces desconhecido: {exporter}")
+
+# Middleware ASGI que abre o span de cada requisição HTTP, continua o trace
+# recebido no cabeçalho traceparent e devolve o trace id nos cabeçalhos da resposta
+class TracingMiddleware:
+    def __init__(self, app, tracer: "Tracer"):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope.get("headers", [])}
+        attributes = {"http.method": scope["method"], "http.target": scope["path"]}
+        with self.tracer.start_span(f"HTTP {scope['method']}", attributes, traceparent=headers.get("traceparent")) as span:
+            async def send_with_trace(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (TRACE_ID_HEADER.lower().encode("latin-1"), span.trace_id.encode("latin-1")),
+                        (b"traceparent", span.traceparent().encode("latin-1"))
+                    ]
+                await send(message)
+
+            await self.app(scope, receive, send_with_trace)
+            # A rota é conhecida apenas depois do roteamento
+            route = scope.get("route")
+            if route is not None and getattr(route, "path", None):
+                span.name = f"HTTP {scope['method']} {route.path}"
+
+# Instância compartilhada do tracer
+tracer = Tracer(create_span_exporter())
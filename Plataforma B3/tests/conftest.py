@@ -0,0 +1,144 @@
+import os
+import sys
+
+import pytest
+
+# Configurações mínimas para importar os módulos da aplicação sem um .env, e sem
+# serviços externos: jobs em memória, sem workers, índices, change stream nem histórico
+for name, value in {
+    "UFPB_OPENAI_API_KEY": "teste",
+    "UFPB_OPENAI_API_BASE": "http://127.0.0.1/",
+    "UFPB_LLM_DEPLOYMENT_NAME_4O": "teste",
+    "UFPB_OPENAI_API_VERSION": "2024-02-01",
+    "JOB_STORE_BACKEND": "memory",
+    "JOB_WORKERS": "0",
+    "MONGODB_CREATE_INDEXES": "false",
+    "FLOW_CACHE_WATCH_CHANGES": "false",
+    "EXECUTION_HISTORY_ENABLED": "false"
+}.items():
+    os.environ.setdefault(name, value)
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+# Cliente da API com a coleção de fluxos em memória (mongomock-motor)
+@pytest.fixture
+def api(monkeypatch):
+    from fastapi.testclient import TestClient
+    from mongomock_motor import AsyncMongoMockClient
+
+    import app
+    import database
+
+    collection = AsyncMongoMockClient()["teste"]["flows"]
+    monkeypatch.setattr(database, "async_collection", collection)
+    monkeypatch.setattr(app, "async_collection", collection)
+    monkeypatch.setattr(app.job_queue.flow_manager, "collection", collection)
+    app.flow_cache.clear()
+    with TestClient(app.app) as client:
+        yield client
+
+# Substitui as chamadas ao modelo de um ModelIntegration: a resposta de cada passo é
+# "<prompt de sistema>: <mensagem do usuário>", após delay segundos. Registra as chamadas.
+class FakeModel:
+    def __init__(self, delay: float = 0.0, fail_on: str = None):
+        self.delay = delay
+        self.fail_on = fail_on  # Prompt de sistema cuja chamada falha
+        self.calls = []  # (prompt de sistema, início, fim) de cada chamada
+
+    def reply(self, messages) -> str:
+        if self.fail_on is not None and messages[0]["content"] == self.fail_on:
+            raise ValueError("Falha simulada do modelo")
+        return f"{messages[0]['content']}: {messages[-1]['content']}"
+
+    async def chat_completion(self, messages, **kwargs):
+        import asyncio
+        import time
+
+        started = time.perf_counter()
+        await asyncio.sleep(self.delay)
+        self.calls.append((messages[0]["content"], started, time.perf_counter()))
+        content = self.reply(messages)
+        return {"choices": [{"message": {"content": content}}], "usage": {"completion_tokens": 1}}
+
+    async def chat_completion_stream(self, messages, **kwargs):
+        response = await self.chat_completion(messages)
+        content = response["choices"][0]["message"]["content"]
+        # Dois trechos, para que o stream tenha mais de um evento token
+        yield content[:len(content) // 2]
+        yield content[len(content) // 2:]
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    def install(model_client, **options) -> FakeModel:
+        fake = FakeModel(**options)
+        monkeypatch.setattr(model_client, "chat_completion", fake.chat_completion)
+        monkeypatch.setattr(model_client, "chat_completion_stream", fake.chat_completion_stream)
+        return fake
+    return install
+
+# Resposta HTTP simulada do endpoint do modelo
+class FakeResponse:
+    def __init__(self, status: int = 200, body=None, headers=None):
+        import json
+
+        self.status = status
+        self.headers = headers or {}
+        if body is None:
+            body = {"choices": [{"message": {"content": "ok"}}], "usage": {"total_tokens": 1}}
+        self._body = body if isinstance(body, bytes) else json.dumps(body).encode()
+
+    async def read(self) -> bytes:
+        return self._body
+
+    async def text(self) -> str:
+        return self._body.decode()
+
+    @property
+    def content(self):
+        async def lines():
+            for line in self._body.splitlines(keepends=True):
+                yield line
+        return lines()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+# Sessão aiohttp simulada: cada URL responde com a sua lista de respostas, em ordem
+# (a última se repete). Um número vira uma resposta com esse status (429 sem espera),
+# bytes viram o corpo de uma resposta 200 e uma exceção é lançada no envio. Registra as URLs chamadas.
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = {url: list(items) for url, items in responses.items()}
+        self.posts = []
+        self.closed = False
+
+    def post(self, url, json=None, headers=None):
+        self.posts.append(url)
+        items = self.responses[url]
+        item = items.pop(0) if len(items) > 1 else items[0]
+        if isinstance(item, BaseException):
+            raise item
+        if isinstance(item, int):
+            return FakeResponse(item, headers={"retry-after": "0"} if item == 429 else None)
+        if isinstance(item, bytes):
+            return FakeResponse(200, body=item)
+        return item
+
+    async def close(self):
+        self.closed = True
+
+# Instala uma FakeSession como a sessão HTTP de um ModelIntegration, sem espera entre tentativas
+@pytest.fixture
+def fake_session(monkeypatch):
+    from config import settings
+
+    monkeypatch.setattr(settings, "MODEL_RETRY_BASE_DELAY", 0.0)
+
+    def install(model_client, responses) -> FakeSession:
+        session = FakeSession(responses)
+        model_client._session = session
+        return session
+    return install
@@ -0,0 +1,64 @@
+import asyncio
+import json
+
+import app
+
+FLOW = {
+    "name": "Fluxo de teste",
+    "description": "Fluxo usado nos testes do lote",
+    "steps": [{"step_name": "a", "system_prompt": "Resuma", "step_order": 1}]
+}
+
+def create_flow(api):
+    assert api.post("/createFlows/?flow_id=fluxo", json=FLOW).status_code == 200
+
+# Maior número de chamadas ao modelo em andamento ao mesmo tempo
+def max_overlap(calls) -> int:
+    edges = sorted([(started, 1) for _, started, _ in calls] + [(ended, -1) for _, _, ended in calls])
+    current = peak = 0
+    for _, change in edges:
+        current += change
+        peak = max(peak, current)
+    return peak
+
+def test_batch_returns_one_result_per_input(api, fake_model):
+    fake_model(app.model_client)
+    create_flow(api)
+
+    response = api.post("/flows/fluxo/exec_batch", json={"inputs": ["um", "dois", "três"]})
+    assert response.status_code == 200
+    items = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(item["index"] for item in items) == [0, 1, 2]
+    assert {item["result"]["final_response"] for item in items} == {"Resuma: um", "Resuma: dois", "Resuma: três"}
+
+def test_batch_respects_global_flow_limit(api, fake_model, monkeypatch):
+    model = fake_model(app.model_client, delay=0.02)
+    monkeypatch.setattr(app, "flow_semaphore", asyncio.Semaphore(2))
+    create_flow(api)
+
+    response = api.post("/flows/fluxo/exec_batch?concurrency=5", json={"inputs": [str(i) for i in range(8)]})
+    assert response.status_code == 200
+    assert len(model.calls) == 8
+    assert max_overlap(model.calls) <= 2
+
+def test_batch_input_limit(api, fake_model, monkeypatch):
+    model = fake_model(app.model_client)
+    monkeypatch.setattr(app.settings, "MAX_BATCH_INPUTS", 2)
+    create_flow(api)
+
+    body = "\n".join(json.dumps(text) for text in ["um", "dois", "três"])
+    response = api.post("/flows/fluxo/exec_batch", content=body, headers={"content-type": "application/x-ndjson"})
+    assert response.status_code == 413
+    assert api.post("/flows/fluxo/exec_batch", json={"inputs": ["um", "dois", "três"]}).status_code == 413
+    assert api.post("/flows/fluxo/batch_jobs", json={"inputs": ["um", "dois", "três"]}).status_code == 413
+    assert model.calls == []
+
+    body = "\n".join(json.dumps(text) for text in ["um", "dois"])
+    response = api.post("/flows/fluxo/exec_batch", content=body, headers={"content-type": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert len(response.text.splitlines()) == 2
+
+def test_invalid_ndjson_line_is_422(api):
+    create_flow(api)
+    response = api.post("/flows/fluxo/exec_batch", content='"um"\n{"outro": 1}', headers={"content-type": "application/x-ndjson"})
+    assert response.status_code == 422
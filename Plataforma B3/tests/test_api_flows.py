@@ -0,0 +1,164 @@
+import asyncio
+import json
+
+from mongomock_motor import AsyncMongoMockClient
+
+from config import settings
+from flow_manager import flow_version_filter
+
+def flow_body(name: str = "Fluxo de teste", steps: int = 1, is_active: bool = True):
+    return {
+        "name": name,
+        "description": "Fluxo usado nos testes da API de fluxos",
+        "is_active": is_active,
+        "steps": [
+            {"step_name": f"passo_{order}", "system_prompt": "Resuma", "step_order": order}
+            for order in range(1, steps + 1)
+        ]
+    }
+
+def create_flows(api, count: int):
+    for index in range(count):
+        response = api.post(f"/createFlows/?flow_id=fluxo_{index:02d}", json=flow_body(steps=index % 3 + 1))
+        assert response.status_code == 200, response.text
+
+def list_ids(api, **params):
+    response = api.get("/getFlows/", params=params)
+    assert response.status_code == 200, response.text
+    return [flow["id"] for flow in json.loads(response.text)]
+
+def test_list_flows_pages_with_after_cursor(api):
+    create_flows(api, 7)
+    pages = []
+    after = None
+    while True:
+        params = {"limit": 3}
+        if after is not None:
+            params["after"] = after
+        page = list_ids(api, **params)
+        pages.append(page)
+        if not page:
+            break
+        after = page[-1]
+
+    assert pages == [
+        ["fluxo_00", "fluxo_01", "fluxo_02"],
+        ["fluxo_03", "fluxo_04", "fluxo_05"],
+        ["fluxo_06"],
+        []
+    ]
+
+def test_list_flows_summary_fields(api):
+    create_flows(api, 3)
+    response = api.get("/getFlows/", params={"limit": 1, "after": "fluxo_01"})
+    assert response.headers["content-type"].startswith("application/json")
+    assert json.loads(response.text) == [{
+        "id": "fluxo_02",
+        "name": "Fluxo de teste",
+        "description": "Fluxo usado nos testes da API de fluxos",
+        "steps_count": 3,
+        "is_active": True
+    }]
+
+def test_list_flows_empty_page_is_empty_array(api):
+    assert api.get("/getFlows/").text == "[]"
+    create_flows(api, 2)
+    assert list_ids(api, after="fluxo_01") == []
+    assert list_ids(api, after="zzz") == []
+
+def test_list_flows_caps_page_size(api, monkeypatch):
+    monkeypatch.setattr(settings, "FLOW_LIST_PAGE_SIZE", 2)
+    monkeypatch.setattr(settings, "FLOW_LIST_MAX_PAGE_SIZE", 4)
+    create_flows(api, 6)
+    assert len(list_ids(api)) == 2
+    assert len(list_ids(api, limit=3)) == 3
+    assert list_ids(api, limit=1000) == ["fluxo_00", "fluxo_01", "fluxo_02", "fluxo_03"]
+    assert api.get("/getFlows/", params={"limit": 0}).status_code == 422
+
+def test_list_flows_filters_combine_with_cursor(api):
+    for flow_id, name, is_active in [
+        ("a1", "Relatorio mensal", True),
+        ("a2", "Relatorio anual", False),
+        ("a3", "Resumo", True),
+        ("a4", "Relatorio semanal", True),
+    ]:
+        assert api.post(f"/createFlows/?flow_id={flow_id}", json=flow_body(name, is_active=is_active)).status_code == 200
+
+    assert list_ids(api, is_active="true") == ["a1", "a3", "a4"]
+    assert list_ids(api, name_prefix="Relatorio") == ["a1", "a2", "a4"]
+    assert list_ids(api, name_prefix="Relatorio", is_active="true", after="a1") == ["a4"]
+
+def test_create_duplicate_flow_is_409(api):
+    assert api.post("/createFlows/?flow_id=fluxo", json=flow_body()).status_code == 200
+    response = api.post("/createFlows/?flow_id=fluxo", json=flow_body("Outro nome"))
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Fluxo com ID fluxo já existe"
+
+def test_create_invalid_flow_is_422(api):
+    response = api.post("/createFlows/?flow_id=id-invalido", json=flow_body())
+    assert response.status_code == 422
+    assert "ID do fluxo" in response.json()["detail"]
+
+    body = flow_body(steps=2)
+    body["steps"][1]["step_order"] = 1
+    response = api.post("/createFlows/?flow_id=fluxo", json=body)
+    assert response.status_code == 422
+    assert "Ordens de passos devem ser únicas" in response.json()["detail"]
+
+def test_update_increments_version(api):
+    response = api.post("/createFlows/?flow_id=fluxo", json=flow_body())
+    assert response.json()["version"] == 1
+
+    response = api.put("/updateFlows/fluxo", json={**flow_body("Nome novo"), "version": 1})
+    assert response.status_code == 200
+    assert response.json()["version"] == 2
+    # Sem version, a atualização não verifica a versão lida
+    assert api.put("/updateFlows/fluxo", json=flow_body("Outro nome")).json()["version"] == 3
+
+    flow = api.get("/getFlowsById/fluxo").json()
+    assert flow["name"] == "Outro nome"
+    assert flow["version"] == 3
+
+def test_update_with_stale_version_is_409(api):
+    api.post("/createFlows/?flow_id=fluxo", json=flow_body())
+    assert api.put("/updateFlows/fluxo", json={**flow_body("Primeiro"), "version": 1}).status_code == 200
+
+    response = api.put("/updateFlows/fluxo", json={**flow_body("Segundo"), "version": 1})
+    assert response.status_code == 409
+    assert "versão esperada 1, versão atual 2" in response.json()["detail"]
+    assert api.get("/getFlowsById/fluxo").json()["name"] == "Primeiro"
+
+def test_update_missing_or_invalid_flow(api):
+    assert api.put("/updateFlows/inexistente", json={**flow_body(), "version": 1}).status_code == 404
+    assert api.put("/updateFlows/inexistente", json=flow_body()).status_code == 404
+
+    api.post("/createFlows/?flow_id=fluxo", json=flow_body())
+    body = flow_body(steps=2)
+    body["steps"][1]["step_name"] = "passo_1"
+    assert api.put("/updateFlows/fluxo", json=body).status_code == 422
+
+def test_flow_version_filter_matches_expected_version():
+    async def scenario():
+        collection = AsyncMongoMockClient()["teste"]["flows"]
+        await collection.insert_many([
+            {"_id": "atual", "version": 2},
+            {"_id": "antigo"},
+            {"_id": "zerado", "version": 0},
+        ])
+
+        async def matches(flow_id, expected_version=None):
+            return await collection.find_one(flow_version_filter(flow_id, expected_version)) is not None
+
+        return [
+            await matches("atual"),
+            await matches("atual", 2),
+            await matches("atual", 1),
+            # Documentos gravados antes do controle de versão equivalem à versão 0
+            await matches("antigo", 0),
+            await matches("zerado", 0),
+            await matches("antigo", 1),
+        ]
+
+    assert asyncio.run(scenario()) == [True, True, False, True, True, False]
+    assert flow_version_filter("fluxo") == {"_id": "fluxo"}
+    assert flow_version_filter("fluxo", 3) == {"_id": "fluxo", "version": 3}
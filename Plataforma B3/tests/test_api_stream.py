@@ -0,0 +1,74 @@
+import json
+
+import app
+
+FLOW = {
+    "name": "Fluxo de teste",
+    "description": "Fluxo usado nos testes do streaming",
+    "steps": [
+        {"step_name": "a", "system_prompt": "Fale como {{papel}}", "step_order": 1},
+        {"step_name": "b", "system_prompt": "Resuma", "step_order": 2}
+    ]
+}
+
+# Eventos Server-Sent Events de uma resposta, como (nome, dados)
+def parse_sse(text: str):
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+def create_flow(api, flow=FLOW, flow_id="fluxo"):
+    response = api.post(f"/createFlows/?flow_id={flow_id}", json=flow)
+    assert response.status_code == 200, response.text
+
+def test_stream_emits_step_and_flow_events(api, fake_model):
+    fake_model(app.model_client)
+    create_flow(api)
+
+    response = api.post("/flows/fluxo/exec_flow/stream", json={"user_message": "oi", "variables": {"papel": "pirata"}})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = parse_sse(response.text)
+    names = [name for name, _ in events]
+    assert names[0] == "step_start" and names[-1] == "flow_end"
+    assert names.count("step_end") == 2
+    assert "token" in names
+    assert events[-1][1]["final_response"] == "Resuma: Fale como pirata: oi"
+
+def test_stream_missing_variables_is_422(api, fake_model):
+    model = fake_model(app.model_client)
+    create_flow(api)
+
+    response = api.post("/flows/fluxo/exec_flow/stream", json={"user_message": "oi"})
+    assert response.status_code == 422
+    assert "papel" in response.json()["detail"]
+    # Mesmo status de exec_flow para a mesma entrada
+    assert api.post("/flows/fluxo/exec_flow", json={"user_message": "oi"}).status_code == 422
+    assert model.calls == []
+
+def test_stream_token_limit_is_422(api, fake_model):
+    model = fake_model(app.model_client)
+    flow = {**FLOW, "steps": [{"step_name": "a", "system_prompt": "Resuma", "step_order": 1, "max_input_tokens": 1}]}
+    create_flow(api, flow)
+
+    response = api.post("/flows/fluxo/exec_flow/stream", json={"user_message": "oi"})
+    assert response.status_code == 422
+    assert api.post("/flows/fluxo/exec_flow", json={"user_message": "oi"}).status_code == 422
+    assert model.calls == []
+
+def test_stream_unknown_flow_is_404(api):
+    assert api.post("/flows/inexistente/exec_flow/stream", json={"user_message": "oi"}).status_code == 404
+
+def test_stream_reports_step_failure_as_error_event(api, fake_model):
+    fake_model(app.model_client, fail_on="Resuma")
+    create_flow(api)
+
+    response = api.post("/flows/fluxo/exec_flow/stream", json={"user_message": "oi", "variables": {"papel": "pirata"}})
+    # A falha acontece depois de o stream começar: o status já foi enviado
+    assert response.status_code == 200
+    name, data = parse_sse(response.text)[-1]
+    assert name == "error"
+    assert "Falha simulada do modelo" in data["detail"]
@@ -0,0 +1,132 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import completion_cache
+from completion_cache import (
+    MemoryCompletionCache, MongoCompletionCache, SQLiteCompletionCache, create_completion_cache, make_cache_key
+)
+
+RESPONSE = {"choices": [{"message": {"content": "olá"}}], "usage": {"total_tokens": 3}}
+PAYLOAD = {"messages": [{"role": "user", "content": "oi"}], "temperature": 0, "max_tokens": 10}
+
+# Relógio controlado pelos testes, no lugar de time.monotonic e time.time
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(completion_cache, "time", fake)
+    return fake
+
+def test_cache_key_depends_only_on_the_response_fields():
+    key = make_cache_key("gpt4o", PAYLOAD)
+    assert len(key) == 64
+    assert make_cache_key("gpt4o", dict(reversed(list(PAYLOAD.items())))) == key
+    assert make_cache_key("gpt4o", {**PAYLOAD, "stream": True, "user": "a"}) == key
+
+    assert make_cache_key("outro", PAYLOAD) != key
+    assert make_cache_key("gpt4o", {**PAYLOAD, "temperature": 0.5}) != key
+    assert make_cache_key("gpt4o", {**PAYLOAD, "messages": [{"role": "user", "content": "tchau"}]}) != key
+
+def test_memory_cache_expires_entries(clock):
+    async def scenario():
+        cache = MemoryCompletionCache(max_size=10)
+        await cache.set("a", RESPONSE, ttl_seconds=10)
+        await cache.set("b", RESPONSE)
+        clock.now += 5
+        fresh = await cache.get("a")
+        clock.now += 10
+        return fresh, await cache.get("a"), await cache.get("b")
+
+    fresh, expired, permanent = asyncio.run(scenario())
+    assert fresh == RESPONSE
+    assert expired is None
+    assert permanent == RESPONSE
+
+def test_memory_cache_evicts_least_recently_used():
+    async def scenario():
+        cache = MemoryCompletionCache(max_size=2)
+        await cache.set("a", RESPONSE)
+        await cache.set("b", RESPONSE)
+        await cache.get("a")
+        await cache.set("c", RESPONSE)
+        return [await cache.get(key) is not None for key in ("a", "b", "c")]
+
+    assert asyncio.run(scenario()) == [True, False, True]
+
+def test_memory_cache_invalid_size():
+    with pytest.raises(ValueError):
+        MemoryCompletionCache(max_size=0)
+
+def test_sqlite_cache_persists_and_expires(tmp_path, clock):
+    path = str(tmp_path / "cache.db")
+
+    async def scenario():
+        cache = SQLiteCompletionCache(path)
+        await cache.set("a", RESPONSE, ttl_seconds=10)
+        await cache.set("b", RESPONSE)
+        await cache.close()
+
+        # Outra instância lê as respostas gravadas em disco
+        reopened = SQLiteCompletionCache(path)
+        fresh = await reopened.get("a")
+        clock.now += 11
+        results = (fresh, await reopened.get("a"), await reopened.get("b"), await reopened.get("c"))
+        await reopened.close()
+        return results
+
+    fresh, expired, permanent, missing = asyncio.run(scenario())
+    assert fresh == RESPONSE
+    assert expired is None
+    assert permanent == RESPONSE
+    assert missing is None
+
+def test_mongo_cache_stores_expiration(monkeypatch):
+    now = datetime(2024, 1, 1, 12, 0, 0)
+
+    # datetime com utcnow controlado pelo teste
+    class FakeDatetime(datetime):
+        @classmethod
+        def utcnow(cls):
+            return now
+
+    monkeypatch.setattr(completion_cache, "datetime", FakeDatetime)
+
+    async def scenario():
+        nonlocal now
+        collection = AsyncMongoMockClient()["teste"]["completion_cache"]
+        cache = MongoCompletionCache(collection)
+        await cache.set("a", RESPONSE, ttl_seconds=60)
+        await cache.set("b", RESPONSE)
+        stored = await collection.find_one({"_id": "a"})
+        fresh = await cache.get("a")
+        now += timedelta(seconds=61)
+        return stored, fresh, await cache.get("a"), await cache.get("b")
+
+    stored, fresh, expired, permanent = asyncio.run(scenario())
+    # O índice TTL de expires_at remove o documento; get também ignora entradas vencidas
+    assert stored["expires_at"] == datetime(2024, 1, 1, 12, 1, 0)
+    assert fresh == RESPONSE
+    assert expired is None
+    assert permanent == RESPONSE
+
+def test_create_completion_cache_backends(tmp_path, monkeypatch):
+    monkeypatch.setattr(completion_cache.settings, "COMPLETION_CACHE_SQLITE_PATH", str(tmp_path / "cache.db"))
+    assert create_completion_cache("none") is None
+    assert isinstance(create_completion_cache("memory"), MemoryCompletionCache)
+    sqlite_cache = create_completion_cache("sqlite")
+    assert isinstance(sqlite_cache, SQLiteCompletionCache)
+    asyncio.run(sqlite_cache.close())
+    with pytest.raises(ValueError):
+        create_completion_cache("redis")
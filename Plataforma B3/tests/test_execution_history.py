@@ -0,0 +1,120 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import indexes
+from config import settings
+from execution_history import ExecutionRecorder, build_execution_record, build_step_record, get_execution, list_executions
+from flow_manager import Flow, FlowStep
+from model_integration import ModelIntegration
+
+MESSAGES = [{"role": "system", "content": "Resuma"}, {"role": "user", "content": "oi"}]
+
+def execution(execution_id: str, started_at: datetime, status: str = "success"):
+    steps = [build_step_record("a", MESSAGES, status, 0.5, usage={"prompt_tokens": 10, "completion_tokens": 5})]
+    return build_execution_record(execution_id, "fluxo", "Fluxo", 1, "oi", steps, status, started_at, 0.5)
+
+def test_execution_record_totals_and_expiry(monkeypatch):
+    monkeypatch.setattr(settings, "EXECUTION_HISTORY_RETENTION_DAYS", 30)
+    started_at = datetime(2026, 1, 1)
+    record = execution("e1", started_at)
+    assert record["total_tokens"] == 15
+    assert record["finished_at"] == started_at + timedelta(seconds=0.5)
+    assert record["expires_at"] == started_at + timedelta(days=30)
+    # Apenas hashes dos textos são gravados
+    assert record["steps"][0]["prompt_hash"] != "Resuma"
+    assert "oi" not in record.values()
+
+    monkeypatch.setattr(settings, "EXECUTION_HISTORY_RETENTION_DAYS", 0)
+    assert "expires_at" not in execution("e2", started_at)
+
+def test_recorder_writes_batches_and_flushes_on_stop():
+    async def scenario():
+        collection = AsyncMongoMockClient()["teste"]["executions"]
+        recorder = ExecutionRecorder(collection, batch_size=2, flush_interval=60)
+        await recorder.start()
+        started_at = datetime(2026, 1, 1)
+        for index in range(5):
+            assert recorder.record(execution(f"e{index}", started_at + timedelta(minutes=index)))
+        # Dois lotes completos são gravados sem esperar o flush_interval
+        for _ in range(100):
+            if await collection.count_documents({}) == 4:
+                break
+            await asyncio.sleep(0.01)
+        written_before_stop = await collection.count_documents({})
+        await recorder.stop()
+        page = await list_executions(collection, flow_id="fluxo", limit=3)
+        return written_before_stop, await collection.count_documents({}), page, await get_execution(collection, "e0")
+
+    written_before_stop, written, page, detail = asyncio.run(scenario())
+    assert written_before_stop == 4
+    assert written == 5
+    assert [item["execution_id"] for item in page["executions"]] == ["e4", "e3", "e2"]
+    assert "steps" not in page["executions"][0]
+    assert page["next_cursor"] is not None
+    assert detail["steps"][0]["step_name"] == "a"
+
+def test_recorder_drops_records_when_queue_is_full():
+    async def scenario():
+        recorder = ExecutionRecorder(AsyncMongoMockClient()["teste"]["executions"], max_queue=1)
+        return recorder.record(execution("e1", datetime(2026, 1, 1))), recorder.record(execution("e2", datetime(2026, 1, 1)))
+
+    assert asyncio.run(scenario()) == (True, False)
+
+def test_flow_execution_is_recorded(fake_model):
+    flow = Flow(
+        name="Fluxo registrado",
+        description="Fluxo usado nos testes do histórico",
+        flow_id="fluxo",
+        version=3,
+        steps=[
+            FlowStep(step_name="a", system_prompt="Resuma", step_order=1),
+            FlowStep(step_name="b", system_prompt="Traduza", step_order=2)
+        ]
+    )
+
+    async def scenario():
+        collection = AsyncMongoMockClient()["teste"]["executions"]
+        client = ModelIntegration("teste", execution_recorder=ExecutionRecorder(collection, flush_interval=0))
+        fake_model(client, fail_on="Traduza")
+        await client.execution_recorder.start()
+        with pytest.raises(ValueError):
+            await client.process_flow("oi", flow)
+        await client.execution_recorder.stop()
+        return await collection.find({}).to_list(length=None)
+
+    records = asyncio.run(scenario())
+    assert len(records) == 1
+    record = records[0]
+    assert (record["flow_id"], record["flow_version"], record["status"]) == ("fluxo", 3, "error")
+    assert [(step["step_name"], step["status"]) for step in record["steps"]] == [("a", "success"), ("b", "error")]
+    assert "Falha simulada do modelo" in record["error"]
+
+def test_ensure_indexes_creates_ttl_indexes(monkeypatch):
+    monkeypatch.setattr(settings, "EXECUTION_HISTORY_ENABLED", True)
+    monkeypatch.setattr(settings, "JOB_STORE_BACKEND", "mongo")
+
+    async def scenario():
+        db = AsyncMongoMockClient()["teste"]
+        await indexes.ensure_indexes(db)
+        # Idempotente: uma segunda chamada não falha nem duplica os índices
+        await indexes.ensure_indexes(db)
+        return (
+            await db[settings.MONGODB_EXECUTIONS_COLLECTION].index_information(),
+            await db[settings.MONGODB_JOBS_COLLECTION].index_information(),
+            await db[settings.MONGODB_COLLECTION].index_information()
+        )
+
+    executions, jobs, flows = asyncio.run(scenario())
+    assert executions["expires_at_ttl"]["expireAfterSeconds"] == 0
+    assert {"flow_id_started_at", "started_at"} <= set(executions)
+    assert jobs["expires_at_ttl"]["expireAfterSeconds"] == 0
+    assert {"is_active_id", "name"} <= set(flows)
+
+def test_collection_indexes_skip_disabled_collections(monkeypatch):
+    monkeypatch.setattr(settings, "EXECUTION_HISTORY_ENABLED", False)
+    monkeypatch.setattr(settings, "JOB_STORE_BACKEND", "memory")
+    monkeypatch.setattr(settings, "COMPLETION_CACHE_BACKEND", "memory")
+    assert list(indexes.collection_indexes()) == [settings.MONGODB_COLLECTION]
@@ -0,0 +1,162 @@
+import asyncio
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from flow_cache import FlowCache
+from flow_manager import AsyncFlowManager, Flow, FlowStep
+
+# Fluxo de um passo usado nos testes
+def make_flow(name: str = "Fluxo de teste") -> Flow:
+    return Flow(
+        name=name,
+        description="Fluxo usado nos testes do cache",
+        steps=[FlowStep(step_name="inicio", system_prompt="Diga olá", step_order=1)]
+    )
+
+# Gerenciador com uma coleção em memória e o cache informado
+def make_manager(cache: FlowCache) -> AsyncFlowManager:
+    return AsyncFlowManager(AsyncMongoMockClient()["teste"]["flows"], cache=cache)
+
+def test_get_miss_then_hit():
+    cache = FlowCache(max_size=10)
+    flow = make_flow()
+
+    assert cache.get("fluxo") is None
+    cache.set("fluxo", flow)
+    assert cache.get("fluxo") is flow
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+    assert stats["hit_rate"] == 0.5
+
+def test_evicts_least_recently_used():
+    cache = FlowCache(max_size=2)
+    cache.set("a", make_flow("a"))
+    cache.set("b", make_flow("b"))
+    cache.get("a")  # "b" passa a ser o menos usado
+    cache.set("c", make_flow("c"))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+
+def test_expired_entry_is_a_miss():
+    cache = FlowCache(max_size=10, ttl_seconds=-1)
+    cache.set("fluxo", make_flow())
+
+    assert cache.get("fluxo") is None
+    assert cache.stats()["size"] == 0
+    assert cache.stats()["evictions"] == 1
+
+def test_invalid_max_size():
+    with pytest.raises(ValueError):
+        FlowCache(max_size=0)
+
+def test_manager_reads_through_cache():
+    async def scenario():
+        cache = FlowCache(max_size=10)
+        manager = make_manager(cache)
+        await manager.create_flow("fluxo", make_flow())
+
+        first = await manager.get_flow("fluxo")
+        second = await manager.get_flow("fluxo")
+        return cache, first, second
+
+    cache, first, second = asyncio.run(scenario())
+    assert second is first
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_update_invalidates_cached_flow():
+    async def scenario():
+        cache = FlowCache(max_size=10)
+        manager = make_manager(cache)
+        await manager.create_flow("fluxo", make_flow())
+        await manager.get_flow("fluxo")
+
+        await manager.update_flow("fluxo", make_flow("Fluxo atualizado"))
+        return cache, await manager.get_flow("fluxo")
+
+    cache, flow = asyncio.run(scenario())
+    assert flow.name == "Fluxo atualizado"
+    assert flow.version == 2
+    assert cache.invalidations == 1
+
+def test_delete_invalidates_cached_flow():
+    async def scenario():
+        cache = FlowCache(max_size=10)
+        manager = make_manager(cache)
+        await manager.create_flow("fluxo", make_flow())
+        await manager.get_flow("fluxo")
+
+        await manager.delete_flow("fluxo")
+        assert cache.get("fluxo") is None
+        with pytest.raises(ValueError):
+            await manager.get_flow("fluxo")
+        return cache
+
+    cache = asyncio.run(scenario())
+    assert cache.invalidations == 1
+
+def test_fill_started_before_invalidation_is_dropped():
+    cache = FlowCache(max_size=10)
+    generation = cache.begin_fill()
+    cache.invalidate("fluxo")
+    cache.set("fluxo", make_flow("Fluxo antigo"), generation)
+
+    assert cache.get("fluxo") is None
+    assert cache.stats()["stale_fills"] == 1
+
+    # Invalidações de outros fluxos não afetam o preenchimento
+    generation = cache.begin_fill()
+    cache.invalidate("outro")
+    cache.set("fluxo", make_flow(), generation)
+    assert cache.get("fluxo") is not None
+
+def test_fill_started_before_clear_is_dropped():
+    cache = FlowCache(max_size=10)
+    generation = cache.begin_fill()
+    cache.clear()
+    cache.set("fluxo", make_flow(), generation)
+    assert cache.get("fluxo") is None
+
+def test_forgotten_invalidations_drop_older_fills():
+    cache = FlowCache(max_size=1)
+    generation = cache.begin_fill()
+    cache.invalidate("fluxo")
+    cache.invalidate("outro")  # O registro de "fluxo" é descartado
+    cache.set("fluxo", make_flow(), generation)
+    assert cache.get("fluxo") is None
+
+# Coleção que simula uma atualização concorrente enquanto o fluxo é lido do banco
+class RacingCollection:
+    def __init__(self, collection, on_read):
+        self.collection = collection
+        self.on_read = on_read
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    async def find_one(self, *args, **kwargs):
+        document = await self.collection.find_one(*args, **kwargs)
+        await self.on_read()
+        return document
+
+def test_manager_does_not_cache_flow_updated_during_read():
+    async def scenario():
+        cache = FlowCache(max_size=10)
+        manager = make_manager(cache)
+        await manager.create_flow("fluxo", make_flow())
+
+        writer = AsyncFlowManager(manager.collection, cache=cache)
+        reader = AsyncFlowManager(
+            RacingCollection(manager.collection, lambda: writer.update_flow("fluxo", make_flow("Fluxo atualizado"))),
+            cache=cache
+        )
+        stale = await reader.get_flow("fluxo")
+        return stale, await manager.get_flow("fluxo")
+
+    stale, current = asyncio.run(scenario())
+    assert stale.name == "Fluxo de teste"
+    assert current.name == "Fluxo atualizado"
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from flow_manager import USER_MESSAGE_INPUT, Flow, FlowStep, resolve_step_dependencies, validate_step_orders
+from model_integration import ModelIntegration
+
+# Passo com o prompt "Passo <nome>" (ou o informado) e as dependências indicadas
+def step(name: str, order: int, depends_on=None, prompt: str = None) -> FlowStep:
+    return FlowStep(step_name=name, system_prompt=prompt or f"Passo {name}", step_order=order, depends_on=depends_on)
+
+def make_flow(*steps: FlowStep) -> Flow:
+    return Flow(name="Fluxo de teste", description="Fluxo usado nos testes das dependências", steps=list(steps))
+
+def test_default_dependencies_chain_the_steps():
+    dependencies = resolve_step_dependencies([step("b", 2), step("a", 1), step("c", 3, depends_on=[])])
+    assert dependencies == {"a": [USER_MESSAGE_INPUT], "b": ["a"], "c": [USER_MESSAGE_INPUT]}
+
+def test_valid_dag_passes():
+    validate_step_orders([
+        step("a", 1, [USER_MESSAGE_INPUT]),
+        step("b", 2, [USER_MESSAGE_INPUT]),
+        step("c", 3, ["a", "b"], prompt="Use {{steps.a}}")
+    ])
+
+@pytest.mark.parametrize("steps, message", [
+    ([step("a", 1), step("b", 1)], "Ordens de passos devem ser únicas"),
+    ([step("a", 1), step("a", 2)], "Nomes de passos devem ser únicos"),
+    ([step(USER_MESSAGE_INPUT, 1)], "é reservado"),
+    ([step("a", 1, ["inexistente"])], "O passo 'a' depende de um passo inexistente: 'inexistente'"),
+    ([step("a", 1, prompt="Use {{steps.nada}}")], "usa a saída de um passo inexistente: 'nada'"),
+    ([step("a", 1, prompt="Use {{steps.a}}")], "não pode usar a própria saída"),
+])
+def test_invalid_steps(steps, message):
+    with pytest.raises(ValueError, match=message):
+        validate_step_orders(steps)
+
+def test_cycle_in_depends_on():
+    with pytest.raises(ValueError, match="Dependência circular"):
+        validate_step_orders([step("a", 1, ["c"]), step("b", 2, ["a"]), step("c", 3, ["b"])])
+
+def test_cycle_through_template_reference():
+    # b depende de a pelas entradas; a usa a saída de b no prompt
+    with pytest.raises(ValueError, match="Dependência circular"):
+        validate_step_orders([
+            step("a", 1, [USER_MESSAGE_INPUT], prompt="Considere {{steps.b}}"),
+            step("b", 2, ["a"])
+        ])
+
+# Executa o fluxo com o modelo falso e retorna o resultado e as chamadas registradas
+def run_flow(fake_model, flow: Flow, delay: float = 0.05):
+    client = ModelIntegration("teste")
+    model = fake_model(client, delay=delay)
+    result = asyncio.run(client.process_flow(user_message="oi", flow=flow))
+    return result, {prompt: (started, ended) for prompt, started, ended in model.calls}
+
+def test_independent_steps_run_in_parallel(fake_model):
+    flow = make_flow(
+        step("a", 1, [USER_MESSAGE_INPUT]),
+        step("b", 2, [USER_MESSAGE_INPUT]),
+        step("c", 3, ["a", "b"])
+    )
+    result, calls = run_flow(fake_model, flow)
+
+    (a_start, a_end), (b_start, b_end), (c_start, _) = calls["Passo a"], calls["Passo b"], calls["Passo c"]
+    # a e b se sobrepõem; c só começa depois dos dois
+    assert a_start < b_end and b_start < a_end
+    assert c_start >= max(a_end, b_end)
+    assert result["final_response"] == "Passo c: ### a\nPasso a: oi\n\n### b\nPasso b: oi"
+
+def test_chained_steps_run_in_order(fake_model):
+    result, calls = run_flow(fake_model, make_flow(step("a", 1), step("b", 2), step("c", 3)))
+
+    assert calls["Passo a"][1] <= calls["Passo b"][0]
+    assert calls["Passo b"][1] <= calls["Passo c"][0]
+    assert result["final_response"] == "Passo c: Passo b: Passo a: oi"
+
+def test_template_reference_waits_for_step(fake_model):
+    flow = make_flow(
+        step("a", 1, [USER_MESSAGE_INPUT]),
+        step("b", 2, [USER_MESSAGE_INPUT], prompt="Compare com {{steps.a}}")
+    )
+    result, calls = run_flow(fake_model, flow)
+
+    rendered = "Compare com Passo a: oi"
+    # A saída de a entra no prompt de b, não na mensagem do usuário
+    assert calls[rendered][0] >= calls["Passo a"][1]
+    assert result["steps"]["b"]["assistant_message"] == f"{rendered}: oi"
@@ -0,0 +1,97 @@
+import json
+
+def record(flow_id, name="Fluxo importado", steps=1, **fields):
+    return {
+        "flow_id": flow_id,
+        "name": name,
+        "description": "Fluxo usado nos testes de importação",
+        "steps": [
+            {"step_name": f"passo_{order}", "system_prompt": f"Prompt {order}", "step_order": order}
+            for order in range(1, steps + 1)
+        ],
+        **fields
+    }
+
+def to_ndjson(lines) -> str:
+    return "".join((line if isinstance(line, str) else json.dumps(line)) + "\n" for line in lines)
+
+def import_ndjson(api, lines, **params):
+    response = api.post(
+        "/flows/import",
+        params=params,
+        content=to_ndjson(lines),
+        headers={"content-type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def export_records(api, **params):
+    response = api.get("/flows/export", params=params)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    return [json.loads(line) for line in response.text.splitlines()]
+
+def test_import_reports_errors_per_record(api):
+    assert api.post("/createFlows/?flow_id=existente", json={k: v for k, v in record("x").items() if k != "flow_id"}).status_code == 200
+
+    invalid_steps = record("passos")
+    invalid_steps["steps"].append({**invalid_steps["steps"][0], "step_name": "outro"})
+    report = import_ndjson(api, [
+        record("a"),
+        "{nao e json",
+        {k: v for k, v in record("b").items() if k != "flow_id"},
+        record("id-invalido"),
+        invalid_steps,
+        record("a", name="Repetido"),
+        record("existente"),
+        [1, 2],
+        record("c", steps=2),
+    ])
+
+    assert report["received"] == 9
+    assert report["written"] == 2
+    assert report["failed"] == 7
+    errors = {error["index"]: error for error in report["errors"]}
+    assert sorted(errors) == [1, 2, 3, 4, 5, 6, 7]
+    assert errors[1]["error"].startswith("JSON inválido")
+    assert errors[2]["error"] == "O campo flow_id é obrigatório"
+    assert "ID do fluxo" in errors[3]["error"]
+    assert "Ordens de passos devem ser únicas" in errors[4]["error"]
+    assert errors[5] == {"index": 5, "flow_id": "a", "error": "Fluxo com ID a repetido na importação"}
+    assert errors[6] == {"index": 6, "flow_id": "existente", "error": "Fluxo com ID existente já existe"}
+    assert errors[7]["error"] == "Cada registro deve ser um objeto JSON"
+
+    assert [flow["flow_id"] for flow in export_records(api)] == ["a", "c", "existente"]
+
+def test_import_accepts_json_array(api):
+    response = api.post("/flows/import", json=[record("a"), record("b")])
+    assert response.json()["written"] == 2
+    assert api.post("/flows/import", json={"flow_id": "a"}).status_code == 422
+
+def test_export_import_round_trip(api):
+    import_ndjson(api, [
+        record("b", steps=3, is_active=False),
+        record("a", name="Relatorio", steps=2),
+        record("c", name="Relatorio final"),
+    ])
+    exported = export_records(api)
+    assert [flow["flow_id"] for flow in exported] == ["a", "b", "c"]
+    # Campos recriados pela importação não são exportados
+    assert all(not {"created_at", "updated_at", "version", "_id"} & set(flow) for flow in exported)
+
+    for flow in exported:
+        assert api.delete(f"/deleteFlows/{flow['flow_id']}").status_code == 200
+    assert export_records(api) == []
+
+    report = import_ndjson(api, exported)
+    assert report["written"] == 3
+    assert export_records(api) == exported
+
+def test_export_filters(api):
+    import_ndjson(api, [
+        record("a", name="Relatorio mensal"),
+        record("b", name="Relatorio anual", is_active=False),
+        record("c", name="Resumo"),
+    ])
+    assert [flow["flow_id"] for flow in export_records(api, is_active="true")] == ["a", "c"]
+    assert [flow["flow_id"] for flow in export_records(api, name_prefix="Relatorio")] == ["a", "b"]
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+import app
+from flow_manager import Flow, FlowStep
+from model_integration import FlowTimeoutError, ModelIntegration, StepTimeoutError
+
+def make_flow(step_timeout=None, flow_timeout=None) -> Flow:
+    return Flow(
+        name="Fluxo com prazo",
+        description="Fluxo usado nos testes de tempo limite",
+        timeout_seconds=flow_timeout,
+        steps=[
+            FlowStep(step_name="rapido", system_prompt="Rapido", step_order=1),
+            FlowStep(step_name="lento", system_prompt="Lento", step_order=2, timeout_seconds=step_timeout)
+        ]
+    )
+
+def test_step_timeout_raises_step_timeout_error(fake_model):
+    client = ModelIntegration("teste")
+    fake_model(client, delay=0.2)
+    flow = make_flow(step_timeout=0.05)
+    # O primeiro passo também é lento: o limite vale apenas para o passo que o define
+    with pytest.raises(StepTimeoutError) as info:
+        asyncio.run(client.process_flow("oi", flow))
+    assert isinstance(info.value, FlowTimeoutError)
+    assert info.value.failed_step == "lento"
+    assert info.value.completed_steps == {"rapido": "Rapido: oi"}
+    assert "Tempo limite do passo excedido (0.05s)" in str(info.value)
+
+def test_flow_timeout_raises_flow_timeout_error(fake_model):
+    client = ModelIntegration("teste")
+    fake_model(client, delay=0.2)
+    with pytest.raises(FlowTimeoutError) as info:
+        asyncio.run(client.process_flow("oi", make_flow(), deadline=0.05))
+    assert not isinstance(info.value, StepTimeoutError)
+    assert "Tempo limite do fluxo excedido (0.05s)" in str(info.value)
+
+def create_flow(api, flow: Flow, flow_id="prazo"):
+    response = api.post(f"/createFlows/?flow_id={flow_id}", json=flow.model_dump(exclude_none=True))
+    assert response.status_code == 200, response.text
+
+def test_step_timeout_is_504(api, fake_model):
+    fake_model(app.model_client, delay=0.2)
+    create_flow(api, make_flow(step_timeout=0.05))
+    response = api.post("/flows/prazo/exec_flow", json={"user_message": "oi"})
+    assert response.status_code == 504
+    assert "Tempo limite do passo excedido" in response.json()["detail"]
+    assert response.headers["X-Checkpoint-Id"]
+
+def test_flow_deadline_is_504(api, fake_model):
+    fake_model(app.model_client, delay=0.2)
+    create_flow(api, make_flow())
+    response = api.post("/flows/prazo/exec_flow", json={"user_message": "oi"}, headers={"X-Request-Deadline": "0.05"})
+    assert response.status_code == 504
+    assert "Tempo limite do fluxo excedido" in response.json()["detail"]
+
+def test_flow_timeout_seconds_is_504(api, fake_model):
+    fake_model(app.model_client, delay=0.2)
+    create_flow(api, make_flow(flow_timeout=0.05))
+    response = api.post("/flows/prazo/exec_flow", json={"user_message": "oi"})
+    assert response.status_code == 504
+    assert "Tempo limite do fluxo excedido" in response.json()["detail"]
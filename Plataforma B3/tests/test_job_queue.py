@@ -0,0 +1,176 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from flow_manager import Flow, FlowStep
+from job_queue import JOB_COMPLETED, JOB_FAILED, JOB_QUEUED, JOB_RUNNING, JobQueue, MemoryJobStore, new_job
+
+# Fluxo de dois passos usado nos testes
+FLOW = Flow(
+    name="Fluxo de teste",
+    description="Fluxo usado nos testes da fila de jobs",
+    steps=[
+        FlowStep(step_name="primeiro", system_prompt="Resuma", step_order=1),
+        FlowStep(step_name="segundo", system_prompt="Traduza", step_order=2)
+    ]
+)
+
+# Gerenciador de fluxos que sempre retorna FLOW
+class FakeFlowManager:
+    async def get_flow(self, flow_id: str) -> Flow:
+        return FLOW
+
+# Cliente do modelo que registra os checkpoints recebidos e executa apenas os passos pendentes
+class FakeModelClient:
+    def __init__(self):
+        self.checkpoints = []
+        self.variables = []
+
+    async def process_flow(self, user_message, flow, on_event=None, checkpoint=None, variables=None, **kwargs):
+        self.checkpoints.append(dict(checkpoint or {}))
+        self.variables.append(variables)
+        outputs = dict(checkpoint or {})
+        for step in flow.steps:
+            if step.step_name not in outputs:
+                outputs[step.step_name] = f"{step.step_name}: {user_message}"
+                await on_event({"event": "step_end", "step_name": step.step_name, "assistant_message": outputs[step.step_name]})
+        return {"steps": outputs}
+
+# Aguarda o job atingir um dos estados informados
+async def wait_for_status(store: MemoryJobStore, job_id: str, *statuses: str):
+    for _ in range(200):
+        job = await store.get(job_id)
+        if job["status"] in statuses:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Job {job_id} não chegou a {statuses}")
+
+def test_claim_next_reserves_each_job_once():
+    async def scenario():
+        store = MemoryJobStore()
+        job = new_job("fluxo", user_message="olá")
+        await store.create(job)
+
+        claimed = await store.claim_next(lease_seconds=60)
+        again = await store.claim_next(lease_seconds=60)
+        return job, claimed, again
+
+    job, claimed, again = asyncio.run(scenario())
+    assert claimed["_id"] == job["_id"]
+    assert claimed["status"] == JOB_RUNNING
+    assert claimed["attempts"] == 1
+    assert claimed["started_at"] is not None
+    assert again is None
+
+def test_claim_next_retakes_job_with_expired_lease():
+    async def scenario():
+        store = MemoryJobStore()
+        job = new_job("fluxo", user_message="olá")
+        await store.create(job)
+        await store.claim_next(lease_seconds=60)
+        await store.update(job["_id"], {"heartbeat_at": datetime.utcnow() - timedelta(seconds=120)})
+
+        return await store.claim_next(lease_seconds=60)
+
+    claimed = asyncio.run(scenario())
+    assert claimed["status"] == JOB_RUNNING
+    assert claimed["attempts"] == 2
+
+def test_update_supports_nested_keys():
+    async def scenario():
+        store = MemoryJobStore()
+        job = new_job("fluxo", user_message="olá")
+        await store.create(job)
+        await store.update(job["_id"], {"steps.primeiro": "saída"})
+        return await store.get(job["_id"])
+
+    assert asyncio.run(scenario())["steps"] == {"primeiro": "saída"}
+
+def test_checkpoint_and_resume_skip_completed_steps():
+    async def scenario():
+        store = MemoryJobStore()
+        model_client = FakeModelClient()
+        queue = JobQueue(store, model_client, FakeFlowManager(), workers=1, poll_interval=0.01)
+
+        checkpoint = await queue.save_checkpoint("fluxo", "olá", {"primeiro": "salvo"}, "falha no segundo passo")
+        saved = await store.get(checkpoint["_id"])
+        saved_steps = dict(saved["steps"])
+
+        await queue.start()
+        try:
+            resumed = await queue.resume(checkpoint["_id"])
+            finished = await wait_for_status(store, checkpoint["_id"], JOB_COMPLETED, JOB_FAILED)
+        finally:
+            await queue.stop()
+        return saved, saved_steps, resumed, finished, model_client
+
+    saved, saved_steps, resumed, finished, model_client = asyncio.run(scenario())
+    assert saved["status"] == JOB_FAILED
+    assert saved_steps == {"primeiro": "salvo"}
+    assert resumed["status"] == JOB_QUEUED
+    assert resumed["error"] is None
+
+    assert finished["status"] == JOB_COMPLETED
+    assert model_client.checkpoints == [{"primeiro": "salvo"}]
+    assert finished["result"]["steps"] == {"primeiro": "salvo", "segundo": "segundo: olá"}
+
+def test_resume_rejects_jobs_that_did_not_fail():
+    async def scenario():
+        store = MemoryJobStore()
+        queue = JobQueue(store, FakeModelClient(), FakeFlowManager(), workers=0)
+        job = await queue.submit("fluxo", user_message="olá")
+        with pytest.raises(ValueError):
+            await queue.resume(job["_id"])
+        with pytest.raises(ValueError):
+            await queue.resume("inexistente")
+
+    asyncio.run(scenario())
+
+def test_finished_jobs_expire_after_retention():
+    async def scenario():
+        store = MemoryJobStore()
+        queue = JobQueue(store, FakeModelClient(), FakeFlowManager(), workers=0)
+        old = await queue.save_checkpoint("fluxo", "olá", {}, "falha")
+        pending = await queue.submit("fluxo", user_message="olá")
+        await store.update(old["_id"], {"expires_at": datetime.utcnow() - timedelta(seconds=1)})
+
+        # A remoção acontece na próxima gravação de um job
+        await queue.submit("fluxo", user_message="olá")
+        return old, pending, store
+
+    old, pending, store = asyncio.run(scenario())
+    assert old["expires_at"] is not None
+    assert pending["expires_at"] is None
+    assert asyncio.run(store.get(old["_id"])) is None
+    assert asyncio.run(store.get(pending["_id"])) is not None
+
+def test_resume_clears_expiration():
+    async def scenario():
+        queue = JobQueue(MemoryJobStore(), FakeModelClient(), FakeFlowManager(), workers=0)
+        checkpoint = await queue.save_checkpoint("fluxo", "olá", {}, "falha")
+        return await queue.resume(checkpoint["_id"])
+
+    assert asyncio.run(scenario())["expires_at"] is None
+
+def test_variables_reach_the_flow_and_survive_resume():
+    async def scenario():
+        store = MemoryJobStore()
+        model_client = FakeModelClient()
+        queue = JobQueue(store, model_client, FakeFlowManager(), workers=1, poll_interval=0.01)
+        variables = {"idioma": "português"}
+
+        await queue.start()
+        try:
+            job = await queue.submit("fluxo", user_message="olá", variables=variables)
+            await wait_for_status(store, job["_id"], JOB_COMPLETED, JOB_FAILED)
+
+            checkpoint = await queue.save_checkpoint("fluxo", "olá", {"primeiro": "salvo"}, "falha", variables=variables)
+            await queue.resume(checkpoint["_id"])
+            await wait_for_status(store, checkpoint["_id"], JOB_COMPLETED, JOB_FAILED)
+        finally:
+            await queue.stop()
+        return model_client, variables
+
+    model_client, variables = asyncio.run(scenario())
+    assert model_client.variables == [variables, variables]
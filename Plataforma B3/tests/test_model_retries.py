@@ -0,0 +1,120 @@
+import asyncio
+
+import aiohttp
+import pytest
+
+import model_integration
+from config import settings
+from model_integration import ModelIntegration, RetryBudget
+
+MESSAGES = [{"role": "user", "content": "oi"}]
+
+@pytest.fixture
+def client():
+    return ModelIntegration("teste")
+
+def send(client):
+    return asyncio.run(client.chat_completion(MESSAGES))
+
+def test_retry_delay_is_full_jitter_capped_by_max_delay(client, monkeypatch):
+    monkeypatch.setattr(settings, "MODEL_RETRY_BASE_DELAY", 0.5)
+    monkeypatch.setattr(settings, "MODEL_RETRY_MAX_DELAY", 8.0)
+
+    # Com o sorteio no extremo superior, a espera é o teto exponencial
+    monkeypatch.setattr(model_integration.random, "uniform", lambda low, high: high)
+    assert [client._retry_delay(attempt) for attempt in range(7)] == [0.5, 1.0, 2.0, 4.0, 8.0, 8.0, 8.0]
+    monkeypatch.setattr(model_integration.random, "uniform", lambda low, high: low)
+    assert client._retry_delay(3) == 0.0
+
+def test_retry_delay_stays_within_bounds(client, monkeypatch):
+    monkeypatch.setattr(settings, "MODEL_RETRY_BASE_DELAY", 0.5)
+    monkeypatch.setattr(settings, "MODEL_RETRY_MAX_DELAY", 8.0)
+    for attempt in range(10):
+        ceiling = min(8.0, 0.5 * 2 ** attempt)
+        delays = [client._retry_delay(attempt) for _ in range(200)]
+        assert all(0.0 <= delay <= ceiling for delay in delays)
+
+@pytest.mark.parametrize("failure", [
+    500,
+    503,
+    429,
+    aiohttp.ClientConnectionError("conexão recusada"),
+    asyncio.TimeoutError(),
+])
+def test_transient_errors_are_retried(client, fake_session, failure):
+    url = client.router.endpoints[0].url
+    session = fake_session(client, {url: [failure, 200]})
+    response = send(client)
+    assert response["choices"][0]["message"]["content"] == "ok"
+    assert len(session.posts) == 2
+
+@pytest.mark.parametrize("status, message", [
+    (400, "Erro na chamada ao modelo"),
+    (401, "Erro de autenticação"),
+    (404, "Endpoint não encontrado"),
+])
+def test_client_errors_are_not_retried(client, fake_session, status, message):
+    url = client.router.endpoints[0].url
+    session = fake_session(client, {url: [status, 200]})
+    with pytest.raises(ValueError, match=message):
+        send(client)
+    assert len(session.posts) == 1
+
+def test_invalid_json_is_not_retried(client, fake_session):
+    url = client.router.endpoints[0].url
+    session = fake_session(client, {url: [b"nao json", 200]})
+    with pytest.raises(ValueError, match="Erro ao processar resposta do modelo"):
+        send(client)
+    assert len(session.posts) == 1
+
+def test_transient_errors_stop_after_model_max_retries(client, fake_session, monkeypatch):
+    monkeypatch.setattr(settings, "MODEL_MAX_RETRIES", 3)
+    url = client.router.endpoints[0].url
+    session = fake_session(client, {url: [500]})
+    with pytest.raises(ValueError, match="Erro na chamada ao modelo"):
+        send(client)
+    assert len(session.posts) == 4
+
+def test_429_resends_share_the_call_budget(client, fake_session, monkeypatch):
+    monkeypatch.setattr(settings, "MODEL_MAX_RETRIES", 3)
+    monkeypatch.setattr(settings, "RATE_LIMIT_MAX_RETRIES", 5)
+    url = client.router.endpoints[0].url
+    session = fake_session(client, {url: [429]})
+    with pytest.raises(ValueError, match="Limite de requisições"):
+        send(client)
+    # Um envio e cinco reenvios, e não 5 reenvios dentro de cada uma das 4 tentativas
+    assert len(session.posts) == 6
+    assert client.router.endpoints[0].rate_limiter.rate_limited_responses == 6
+
+def test_mixed_failures_use_a_single_budget(client, fake_session, monkeypatch):
+    monkeypatch.setattr(settings, "MODEL_MAX_RETRIES", 3)
+    monkeypatch.setattr(settings, "RATE_LIMIT_MAX_RETRIES", 5)
+    url = client.router.endpoints[0].url
+    session = fake_session(client, {url: [500, 500, 429]})
+    with pytest.raises(ValueError, match="Limite de requisições"):
+        send(client)
+    # Os dois reenvios após 5xx já contam no limite de reenvios dos 429
+    assert len(session.posts) == 6
+
+def test_stream_retries_share_the_call_budget(client, fake_session, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_MAX_RETRIES", 2)
+    url = client.router.endpoints[0].url
+    session = fake_session(client, {url: [429]})
+
+    async def consume():
+        return [chunk async for chunk in client.chat_completion_stream(MESSAGES)]
+
+    with pytest.raises(ValueError, match="Limite de requisições"):
+        asyncio.run(consume())
+    assert len(session.posts) == 3
+
+def test_retry_budget_limits_by_failure_kind(monkeypatch):
+    monkeypatch.setattr(settings, "MODEL_MAX_RETRIES", 2)
+    monkeypatch.setattr(settings, "RATE_LIMIT_MAX_RETRIES", 3)
+    budget = RetryBudget()
+    assert budget.spend()
+    assert budget.spend(rate_limited=True)
+    assert not budget.spend()
+    assert budget.spend(rate_limited=True)
+    assert not budget.spend(rate_limited=True)
+    assert budget.used == 3
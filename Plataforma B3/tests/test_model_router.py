@@ -0,0 +1,207 @@
+import asyncio
+import json
+import random
+from contextlib import ExitStack
+
+import pytest
+
+import model_router
+import rate_limiter
+from config import settings
+from flow_manager import Flow, FlowStep
+from model_integration import ModelIntegration
+from model_router import CircuitBreaker, ModelEndpoint, ModelRouter, create_model_router
+from rate_limiter import RateLimiter
+
+# Relógio controlado pelos testes, no lugar de time.monotonic
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def monotonic(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(model_router, "time", fake)
+    monkeypatch.setattr(rate_limiter, "time", fake)
+    return fake
+
+def endpoint(name: str, model: str = "gpt4o", weight: float = 1.0, **options) -> ModelEndpoint:
+    return ModelEndpoint(
+        name=name,
+        url=f"http://{name}.teste/chat/completions",
+        api_key="teste",
+        deployment=name,
+        model=model,
+        weight=weight,
+        **options
+    )
+
+def make_router(*endpoints: ModelEndpoint, strategy: str = "least_outstanding") -> ModelRouter:
+    router = ModelRouter(list(endpoints), strategy=strategy)
+    router._random = random.Random(0)
+    return router
+
+def test_circuit_breaker_opens_after_threshold_and_recovers(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=10)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allows_request()
+
+    clock.now += 9.9
+    assert breaker.state == "open"
+    clock.now += 0.1
+    assert breaker.state == "half_open"
+    assert breaker.allows_request()
+
+    # Meio aberto: apenas uma requisição de teste por vez
+    breaker.on_request()
+    assert not breaker.allows_request()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+    assert breaker.allows_request()
+
+def test_circuit_breaker_reopens_when_probe_fails(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=10)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 10
+    breaker.on_request()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    # Um teste encerrado sem resultado libera o próximo
+    clock.now += 10
+    breaker.on_request()
+    breaker.release_probe()
+    assert breaker.allows_request()
+
+def test_circuit_breaker_rejects_invalid_threshold():
+    with pytest.raises(ValueError):
+        CircuitBreaker(failure_threshold=0)
+
+def test_least_outstanding_selection_follows_weights(clock):
+    light, heavy = endpoint("leve", weight=1), endpoint("pesado", weight=3)
+    router = make_router(light, heavy)
+    with ExitStack() as stack:
+        for _ in range(8):
+            stack.enter_context(router.select().track())
+        assert (light.outstanding, heavy.outstanding) == (2, 6)
+    assert (light.outstanding, heavy.outstanding) == (0, 0)
+    assert light.requests + heavy.requests == 8
+
+def test_selection_skips_excluded_and_open_endpoints(clock):
+    a, b, c = endpoint("a"), endpoint("b"), endpoint("c", circuit_breaker=CircuitBreaker(failure_threshold=1))
+    router = make_router(a, b, c)
+    c.record_failure()
+    assert router.available() == [a, b]
+    assert {router.select(exclude={"a"}).name for _ in range(20)} == {"b"}
+
+    # Sem endpoints elegíveis, a requisição usa os demais assim mesmo
+    assert router.select(exclude={"a", "b"}) is c
+    assert router.select(exclude={"a", "b", "c"}) in (a, b, c)
+
+def test_headroom_strategy_prefers_endpoint_with_budget(clock):
+    busy = endpoint("ocupado", rate_limiter=RateLimiter(requests_per_minute=60))
+    idle = endpoint("livre", rate_limiter=RateLimiter(requests_per_minute=60))
+    router = make_router(busy, idle, strategy="headroom")
+    busy.rate_limiter.requests.consume(45)
+    assert router.select() is idle
+
+    idle.rate_limiter.pause(5)
+    assert router.select() is busy
+    clock.now += 5
+    # 15 restantes mais 5 repostos em 5s
+    assert busy.headroom() == pytest.approx(20 / 60)
+    assert router.select() is idle
+
+def test_router_rejects_invalid_configuration():
+    with pytest.raises(ValueError):
+        ModelRouter([])
+    with pytest.raises(ValueError):
+        ModelRouter([endpoint("a")], strategy="aleatoria")
+    with pytest.raises(ValueError):
+        ModelRouter([endpoint("a"), endpoint("a")])
+    with pytest.raises(ValueError, match="Nenhum endpoint configurado para o modelo outro"):
+        make_router(endpoint("a")).select("outro")
+
+def test_create_model_router_from_settings(monkeypatch):
+    monkeypatch.setattr(settings, "MODEL_ENDPOINTS", json.dumps([
+        {"name": "principal", "deployment": "gpt4o", "model": "gpt4o", "weight": 2, "rpm": 60},
+        {"deployment": "mini", "model": "barato", "base_url": "http://outro.teste"}
+    ]))
+    monkeypatch.setattr(settings, "MODEL_DEFAULT", "gpt4o")
+    router = create_model_router("chave")
+    assert [item.name for item in router.endpoints] == ["principal", "mini_1"]
+    assert router.models == ["barato", "gpt4o"]
+    assert router.default_model == "gpt4o"
+    assert router.endpoints[0].weight == 2
+    assert router.endpoints[0].rate_limiter.requests.capacity == 60
+    assert router.endpoints[1].url.startswith("http://outro.teste/openai/deployments/mini/")
+
+    monkeypatch.setattr(settings, "MODEL_ENDPOINTS", "{}")
+    with pytest.raises(ValueError):
+        create_model_router("chave")
+
+@pytest.mark.parametrize("failure", [429, 500, 503])
+def test_failover_to_other_endpoint(clock, fake_session, failure):
+    # O peso maior faz com que o endpoint primario seja escolhido primeiro
+    primary, secondary = endpoint("primario", weight=2), endpoint("secundario")
+    client = ModelIntegration("teste", router=make_router(primary, secondary))
+    session = fake_session(client, {primary.url: [failure], secondary.url: [200]})
+
+    response = asyncio.run(client.chat_completion([{"role": "user", "content": "oi"}]))
+    assert response["choices"][0]["message"]["content"] == "ok"
+    assert session.posts == [primary.url, secondary.url]
+    # 429 indica falta de orçamento, não problema no endpoint
+    assert primary.failures == (0 if failure == 429 else 1)
+    assert secondary.circuit_breaker.state == "closed"
+
+def test_open_circuit_routes_traffic_away(clock, fake_session):
+    primary = endpoint("primario", weight=2, circuit_breaker=CircuitBreaker(failure_threshold=2, reset_seconds=30))
+    secondary = endpoint("secundario")
+    client = ModelIntegration("teste", router=make_router(primary, secondary))
+    session = fake_session(client, {primary.url: [500, 500, 200], secondary.url: [200]})
+
+    async def send():
+        return await client.chat_completion([{"role": "user", "content": "oi"}])
+
+    asyncio.run(send())
+    asyncio.run(send())
+    assert primary.circuit_breaker.state == "open"
+    assert session.posts == [primary.url, secondary.url, primary.url, secondary.url]
+
+    session.posts.clear()
+    asyncio.run(send())
+    assert session.posts == [secondary.url]
+
+    # Após reset_seconds, uma requisição de teste bem-sucedida fecha o disjuntor
+    clock.now += 30
+    asyncio.run(send())
+    assert session.posts == [secondary.url, primary.url]
+    assert primary.circuit_breaker.state == "closed"
+
+def test_step_model_pins_endpoint(clock, fake_session):
+    default, cheap = endpoint("padrao", model="gpt4o"), endpoint("mini", model="barato")
+    client = ModelIntegration("teste", router=make_router(default, cheap))
+    session = fake_session(client, {default.url: [200], cheap.url: [200]})
+    flow = Flow(
+        name="Fluxo com modelos",
+        description="Fluxo usado nos testes do roteamento",
+        steps=[
+            FlowStep(step_name="rascunho", system_prompt="Rascunhe", step_order=1, model="barato"),
+            FlowStep(step_name="revisao", system_prompt="Revise", step_order=2)
+        ]
+    )
+
+    asyncio.run(client.process_flow("oi", flow))
+    assert session.posts == [cheap.url, default.url]
+
+    flow.steps[1].model = "inexistente"
+    with pytest.raises(ValueError, match="Nenhum endpoint configurado para os modelos: inexistente"):
+        asyncio.run(client.process_flow("oi", flow))
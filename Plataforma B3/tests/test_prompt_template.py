@@ -0,0 +1,66 @@
+import pytest
+
+from flow_manager import FlowStep
+from prompt_template import MissingVariablesError, PromptTemplate, check_variables, compile_prompts
+
+def test_render_fills_variables_step_outputs_and_user_message():
+    template = PromptTemplate("Fale como {{ papel }} sobre {{steps.pesquisa inicial}}. Pergunta: {{user_message}}. De novo: {{papel}}")
+    assert template.variables == ("papel",)
+    assert template.step_references == ("pesquisa inicial",)
+    assert not template.is_static
+
+    outputs = {"pesquisa inicial": "juros", "user_message": "vale a pena?"}
+    rendered = template.render({"papel": "economista"}, outputs)
+    assert rendered == "Fale como economista sobre juros. Pergunta: vale a pena?. De novo: economista"
+    assert template.literal_text == "Fale como  sobre . Pergunta: . De novo: "
+    assert template.known_values({"papel": "economista"}, {}) == ["economista", "economista"]
+
+def test_static_prompt_is_sent_as_is():
+    for text in ["Resuma o texto", "Use {{ 1 + 1 }} e {{ }} sem campos", "JSON: {\"a\": {\"b\": 1}}", ""]:
+        template = PromptTemplate(text)
+        assert template.is_static
+        assert template.render(None, {}) == text
+        assert template.literal_text == text
+
+def test_field_at_start_and_end():
+    template = PromptTemplate("{{inicio}} meio {{fim}}")
+    assert template.render({"inicio": "A", "fim": "Z"}, {}) == "A meio Z"
+    assert PromptTemplate("{{so}}").render({"so": "valor"}, {}) == "valor"
+
+def test_values_are_not_reinterpreted():
+    template = PromptTemplate("Texto: {{entrada}}")
+    assert template.render({"entrada": "{{outra}}"}, {}) == "Texto: {{outra}}"
+
+def test_escape_produces_literal_braces():
+    template = PromptTemplate("Responda no formato {{{{resposta}} para {{papel}}")
+    assert template.variables == ("papel",)
+    assert template.render({"papel": "analista"}, {}) == "Responda no formato {{resposta}} para analista"
+
+    static = PromptTemplate("Modelo: {{{{steps.x}} e {{{{nome}}")
+    assert static.is_static
+    assert static.step_references == ()
+    assert static.render(None, {}) == "Modelo: {{steps.x}} e {{nome}}"
+    assert static.literal_text == "Modelo: {{steps.x}} e {{nome}}"
+
+def test_render_reports_missing_values():
+    template = PromptTemplate("{{papel}} {{steps.a}}")
+    with pytest.raises(MissingVariablesError) as info:
+        template.render({}, {"a": "x"})
+    assert info.value.missing == ["papel"]
+    with pytest.raises(ValueError, match="Saída do passo 'a' ainda não disponível"):
+        template.render({"papel": "p"}, {})
+
+def test_check_variables_reports_all_missing_variables():
+    templates = compile_prompts([
+        FlowStep(step_name="a", system_prompt="{{papel}} e {{tom}}", step_order=1),
+        FlowStep(step_name="b", system_prompt="{{idioma}} {{steps.a}} {{user_message}}", step_order=2),
+    ]).values()
+
+    with pytest.raises(MissingVariablesError) as info:
+        check_variables(templates, {"tom": "formal"})
+    assert info.value.missing == ["idioma", "papel"]
+    assert str(info.value) == "Variáveis do prompt não informadas: idioma, papel"
+
+    with pytest.raises(MissingVariablesError):
+        check_variables(templates, None)
+    check_variables(templates, {"papel": "p", "tom": "t", "idioma": "pt", "extra": "ignorada"})
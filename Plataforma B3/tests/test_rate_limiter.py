@@ -0,0 +1,156 @@
+import asyncio
+
+import pytest
+
+import rate_limiter
+from rate_limiter import RateLimiter, TokenBucket, estimate_request_tokens
+
+# Relógio controlado pelos testes; asyncio.sleep apenas avança o tempo
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(seconds, result=None):
+        fake.sleeps.append(seconds)
+        fake.now += seconds
+        return await real_sleep(0, result)
+
+    monkeypatch.setattr(rate_limiter, "time", fake)
+    monkeypatch.setattr(asyncio, "sleep", fake_sleep)
+    return fake
+
+def test_token_bucket_refills_continuously_up_to_capacity(clock):
+    bucket = TokenBucket(capacity=10, refill_per_second=2)
+    bucket.consume(10)
+    assert bucket.time_until(4) == pytest.approx(2.0)
+
+    clock.now += 1
+    assert bucket.available == 0
+    assert bucket.fraction_available() == pytest.approx(0.2)
+
+    clock.now += 100
+    assert bucket.time_until(4) == 0.0
+    assert bucket.available == 10
+
+def test_token_bucket_allows_negative_balance_and_caps_large_requests(clock):
+    bucket = TokenBucket(capacity=10, refill_per_second=1)
+    bucket.consume(15)
+    assert bucket.available == -5
+    assert bucket.fraction_available() == 0.0
+    # Pedidos maiores que a capacidade aguardam apenas o balde encher
+    assert bucket.time_until(50) == pytest.approx(15.0)
+
+    bucket.consume(-100)
+    assert bucket.available == 10
+
+def test_token_bucket_rejects_non_positive_limits():
+    with pytest.raises(ValueError):
+        TokenBucket(capacity=0, refill_per_second=1)
+    with pytest.raises(ValueError):
+        TokenBucket(capacity=1, refill_per_second=0)
+
+def test_acquire_waits_for_refill(clock):
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=600)
+
+    async def scenario():
+        await limiter.acquire(estimated_tokens=600)
+        await limiter.acquire(estimated_tokens=300)
+
+    asyncio.run(scenario())
+    # 300 tokens a 10 tokens/s
+    assert clock.sleeps == [pytest.approx(30.0)]
+    assert limiter.throttled == 1
+    assert limiter.wait_seconds == pytest.approx(30.0)
+
+def test_acquire_serves_waiting_callers_in_fifo_order(clock):
+    limiter = RateLimiter(requests_per_minute=60)
+    limiter.requests.consume(60)
+    served = []
+
+    async def caller(index: int):
+        await limiter.acquire()
+        served.append((index, clock.now))
+
+    async def scenario():
+        await asyncio.gather(*(caller(index) for index in range(4)))
+
+    start = clock.now
+    asyncio.run(scenario())
+    assert [index for index, _ in served] == [0, 1, 2, 3]
+    assert [now - start for _, now in served] == [pytest.approx(i + 1.0) for i in range(4)]
+    assert limiter.throttled == 4
+
+def test_disabled_limiter_never_waits(clock):
+    limiter = RateLimiter()
+
+    async def scenario():
+        for _ in range(100):
+            await limiter.acquire(estimated_tokens=10**6)
+
+    asyncio.run(scenario())
+    assert clock.sleeps == []
+    assert limiter.stats()["available_requests"] is None
+
+def test_record_usage_adjusts_token_balance(clock):
+    limiter = RateLimiter(tokens_per_minute=1000)
+    asyncio.run(limiter.acquire(estimated_tokens=100))
+    limiter.record_usage(estimated_tokens=100, actual_tokens=400)
+    assert limiter.tokens.available == 600
+    limiter.record_usage(estimated_tokens=100, actual_tokens=None)
+    assert limiter.tokens.available == 600
+
+def test_remaining_headers_limit_local_balance(clock):
+    limiter = RateLimiter(requests_per_minute=100, tokens_per_minute=1000)
+    limiter.update_from_headers({
+        "x-ratelimit-remaining-requests": "3",
+        "x-ratelimit-remaining-tokens": "250",
+    })
+    assert limiter.requests.available == 3
+    assert limiter.tokens.available == 250
+
+    # Cabeçalhos maiores que o saldo local ou inválidos não o aumentam
+    limiter.update_from_headers({"x-ratelimit-remaining-requests": "90", "x-ratelimit-remaining-tokens": "abc"})
+    assert limiter.requests.available == 3
+    assert limiter.tokens.available == 250
+    assert not limiter.paused()
+
+def test_retry_after_headers_pause_requests(clock):
+    limiter = RateLimiter(requests_per_minute=100)
+    limiter.update_from_headers({"retry-after": "5"}, status=429)
+    assert limiter.rate_limited_responses == 1
+    assert limiter.paused()
+
+    # retry-after-ms tem precedência sobre retry-after
+    limiter.update_from_headers({"retry-after-ms": "8000", "retry-after": "1"}, status=429)
+    clock.now += 7.5
+    assert limiter.paused()
+    clock.now += 1
+    assert not limiter.paused()
+
+    async def scenario():
+        await limiter.acquire()
+
+    limiter.update_from_headers({"retry-after": "2"}, status=200)
+    asyncio.run(scenario())
+    assert clock.sleeps == [pytest.approx(2.0)]
+
+def test_429_without_retry_after_pauses_for_one_second(clock):
+    limiter = RateLimiter(requests_per_minute=100)
+    limiter.update_from_headers({}, status=429)
+    assert limiter.paused()
+    clock.now += 1.01
+    assert not limiter.paused()
+
+def test_estimate_request_tokens_counts_prompt_and_max_tokens():
+    payload = {"messages": [{"role": "user", "content": "a" * 40}, {"role": "system", "content": None}], "max_tokens": 50}
+    assert estimate_request_tokens(payload) == 60
+    assert estimate_request_tokens({}) == 0
@@ -0,0 +1,165 @@
+import asyncio
+
+import pytest
+from prometheus_client import REGISTRY
+
+from metrics import set_step_labels
+from model_integration import ModelIntegration
+from request_coalescer import RequestCoalescer
+
+# Chamada ao upstream controlada pelo teste: só termina quando release é sinalizado
+class FakeUpstream:
+    def __init__(self, error: Exception = None):
+        self.error = error
+        self.calls = 0
+        self.cancelled = False
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error is not None:
+            raise self.error
+        return {"resposta": self.calls}
+
+def test_concurrent_callers_share_one_upstream_call():
+    async def scenario():
+        coalescer = RequestCoalescer()
+        upstream = FakeUpstream()
+        callers = [asyncio.create_task(coalescer.run("chave", upstream)) for _ in range(5)]
+        await asyncio.sleep(0)
+        in_flight = len(coalescer)
+        upstream.release.set()
+        results = await asyncio.gather(*callers)
+        return upstream.calls, in_flight, results
+
+    calls, in_flight, results = asyncio.run(scenario())
+    assert calls == 1
+    assert in_flight == 1
+    assert [result for result, _ in results] == [{"resposta": 1}] * 5
+    # Apenas o primeiro chamador dispara a execução
+    assert [shared for _, shared in results] == [False, True, True, True, True]
+
+def test_different_keys_are_not_shared():
+    async def scenario():
+        coalescer = RequestCoalescer()
+        first, second = FakeUpstream(), FakeUpstream()
+        callers = [asyncio.create_task(coalescer.run("a", first)), asyncio.create_task(coalescer.run("b", second))]
+        await asyncio.sleep(0)
+        in_flight = len(coalescer)
+        first.release.set()
+        second.release.set()
+        await asyncio.gather(*callers)
+        return first.calls, second.calls, in_flight
+
+    assert asyncio.run(scenario()) == (1, 1, 2)
+
+def test_cancelling_one_caller_does_not_cancel_the_others():
+    async def scenario():
+        coalescer = RequestCoalescer()
+        upstream = FakeUpstream()
+        first = asyncio.create_task(coalescer.run("chave", upstream))
+        second = asyncio.create_task(coalescer.run("chave", upstream))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        cancelled_after_first = upstream.cancelled
+        upstream.release.set()
+        result = await second
+        return cancelled_after_first, result, upstream.calls
+
+    cancelled_after_first, (result, shared), calls = asyncio.run(scenario())
+    assert not cancelled_after_first
+    assert result == {"resposta": 1}
+    assert shared
+    assert calls == 1
+
+def test_last_caller_cancelling_cancels_upstream():
+    async def scenario():
+        coalescer = RequestCoalescer()
+        upstream = FakeUpstream()
+        callers = [asyncio.create_task(coalescer.run("chave", upstream)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+        in_flight = len(coalescer)
+
+        # Uma nova chamada não recebe a execução cancelada
+        retry = FakeUpstream()
+        retry.release.set()
+        return upstream.cancelled, in_flight, await coalescer.run("chave", retry)
+
+    cancelled, in_flight, (result, shared) = asyncio.run(scenario())
+    assert cancelled
+    assert in_flight == 0
+    assert result == {"resposta": 1}
+    assert not shared
+
+def test_shared_exception_reaches_every_waiter():
+    async def scenario():
+        coalescer = RequestCoalescer()
+        upstream = FakeUpstream(error=ValueError("Falha do modelo"))
+        callers = [asyncio.create_task(coalescer.run("chave", upstream)) for _ in range(3)]
+        await asyncio.sleep(0)
+        upstream.release.set()
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        return upstream.calls, results, len(coalescer)
+
+    calls, results, in_flight = asyncio.run(scenario())
+    assert calls == 1
+    assert all(isinstance(result, ValueError) and str(result) == "Falha do modelo" for result in results)
+    assert in_flight == 0
+
+def test_key_is_removed_after_completion():
+    async def scenario():
+        coalescer = RequestCoalescer()
+        first = FakeUpstream()
+        first.release.set()
+        await coalescer.run("chave", first)
+        in_flight = len(coalescer)
+
+        # Chamadas posteriores executam novamente, sem reaproveitar o resultado
+        second = FakeUpstream()
+        second.release.set()
+        result, shared = await coalescer.run("chave", second)
+        return in_flight, len(coalescer), second.calls, shared
+
+    assert asyncio.run(scenario()) == (0, 0, 1, False)
+
+def coalesced_count(result: str) -> float:
+    labels = {"flow_id": "fluxo", "step_name": "passo", "result": result}
+    return REGISTRY.get_sample_value("model_requests_coalesced_total", labels) or 0.0
+
+def test_chat_completion_coalesces_and_counts_metric(monkeypatch):
+    client = ModelIntegration("teste")
+    posts = []
+
+    async def fake_post(payload, model=None):
+        posts.append(payload)
+        await asyncio.sleep(0.01)
+        return {"choices": [{"message": {"content": "ok"}}]}
+
+    monkeypatch.setattr(client, "_post_completion", fake_post)
+
+    async def call(content="oi"):
+        set_step_labels("fluxo", "passo")
+        return await client.chat_completion([{"role": "user", "content": content}], temperature=0, coalesce=True)
+
+    async def scenario():
+        return await asyncio.gather(call(), call(), call(), call("outra"))
+
+    upstream_before, shared_before = coalesced_count("upstream"), coalesced_count("shared")
+    responses = asyncio.run(scenario())
+    assert len(posts) == 2
+    assert [response.get("coalesced", False) for response in responses] == [False, True, True, False]
+    assert coalesced_count("upstream") - upstream_before == 2
+    assert coalesced_count("shared") - shared_before == 2
+    assert len(client.coalescer) == 0
@@ -0,0 +1,24 @@
+import token_counter
+from token_counter import TokenCounter
+
+# tiktoken sem a codificação pedida (versão antiga ou vocabulário sem acesso à rede)
+class BrokenTiktoken:
+    @staticmethod
+    def get_encoding(name: str):
+        raise ValueError(f"Unknown encoding {name}")
+
+def test_unavailable_encoding_falls_back_to_estimate(monkeypatch):
+    monkeypatch.setattr(token_counter, "tiktoken", BrokenTiktoken)
+    counter = TokenCounter("o200k_base")
+
+    assert not counter.exact
+    assert counter.count("a" * 40) == 10
+    assert counter.truncate("a" * 40, 5) == "a" * 20
+
+def test_estimate_without_tiktoken(monkeypatch):
+    monkeypatch.setattr(token_counter, "tiktoken", None)
+    counter = TokenCounter()
+
+    assert counter.count("") == 0
+    messages = [{"role": "system", "content": "a" * 8}, {"role": "user", "content": "a" * 4}]
+    assert counter.count_messages(messages) == token_counter.TOKENS_PER_REPLY + 2 * token_counter.TOKENS_PER_MESSAGE + 3
@@ -0,0 +1,60 @@
+import token_counter
+from flow_manager import Flow, FlowStep
+from model_integration import ModelIntegration
+from token_counter import TOKENS_PER_MESSAGE, TOKENS_PER_REPLY, TokenCounter
+
+# Contador que registra os textos contados (estimativa de 4 caracteres por token)
+class RecordingCounter(TokenCounter):
+    def __init__(self):
+        super().__init__()
+        self.counted = []
+
+    def count(self, text: str) -> int:
+        self.counted.append(text)
+        return super().count(text)
+
+def make_client(monkeypatch) -> ModelIntegration:
+    monkeypatch.setattr(token_counter, "tiktoken", None)
+    return ModelIntegration("teste", token_counter=RecordingCounter())
+
+FLOW = Flow(
+    name="Fluxo de teste",
+    description="Fluxo usado nos testes da projeção de tokens",
+    steps=[
+        FlowStep(step_name="resumo", system_prompt="a" * 400, step_order=1, max_tokens=100),
+        FlowStep(step_name="resposta", system_prompt="Responda em {{idioma}}: " + "b" * 400, step_order=2, max_tokens=50)
+    ]
+)
+
+def test_static_prompts_are_counted_once(monkeypatch):
+    client = make_client(monkeypatch)
+    flow = FLOW.model_copy()
+
+    first = client.project_token_usage(flow, "c" * 40, {"idioma": "português"})
+    client.token_counter.counted.clear()
+    second = client.project_token_usage(flow, "c" * 40, {"idioma": "português"})
+
+    assert second == first
+    # Na segunda projeção, apenas a mensagem do usuário e o valor da variável são contados
+    assert sorted(client.token_counter.counted) == sorted(["c" * 40, "português"])
+
+def test_projection_counts_prompt_fields_and_inputs(monkeypatch):
+    client = make_client(monkeypatch)
+    projection = client.project_token_usage(FLOW.model_copy(), "c" * 40, {"idioma": "pt" * 4})
+
+    overhead = TOKENS_PER_REPLY + 2 * TOKENS_PER_MESSAGE
+    summary, answer = projection["steps"]["resumo"], projection["steps"]["resposta"]
+    assert summary["prompt_tokens_min"] == overhead + 100 + 10
+    assert summary["prompt_tokens_max"] == summary["prompt_tokens_min"]
+    # O segundo passo recebe a saída do primeiro, contada pelo seu max_tokens
+    literal_tokens = len("Responda em : " + "b" * 400) // 4
+    assert answer["prompt_tokens_min"] == overhead + literal_tokens + 2
+    assert answer["prompt_tokens_max"] == answer["prompt_tokens_min"] + 100
+
+def test_other_counter_rebuilds_plan(monkeypatch):
+    flow = FLOW.model_copy()
+    make_client(monkeypatch).project_token_usage(flow, "c" * 40, {"idioma": "pt"})
+
+    client = make_client(monkeypatch)
+    client.project_token_usage(flow, "c" * 40, {"idioma": "pt"})
+    assert "a" * 400 in client.token_counter.counted
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from tracing import MemorySpanExporter, Tracer, current_span, parse_traceparent
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+# Tracer com exportador em memória
+def make_tracer():
+    exporter = MemorySpanExporter()
+    return Tracer(exporter), exporter
+
+def test_child_span_links_to_parent():
+    tracer, exporter = make_tracer()
+    with tracer.start_span("raiz") as root:
+        with tracer.start_span("filho") as child:
+            assert current_span() is child
+        assert current_span() is root
+    assert current_span() is None
+
+    # Os spans são exportados ao serem encerrados: primeiro o filho
+    assert [span.name for span in exporter.spans] == ["filho", "raiz"]
+    assert root.parent_id is None
+    assert child.parent_id == root.span_id
+    assert child.trace_id == root.trace_id
+    assert child.span_id != root.span_id
+    assert all(span.duration is not None for span in exporter.spans)
+
+def test_root_spans_start_new_traces():
+    tracer, exporter = make_tracer()
+    with tracer.start_span("primeiro"):
+        pass
+    with tracer.start_span("segundo"):
+        pass
+
+    first, second = exporter.spans
+    assert first.trace_id != second.trace_id
+    assert first.parent_id is None and second.parent_id is None
+
+def test_root_span_continues_incoming_traceparent():
+    tracer, exporter = make_tracer()
+    with tracer.start_span("raiz", traceparent=f"00-{TRACE_ID}-{PARENT_ID}-01") as span:
+        assert span.traceparent() == f"00-{TRACE_ID}-{span.span_id}-01"
+
+    assert span.trace_id == TRACE_ID
+    assert span.parent_id == PARENT_ID
+
+def test_invalid_traceparent_is_ignored():
+    assert parse_traceparent("00-invalido-01") is None
+    assert parse_traceparent(None) is None
+
+    tracer, exporter = make_tracer()
+    with tracer.start_span("raiz", traceparent="00-invalido-01") as span:
+        pass
+    assert span.parent_id is None
+    assert len(span.trace_id) == 32
+
+def test_error_is_recorded_on_span():
+    tracer, exporter = make_tracer()
+    with pytest.raises(RuntimeError):
+        with tracer.start_span("falha"):
+            raise RuntimeError("erro do passo")
+
+    span = exporter.spans[0]
+    assert span.status == "error"
+    assert span.error == "erro do passo"
+
+def test_concurrent_tasks_keep_their_own_parent():
+    tracer, exporter = make_tracer()
+
+    async def step(name: str):
+        with tracer.start_span(name):
+            await asyncio.sleep(0)
+
+    async def scenario():
+        with tracer.start_span("raiz") as root:
+            await asyncio.gather(step("a"), step("b"))
+        return root
+
+    root = asyncio.run(scenario())
+    children = [span for span in exporter.spans if span.name in ("a", "b")]
+    assert len(children) == 2
+    assert all(span.parent_id == root.span_id for span in children)